@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import copy
+import threading
+import logging
+from logger import CustomFormatter
+
+# create logger with 'lightning_app'
+logger = logging.getLogger("activation")
+logger.setLevel(logging.DEBUG)
+
+# create console handler with a higher log level
+handler = logging.StreamHandler()
+handler.setFormatter(CustomFormatter())
+logger.addHandler(handler)
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+ACTIVATION_URL = "https://stats.kmd.io/api/atomicdex/activation_commands/"
+
+
+class ActivationParams():
+    '''
+    Resolves UTXO activation commands per coin, in order of preference:
+    the in-memory index, the on-disk cache, the local `coins` file (so cold
+    starts need no outbound HTTP), and finally the stats.kmd.io API.
+    Stale cache entries are revalidated with conditional requests, and are
+    still served if the API is unreachable.
+    '''
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, cache_file=f"{PROJECT_ROOT}/activation_cache.json", coins_file=f"{PROJECT_ROOT}/coins",
+                 ttl=86400, url=ACTIVATION_URL, timeout=(3.05, 10)):
+        self.cache_file = cache_file
+        self.coins_file = coins_file
+        self.ttl = ttl
+        self.url = url
+        self.timeout = timeout
+        self.session = None
+        self.lock = threading.Lock()
+        self.index = self.load_cache()
+        self.coins = None
+
+    @classmethod
+    def shared(cls):
+        '''Returns the process-wide instance, so every node reuses one index.'''
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def load_cache(self) -> dict:
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, "r") as f:
+                return json.load(f)
+        except (IOError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable activation cache {self.cache_file}: {e}")
+            return {}
+
+    def save_cache(self):
+        temp_file = f"{self.cache_file}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(self.index, f, indent=4)
+        os.replace(temp_file, self.cache_file)
+
+    def load_coins(self) -> dict:
+        '''Indexes the local coins file by ticker, loading it at most once.'''
+        if self.coins is None:
+            self.coins = {}
+            if os.path.exists(self.coins_file):
+                with open(self.coins_file, "r") as f:
+                    self.coins = {i["coin"]: i for i in json.load(f) if "coin" in i}
+        return self.coins
+
+    def get(self, coin: str) -> dict:
+        '''Returns a copy of the activation command for coin, or None if it is unknown.'''
+        with self.lock:
+            entry = self.index.get(coin)
+        if entry is not None and time.time() - entry["fetched_at"] <= self.ttl:
+            return copy.deepcopy(entry["params"])
+        if entry is None:
+            with self.lock:
+                fresh = self.from_coins_file(coin)
+            fresh = fresh or self.fetch(coin)
+        else:
+            fresh = self.fetch(coin, entry)
+        if fresh is None:
+            return None if entry is None else copy.deepcopy(entry["params"])
+        with self.lock:
+            self.index.update({coin: fresh})
+            self.save_cache()
+        return copy.deepcopy(fresh["params"])
+
+    def from_coins_file(self, coin: str) -> dict:
+        '''Builds an electrum activation command from the coins file entry for coin.'''
+        coins = self.load_coins()
+        conf = coins.get(f"{coin}-segwit", coins.get(coin))
+        if conf is None or not conf.get("electrum"):
+            return None
+        params = {
+            "method": "electrum",
+            "coin": coin,
+            "servers": [
+                {i: server[i] for i in ["url", "protocol", "disable_cert_verification"] if i in server}
+                for server in conf["electrum"]
+            ]
+        }
+        for i in ["mm2", "required_confirmations", "requires_notarization", "address_format"]:
+            if i in conf:
+                params.update({i: conf[i]})
+        logger.info(f"Built activation params for {coin} from {self.coins_file}")
+        return {"params": params, "source": "coins", "fetched_at": time.time()}
+
+    def fetch(self, coin: str, entry: dict=None) -> dict:
+        '''Fetches (or revalidates entry) from the stats API, returning None on failure.'''
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"): headers.update({"If-None-Match": entry["etag"]})
+            if entry.get("last_modified"): headers.update({"If-Modified-Since": entry["last_modified"]})
+        import requests
+        with self.lock:
+            if self.session is None:
+                self.session = requests.Session()
+        try:
+            response = self.session.get(self.url, params={"coin": coin}, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and entry is not None:
+                return dict(entry, fetched_at=time.time())
+            response.raise_for_status()
+            params = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Could not fetch activation params for {coin}: {e}")
+            return None
+        if "servers" not in params:
+            return None
+        return {
+            "params": params,
+            "source": "api",
+            "fetched_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")
+        }
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+import json
+import time
+import asyncio
+import logging
+import aiohttp
+from collections import deque
+import dex_lightning as dex
+from dex_lightning import logger
+from logger import Redacted
+from transport import rpc_logger, rpc_method
+from metrics import RPCMetrics
+from init_tracker import INITIAL_INTERVAL, MAX_INTERVAL, BACKOFF
+
+
+class AsyncDexTransport():
+    '''
+    Pooled keep-alive aiohttp transport for the AtomicDEX API.
+    The session is created lazily inside the running event loop and is
+    shared by every AsyncLightningNode pointing at the same dex_url.
+    '''
+    _shared = {}
+
+    def __init__(self, dex_url="http://127.0.0.1:7783", pool_size=100, connect_timeout=3.05, read_timeout=60,
+                 metrics: RPCMetrics=None):
+        self.dex_url = dex_url
+        self.metrics = metrics or RPCMetrics.shared()
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.encoder = json.JSONEncoder(separators=(",", ":"))
+        self.session = None
+
+    @classmethod
+    def shared(cls, dex_url="http://127.0.0.1:7783", **kwargs):
+        '''Returns the transport shared by all users of dex_url, creating it if needed.'''
+        transport = cls._shared.get(dex_url)
+        if transport is None:
+            transport = cls(dex_url, **kwargs)
+            cls._shared.update({dex_url: transport})
+        return transport
+
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"Content-Type": "application/json"}
+            )
+        return self.session
+
+    async def post(self, params):
+        '''Sends a single request dict (or a list of them) and returns the decoded response.'''
+        body = self.encoder.encode(params)
+        started = time.perf_counter()
+        try:
+            async with self.get_session().post(self.dex_url, data=body) as response:
+                resp = await response.json(content_type=None)
+                response_bytes = len(await response.read())
+                status = response.status
+        except Exception as e:
+            self.metrics.observe(rpc_method(params), time.perf_counter() - started, len(body), 0, type(e).__name__)
+            raise
+        duration = time.perf_counter() - started
+        self.metrics.record(params, resp, duration, len(body), response_bytes)
+        if rpc_logger.isEnabledFor(logging.DEBUG):
+            rpc_logger.debug("rpc", extra={
+                "method": rpc_method(params),
+                "duration_ms": round(duration * 1000, 3),
+                "request_bytes": len(body),
+                "response_bytes": response_bytes,
+                "status": status
+            })
+        return resp
+
+    async def close(self):
+        if self._shared.get(self.dex_url) is self:
+            self._shared.pop(self.dex_url)
+        if self.session is not None:
+            await self.session.close()
+
+
+class AsyncLightningNode(dex.LightningNode):
+    '''
+    Asyncio variant of LightningNode. Every RPC method returns an awaitable,
+    and the node is activated with `await node.start()` rather than in the
+    constructor. Use `gather` to overlap independent calls, e.g.
+        await node.gather(*[node.get_payment_details(h) for h in hashes], limit=50)
+    '''
+    def __init__(self, coin, dex_url="http://127.0.0.1:7783", name="dragonhound-lightning", port=9735, color="000000", payment_retries=5,
+                 transport: AsyncDexTransport=None, pool_size: int=100, connect_timeout: float=3.05, read_timeout: float=60,
+                 concurrency: int=50, cache_ttls: dict=None):
+        if transport is None:
+            transport = AsyncDexTransport.shared(
+                dex_url,
+                pool_size=pool_size,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout
+            )
+        self.concurrency = concurrency
+        super().__init__(coin, dex_url=dex_url, name=name, port=port, color=color, payment_retries=payment_retries,
+                         transport=transport, activate=False, cache_ttls=cache_ttls)
+
+    async def start(self):
+        '''Activates the platform coin and initializes the lightning node.'''
+        await self.activate_coin(self.platform_coin.split('-')[0])
+        await self.get_pubkey()
+        await self.initialize_lightning()
+        return self
+
+    async def close(self):
+        await self.transport.close()
+
+    async def gather(self, *aws, limit: int=None) -> list:
+        '''Awaits all coroutines with at most `limit` in flight, returning results in order.'''
+        semaphore = asyncio.Semaphore(limit or self.concurrency)
+
+        async def bounded(aw):
+            async with semaphore:
+                return await aw
+
+        return await asyncio.gather(*[bounded(aw) for aw in aws])
+
+    async def dexAPI(self, params: dict, nolog: bool=False, refresh: bool=False, cache: bool=True) -> dict:
+        resp = None if refresh or not cache else self.cache.get(params)
+        if resp is not None:
+            self.transport.metrics.hit(params.get("method"))
+            if not nolog: logger.info("RESP (cached): %s", Redacted(resp))
+            return resp
+        params.update({"userpass": dex.get_userpass()})
+        if not nolog: logger.debug("PARAMS: %s", Redacted(params))
+        resp = await self.transport.post(params)
+        if cache:
+            self.cache.update(params, resp)
+        if not nolog:
+            if "error" in resp:
+                logger.warning("ERROR: %s", Redacted(resp))
+            else:
+                logger.info("RESP: %s", Redacted(resp))
+        return resp
+
+    def batch(self, params_list: list=None, nolog: bool=False, refresh: bool=False):
+        '''
+        Returns a coroutine sending params_list as a single batch request, or
+        an AsyncRPCBatch which sends everything queued in it on exit:
+            async with node.batch() as batch:
+                batch.add(params, callback)
+        '''
+        if params_list is not None:
+            return self.dexAPI_batch(params_list, nolog=nolog, refresh=refresh)
+        return AsyncRPCBatch(self, nolog=nolog, refresh=refresh)
+
+    async def dexAPI_batch(self, params_list: list, nolog: bool=False, refresh: bool=False) -> list:
+        results = [None if refresh else self.cache.get(params) for params in params_list]
+        pending = [params for params, resp in zip(params_list, results) if resp is None]
+        for params, resp in zip(params_list, results):
+            if resp is not None: self.transport.metrics.hit(params.get("method"))
+        if not pending:
+            return results
+        for params in pending:
+            params.update({"userpass": dex.get_userpass()})
+        if not nolog: logger.debug("BATCH PARAMS: %s", Redacted(pending))
+        resp = await self.transport.post(pending)
+        if not isinstance(resp, list) or len(resp) != len(pending):
+            logger.warning("Batch request rejected, falling back to single requests: %s", Redacted(resp))
+            resp = await self.gather(*[self.dexAPI(params, nolog=True, refresh=True) for params in pending])
+        resp = iter(resp)
+        for i, params in enumerate(params_list):
+            if results[i] is None:
+                results[i] = next(resp)
+                self.cache.update(params, results[i])
+                if not nolog:
+                    if "error" in results[i]:
+                        logger.warning("ERROR: %s", Redacted(results[i]))
+                    else:
+                        logger.info("RESP: %s", Redacted(results[i]))
+        return results
+
+    async def iter_payments(self, filter: dict=None, page_size: int=100, prefetch: int=2):
+        '''Async generator over every payment matching filter, prefetching up to `prefetch` pages. Raises RuntimeError on an error page.'''
+        pending = deque()
+        next_page = 1
+
+        def fetch(page):
+            return asyncio.ensure_future(self.list_payments_by_filter(filter, page=page, limit=page_size, nolog=True, cache=False))
+
+        try:
+            pending.append(fetch(next_page))
+            next_page += 1
+            while pending:
+                resp = await pending.popleft()
+                if "error" in resp:
+                    raise RuntimeError(f"list_payments_by_filter failed: {resp['error']}")
+                payments = resp["result"]["payments"]
+                total_pages = resp["result"].get("total_pages")
+                more = payments and (total_pages is None or next_page <= total_pages)
+                while more and len(pending) < prefetch:
+                    pending.append(fetch(next_page))
+                    next_page += 1
+                    more = total_pages is None or next_page <= total_pages
+                for payment in payments:
+                    yield payment
+                if not payments:
+                    return
+                if more and not pending:
+                    pending.append(fetch(next_page))
+                    next_page += 1
+        finally:
+            for i in pending:
+                i.cancel()
+
+    async def activate_coin(self, coin: str) -> dict:
+        activation_params = await asyncio.to_thread(self.get_activation_params, coin)
+        resp = await self.dexAPI(activation_params)
+        if "error" in resp and "already" not in str(resp["error"]):
+            await asyncio.to_thread(self.demote_servers)
+        return resp
+
+    async def get_pubkey(self):
+        params = {
+            "mmrpc": "2.0",
+            "method": "get_public_key",
+            "params": {},
+            "id": 762
+        }
+        resp = await self.dexAPI(params)
+        self.coin_pubkey = resp["result"]["public_key"]
+        return resp
+
+    async def get_coin_balance(self, refresh: bool=False):
+        params = {
+            "method": "my_balance",
+            "coin": self.platform_coin
+        }
+        resp = await self.dexAPI(params, nolog=True, refresh=refresh)
+        self.coin_address = resp["address"]
+        self.coin_balance = resp["balance"]
+        return resp
+
+    async def get_lightning_balance(self, refresh: bool=False):
+        params = {
+            "method": "my_balance",
+            "coin": self.coin
+        }
+        resp = await self.dexAPI(params, nolog=True, refresh=refresh)
+        self.lightning_address = resp["address"]
+        self.lightning_balance = resp["balance"]
+        return resp
+
+    async def get_balances(self, refresh: bool=False):
+        '''Fetches the platform coin and lightning balances in one round trip.'''
+        resp = await self.dexAPI_batch([
+            {"method": "my_balance", "coin": self.platform_coin},
+            {"method": "my_balance", "coin": self.coin}
+        ], nolog=True, refresh=refresh)
+        if "error" not in resp[0]: self.set_coin_balance(resp[0])
+        if "error" not in resp[1]: self.set_lightning_balance(resp[1])
+        return resp
+
+    async def initialize_lightning(self, deadline: float=60, on_progress=None):
+        '''Creates a lightning node for the coin, polling its init task with adaptive backoff.'''
+        params = {
+            "method": "task::enable_lightning::init",
+            "mmrpc": "2.0",
+            "params": {
+                "ticker": self.coin,
+                "activation_params": {
+                    "name": self.name,
+                    "listening_port": int(self.port),
+                    "color": self.color,
+                    "payment_retries": self.payment_retries
+                }
+            },
+            "id": 762
+        }
+        resp = await self.dexAPI(params)
+        if "error" in resp:
+            if resp["error"].find("already activated") == -1:
+                logger.warning(f"Error intializing {self.coin}: {resp['error']}")
+            return resp
+        if "task_id" not in resp.get("result", {}):
+            logger.warning(f"No task_id for {self.coin}!")
+            return resp
+        task_id = resp["result"]["task_id"]
+        interval = INITIAL_INTERVAL
+        deadline = time.monotonic() + deadline
+        last_status = None
+        while True:
+            await asyncio.sleep(min(interval, max(0, deadline - time.monotonic())))
+            resp = await self.init_lightning_status(task_id)
+            status = resp.get("result", {}).get("status") if "error" not in resp else "Error"
+            if status != last_status and on_progress is not None:
+                on_progress(self, resp)
+            last_status = status
+            if status in ["Ok", "Error"]:
+                await asyncio.to_thread(self.apply_init_status, resp)
+                return resp
+            if time.monotonic() >= deadline:
+                break
+            interval = min(interval * BACKOFF, MAX_INTERVAL)
+        resp = await self.init_lightning_cancel(task_id)
+        await asyncio.to_thread(self.demote_servers)
+        return resp
+
+
+class AsyncRPCBatch(dex.RPCBatch):
+    '''RPCBatch for an AsyncLightningNode, used with `async with`; send() is a coroutine.'''
+    async def send(self) -> list:
+        if self.calls:
+            self.results = await self.node.dexAPI_batch([params for params, _ in self.calls], nolog=self.nolog, refresh=self.refresh)
+            for (params, callback), resp in zip(self.calls, self.results):
+                if callback is not None and "error" not in resp:
+                    callback(resp)
+            self.calls = []
+        return self.results
+
+    def __enter__(self):
+        raise TypeError("Use 'async with node.batch()' on an AsyncLightningNode")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.send()
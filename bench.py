@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+from mm2_sim import MM2Simulator
+from rpc_cache import DEFAULT_TTLS
+
+BENCH_USERPASS = "bench-userpass"
+# dex_lightning resolves the userpass from the environment on first use, so set it before any RPC
+os.environ.update({"MM2_USERPASS": BENCH_USERPASS})
+
+import dex_lightning as dex
+from lib_tui import LightningTUI, colorize
+
+dex.logger.setLevel("CRITICAL")
+
+
+def percentile(samples: list, pct: float) -> float:
+    '''Returns the pct percentile of sorted samples (nearest rank).'''
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, int(round(pct / 100 * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+
+def run_case(name: str, fn, iterations: int, setup=None) -> dict:
+    '''Times `iterations` calls of fn, running setup (untimed) before each one.'''
+    samples = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        try:
+            resp = fn()
+            if isinstance(resp, dict) and "error" in resp:
+                errors += 1
+        except Exception:
+            errors += 1
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return {
+        "case": name,
+        "iterations": iterations,
+        "errors": errors,
+        "throughput": iterations / sum(samples) if sum(samples) else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "total_s": elapsed
+    }
+
+
+def run_startup_case(budget_ms: float, iterations: int=3) -> dict:
+    '''
+    Starts lightning_tui.py --no-splash --budget-ms in a fresh interpreter
+    `iterations` times. A run that exits non-zero (over budget, or failing
+    to start) counts as an error; samples are the startup times it reports.
+    '''
+    command = [sys.executable, "lightning_tui.py", "--no-splash", "--budget-ms", str(budget_ms)]
+    samples = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        proc = subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)), stdin=subprocess.DEVNULL,
+                              capture_output=True, text=True, timeout=60)
+        match = re.search(r"total\s+([\d.]+) ms", proc.stdout)
+        if proc.returncode != 0 or match is None:
+            errors += 1
+        if match is not None:
+            samples.append(float(match.group(1)) / 1000)
+    samples.sort()
+    return {
+        "case": f"startup[<{budget_ms:g} ms]",
+        "iterations": iterations,
+        "errors": errors,
+        "throughput": len(samples) / sum(samples) if sum(samples) else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "total_s": time.perf_counter() - started
+    }
+
+
+def start_task(sim: MM2Simulator) -> int:
+    '''Starts a simulated lightning init task that stays InProgress, returning its task_id.'''
+    with sim.lock:
+        task_id = sim.init_lightning({"ticker": "BENCH-lightning"})["task_id"]
+        sim.tasks[task_id]["polls"] = 1 << 30
+    return task_id
+
+
+def get_cases(sim: MM2Simulator, node: dex.LightningNode, args) -> list:
+    '''Returns (name, fn, iterations, setup) tuples for every benchmarked call.'''
+    n = args.iterations
+    payment_hash = next(iter(sim.payments))
+    uuid = sim.open_channels[0]["uuid"]
+    tui = LightningTUI(node=node)
+    task_id = start_task(sim)
+    task_ids = [start_task(sim) for i in range(10)]
+    cancel_ids = []
+    return [
+        ("get_pubkey", node.get_pubkey, n, None),
+        ("get_coin_balance", node.get_coin_balance, n, None),
+        ("get_lightning_balance", node.get_lightning_balance, n, None),
+        ("get_balances", node.get_balances, n, None),
+        ("connect_to_node", lambda: node.connect_to_node(f"{sim.peers[0]}@127.0.0.1:9735"), n, None),
+        ("add_trusted_node", lambda: node.add_trusted_node(sim.peers[0]), n, None),
+        ("list_trusted_nodes", node.list_trusted_nodes, n, None),
+        ("remove_trusted_node", lambda: node.remove_trusted_node(sim.peers[0]), n, None),
+        ("open_channel", lambda: node.open_channel(f"{sim.peers[0]}@127.0.0.1:9735", value=0.0001), n, None),
+        ("update_channel", lambda: node.update_channel(uuid, proportional_fee_in_millionths_sats=100, base_fee_msat=1000), n, None),
+        ("list_open_channels", node.list_open_channels, n, None),
+        ("list_closed_channels", node.list_closed_channels, n, None),
+        ("generate_invoice", lambda: node.generate_invoice("bench", 10000, 600), n, None),
+        ("send_payment", lambda: node.send_payment(invoice="lntb1bench"), n, None),
+        ("get_payment_details", lambda: node.get_payment_details(payment_hash), n, None),
+        ("get_payments_details[50]", lambda: node.get_payments_details(list(sim.payments)[:50]), n, None),
+        ("list_payments", node.list_payments, n, None),
+        ("list_inbound_payments", node.list_inbound_payments, n, None),
+        ("list_outbound_payments", node.list_outbound_payments, n, None),
+        ("iter_payments[all]", lambda: sum(1 for i in node.iter_payments(page_size=100)), max(1, n // 20), None),
+        ("get_claimable_balances", node.get_claimable_balances, n, None),
+        ("LightningTUI.get_status", tui.get_status, n, None),
+        ("init_lightning_status", lambda: node.init_lightning_status(task_id), n, None),
+        ("init_lightning_statuses[10]", lambda: node.init_lightning_statuses(task_ids), n, None),
+        ("init_lightning_cancel", lambda: node.init_lightning_cancel(cancel_ids.pop()), n, lambda: cancel_ids.append(start_task(sim))),
+        ("initialize_lightning", node.initialize_lightning, args.init_iterations, lambda: sim.deactivate(node.coin))
+    ]
+
+
+def print_results(results: list):
+    print(colorize(f"{'case':<28}{'iters':>7}{'errors':>8}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}", "cyan"))
+    for i in results:
+        print(f"{i['case']:<28}{i['iterations']:>7}{i['errors']:>8}{i['throughput']:>12.1f}{i['p50_ms']:>10.2f}{i['p99_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LightningNode methods against the mm2 simulator.")
+    parser.add_argument("-n", "--iterations", help="calls per method.", type=int, default=200)
+    parser.add_argument("--init-iterations", help="calls of initialize_lightning.", type=int, default=3)
+    parser.add_argument("--latency", help="simulated seconds of latency per request.", type=float, default=0.0)
+    parser.add_argument("--jitter", help="simulated random extra latency.", type=float, default=0.0)
+    parser.add_argument("--error-rate", help="fraction of simulated requests that fail.", type=float, default=0.0)
+    parser.add_argument("--init-polls", help="status polls before lightning init completes.", type=int, default=1)
+    parser.add_argument("--payments", help="number of payments in the simulated history.", type=int, default=1000)
+    parser.add_argument("--channels", help="number of simulated open channels.", type=int, default=50)
+    parser.add_argument("--cache", help="enable the response cache (disabled to measure raw RPCs).", action="store_true")
+    parser.add_argument("--startup-budget-ms", help="startup time lightning_tui.py must stay within.", type=float, default=150)
+    parser.add_argument("-k", "--filter", help="only run cases containing this string.", default="")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file.", default=None)
+    args = parser.parse_args()
+
+    sim = MM2Simulator(
+        userpass=BENCH_USERPASS,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        init_polls=args.init_polls,
+        payments=args.payments,
+        open_channels=args.channels,
+        closed_channels=args.channels // 5
+    )
+    results = []
+    if args.filter in "startup":
+        results.append(run_startup_case(args.startup_budget_ms))
+    with sim:
+        cache_ttls = None if args.cache else {i: 0 for i in DEFAULT_TTLS}
+        node = dex.LightningNode("tBTC", dex_url=sim.url, activate=False, cache_ttls=cache_ttls)
+        sim.electrum({"coin": node.platform_coin})
+        node.initialize_lightning()
+        for name, fn, iterations, setup in get_cases(sim, node, args):
+            if args.filter in name:
+                results.append(run_case(name, fn, iterations, setup))
+    print_results(results)
+    if args.cache:
+        for method, stats in node.cache.stats().items():
+            print(f"{method:<56}{stats['hits']:>8} hits{stats['misses']:>8} misses  ttl {stats['ttl']}s")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    return results
+
+
+if __name__ == "__main__":
+    results = main()
+    # A startup over budget fails the run, so it can gate CI
+    sys.exit(1 if [i for i in results if i["case"].startswith("startup") and i["errors"]] else 0)
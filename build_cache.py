@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def sha256_file(path: str, chunk_size: int=1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildCache():
+    '''
+    Content-addressed store of verified mm2 binaries. Each binary is kept
+    once under objects/<sha256>, and manifest.json maps "<commit>/<platform>"
+    to its hash and where it came from, so a build that was installed before
+    can be installed again without a download. install() puts the binary in
+    place with a hard link (or a copy across filesystems) to a temporary name
+    and an os.replace(), so the target is never missing or half-written.
+    '''
+    def __init__(self, root: str=None):
+        self.root = root or f"{PROJECT_ROOT}/builds"
+        self.objects = f"{self.root}/objects"
+        self.manifest_file = f"{self.root}/manifest.json"
+        self.lock = threading.Lock()
+        os.makedirs(self.objects, exist_ok=True)
+        self.manifest = self.load()
+
+    def load(self) -> dict:
+        if not os.path.exists(self.manifest_file):
+            return {}
+        with open(self.manifest_file, "r") as f:
+            return json.load(f)
+
+    def save(self):
+        tmp = f"{self.manifest_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self.manifest_file)
+
+    def object_path(self, sha256: str) -> str:
+        return f"{self.objects}/{sha256}"
+
+    def get(self, version: str, platform: str) -> dict:
+        '''Returns the entry of a cached build whose commit starts with `version`, if its binary is intact.'''
+        version = version.lower()
+        with self.lock:
+            entries = [
+                i for key, i in self.manifest.items()
+                if key.endswith(f"/{platform}") and (i["commit"].startswith(version) or version.startswith(i["commit"]))
+            ]
+        for entry in sorted(entries, key=lambda i: i["added"], reverse=True):
+            path = self.object_path(entry["sha256"])
+            if os.path.exists(path) and os.path.getsize(path) == entry["size"]:
+                return entry
+        return None
+
+    def add(self, commit: str, platform: str, binary: str, sha256: str, **source) -> dict:
+        '''Moves a verified binary into the store, returning its manifest entry.'''
+        path = self.object_path(sha256)
+        if os.path.exists(path):
+            os.remove(binary)
+        else:
+            # Read-only, as installs hard link to it
+            os.chmod(binary, 0o555)
+            os.replace(binary, path)
+        entry = dict(source, commit=commit.lower(), platform=platform, sha256=sha256,
+                     size=os.path.getsize(path), added=int(time.time()))
+        with self.lock:
+            self.manifest.update({f"{entry['commit']}/{platform}": entry})
+            self.save()
+        return entry
+
+    def install(self, entry: dict, target: str):
+        '''Atomically replaces `target` with the cached binary of `entry`.'''
+        tmp = f"{target}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(self.object_path(entry["sha256"]), tmp)
+        except OSError:
+            shutil.copy2(self.object_path(entry["sha256"]), tmp)
+        os.replace(tmp, target)
+
+    def prune(self, keep: int=10) -> int:
+        '''Drops all but the `keep` most recently added builds, returning the number of binaries removed.'''
+        with self.lock:
+            entries = sorted(self.manifest.items(), key=lambda i: i[1]["added"], reverse=True)
+            self.manifest = dict(entries[:keep])
+            self.save()
+            used = {i["sha256"] for i in self.manifest.values()}
+        removed = 0
+        for name in os.listdir(self.objects):
+            if name not in used:
+                os.remove(self.object_path(name))
+                removed += 1
+        return removed
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+import os
+import re
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urljoin, unquote
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+import logging
+from logger import CustomFormatter
+
+# create logger with 'lightning_app'
+logger = logging.getLogger("build_index")
+logger.setLevel(logging.DEBUG)
+
+# create console handler with a higher log level
+handler = logging.StreamHandler()
+handler.setFormatter(CustomFormatter())
+logger.addHandler(handler)
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+HREF_RE = re.compile(r'href\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+# Commit hashes in build file names: 7 to 40 hex characters, at least one of them a letter
+COMMIT_RE = re.compile(r"(?<![0-9a-f])(?=[0-9]*[a-f])[0-9a-f]{7,40}(?![0-9a-f])")
+
+
+def file_name(url: str) -> str:
+    return unquote(url.rstrip("/").rsplit("/", 1)[-1])
+
+
+class BuildIndex():
+    '''
+    Persistent index of the build server: the links of every branch listing,
+    with the ETag / Last-Modified they were served with, and the commit ->
+    artifact URLs found in them. Listings are fetched concurrently through a
+    pooled session and revalidated with conditional requests, so a listing
+    that has not changed costs a 304 and no parsing. lookup() answers from the
+    saved index when it can and only goes to the server for unknown commits.
+    '''
+    def __init__(self, base_url: str, index_file: str=None, concurrency: int=8, timeout: float=30):
+        self.base_url = base_url if base_url.endswith("/") else f"{base_url}/"
+        self.index_file = index_file or f"{PROJECT_ROOT}/build_index.json"
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.listings = {}
+        self.commits = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, "r") as f:
+                data = json.load(f)
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable build index {self.index_file}: {e}")
+            return
+        # An index of another server is not reused
+        if data.get("base_url") == self.base_url:
+            self.listings = data.get("listings", {})
+            self.commits = data.get("commits", {})
+
+    def save(self):
+        with self.lock:
+            data = {"base_url": self.base_url, "listings": self.listings, "commits": self.commits}
+        tmp = f"{self.index_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.index_file)
+
+    def fetch(self, url: str) -> list:
+        '''Returns the links of a listing, revalidating the saved copy with a conditional request.'''
+        with self.lock:
+            entry = self.listings.get(url, {})
+            self.stats["requests"] += 1
+        headers = {}
+        if entry.get("etag"):
+            headers.update({"If-None-Match": entry["etag"]})
+        if entry.get("last_modified"):
+            headers.update({"If-Modified-Since": entry["last_modified"]})
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and "links" in entry:
+            with self.lock:
+                self.stats["not_modified"] += 1
+            return entry["links"]
+        response.raise_for_status()
+        # Only links below this listing: skips parent, sort and absolute links
+        links = [urljoin(url, i) for i in HREF_RE.findall(response.text)]
+        links = sorted(set(i for i in links if i.startswith(url) and i != url and "?" not in i))
+        with self.lock:
+            self.listings.update({url: {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "links": links,
+                "checked": int(time.time())
+            }})
+            for link in set(entry.get("links", [])) - set(links):
+                for commit in COMMIT_RE.findall(file_name(link).lower()):
+                    if link in self.commits.get(commit, []):
+                        self.commits[commit].remove(link)
+                    if not self.commits.get(commit):
+                        self.commits.pop(commit, None)
+            for link in links:
+                for commit in COMMIT_RE.findall(file_name(link).lower()):
+                    urls = self.commits.setdefault(commit, [])
+                    if link not in urls:
+                        urls.append(link)
+        return links
+
+    def branch_url(self, branch: str) -> str:
+        return urljoin(self.base_url, branch.strip("/") + "/")
+
+    def crawl(self, branches: list=None) -> int:
+        '''Revalidates the root listing and every branch listing (or only `branches`), returning the listings fetched.'''
+        if branches is None:
+            branches = [i for i in self.fetch(self.base_url) if i.endswith("/")]
+        else:
+            branches = [self.branch_url(i) for i in branches]
+
+        def fetch(url):
+            try:
+                return self.fetch(url)
+            except requests.RequestException as e:
+                logger.warning(f"Could not list {url}: {e}")
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(fetch, branches))
+        self.save()
+        return len(branches)
+
+    def find(self, version: str, platform: str, branch: str=None) -> str:
+        '''Returns the indexed zip URL for a commit and platform, preferring `branch`; None if unknown.'''
+        version = version.lower()
+        with self.lock:
+            urls = [u for c, i in self.commits.items() if c.startswith(version) or version.startswith(c) for u in i]
+            if not urls:
+                # Names without a recognizable commit: match the version anywhere in the file name
+                urls = [u for i in self.listings.values() for u in i["links"] if version in file_name(u).lower()]
+        urls = [i for i in urls if platform in file_name(i) and i.endswith(".zip")]
+        if branch is not None:
+            preferred = self.branch_url(branch)
+            urls.sort(key=lambda i: not i.startswith(preferred))
+        return urls[0] if urls else None
+
+    def lookup(self, version: str, platform: str, branch: str=None) -> str:
+        '''
+        Finds a build's zip URL: from the index, else after revalidating
+        `branch`, else after revalidating every branch. Returns None if the
+        server has no such build.
+        '''
+        url = self.find(version, platform, branch)
+        if url is not None:
+            logger.info(f"Found {version} for {platform} in the build index")
+            return url
+        if branch is not None:
+            self.crawl([branch])
+            url = self.find(version, platform, branch)
+        if url is None:
+            self.crawl()
+            url = self.find(version, platform, branch)
+        return url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the builds on the AtomicDEX API build server.")
+    parser.add_argument("-a", "--api", help="commit hash to look up instead of only refreshing the index.", default=None)
+    parser.add_argument("-b", "--branch", help="branch to look in first.", default=None)
+    parser.add_argument("-p", "--platform", help="platform of the build to look up.", default="linux")
+    parser.add_argument("-j", "--concurrency", help="listings fetched at once.", type=int, default=8)
+    parser.add_argument("--base-url", help="build server url.", default="http://54.170.62.22:8000/")
+    args = parser.parse_args()
+
+    index = BuildIndex(args.base_url, concurrency=args.concurrency)
+    if args.api:
+        logger.info(f"{args.api} [{args.platform}]: {index.lookup(args.api, args.platform, args.branch)}")
+    else:
+        logger.info(f"Indexed {index.crawl()} branches, {len(index.commits)} commits: {index.stats}")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import io
+import re
+import time
+import random
+import hashlib
+import zipfile
+import argparse
+import threading
+import logging
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from logger import CustomFormatter
+
+# create logger with 'lightning_app'
+logger = logging.getLogger("build_sim")
+logger.setLevel(logging.DEBUG)
+
+# create console handler with a higher log level
+handler = logging.StreamHandler()
+handler.setFormatter(CustomFormatter())
+logger.addHandler(handler)
+
+PLATFORMS = {"linux": "mm2", "mac": "mm2", "win": "mm2.exe"}
+
+
+class BuildServerSimulator():
+    '''
+    In-process stand-in for the build server used by update_API.py: an
+    autoindex-style listing of branch folders, each listing one zip per
+    commit and platform. Listings carry an ETag and Last-Modified and answer
+    conditional requests with 304. Each zip has a .sha256 file next to it and
+    can be fetched in parts with Range requests; set `truncate` to a byte
+    count to cut the next zip download short, as a dropped connection would.
+    Every request is counted in `requests`, by path and status, so tests can
+    check what a client fetched.
+    '''
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, branches=20, builds=10, build_size=16384, seed=762):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.build_size = build_size
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+        self.requests = {}
+        self.listings = {}
+        self.modified = {}
+        self.zips = {}
+        self.truncate = None
+        for branch in ["dev", "main"] + [f"feature-{i}" for i in range(max(0, branches - 2))]:
+            for i in range(builds):
+                self.add_build(branch, self.random_hex(9))
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def random_hex(self, length: int) -> str:
+        return "".join(self.random.choice("0123456789abcdef") for i in range(length))
+
+    def add_build(self, branch: str, commit: str) -> list:
+        '''Adds one zip per platform for a commit, changing the branch listing's ETag. Returns the file names.'''
+        names = []
+        with self.lock:
+            files = self.listings.setdefault(branch, [])
+            for platform, binary in PLATFORMS.items():
+                name = f"mm2_{commit}-{platform}-x86-64.zip"
+                buf = io.BytesIO()
+                with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+                    zf.writestr(binary, self.random.randbytes(self.build_size))
+                    zf.writestr("README.md", f"mm2 {commit} {platform}\n")
+                data = buf.getvalue()
+                self.zips.update({
+                    f"/{branch}/{name}": data,
+                    f"/{branch}/{name}.sha256": f"{hashlib.sha256(data).hexdigest()}  {name}\n".encode()
+                })
+                files += [name, f"{name}.sha256"]
+                names.append(name)
+            self.modified.update({branch: time.time(), "": time.time()})
+        return names
+
+    def listing(self, path: str) -> bytes:
+        if path == "/":
+            names = [f"{i}/" for i in sorted(self.listings)]
+        else:
+            names = sorted(self.listings[path.strip("/")])
+        links = "".join(f'<a href="{i}">{i}</a>\n' for i in ["../"] + names)
+        return f"<html><head><title>Index of {path}</title></head><body><pre>\n{links}</pre></body></html>".encode()
+
+    def start(self):
+        '''Starts serving on a background thread. Port 0 picks a free port.'''
+        sim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if sim.latency:
+                    time.sleep(sim.latency)
+                status, headers, body = sim.handle(self.path, self.headers)
+                with sim.lock:
+                    key = (self.path, status)
+                    sim.requests.update({key: sim.requests.get(key, 0) + 1})
+                    truncate = None
+                    if sim.truncate is not None and self.path.endswith(".zip"):
+                        truncate, sim.truncate = sim.truncate, None
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if truncate is not None:
+                    self.wfile.write(body[:truncate])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"build server simulator listening on {self.url}")
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def send_file(self, data: bytes, headers) -> tuple:
+        '''Answers a file GET, honouring a "Range: bytes=start-[end]" header.'''
+        etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        match = re.match(r"bytes=(\d+)-(\d*)$", headers.get("Range") or "")
+        if match is None or headers.get("If-Range", etag) != etag:
+            return 200, {"Content-Type": "application/octet-stream", "ETag": etag, "Accept-Ranges": "bytes"}, data
+        start = int(match.group(1))
+        end = min(int(match.group(2)), len(data) - 1) if match.group(2) else len(data) - 1
+        if start >= len(data):
+            return 416, {"Content-Range": f"bytes */{len(data)}"}, b""
+        return 206, {
+            "Content-Type": "application/octet-stream",
+            "ETag": etag,
+            "Content-Range": f"bytes {start}-{end}/{len(data)}"
+        }, data[start:end + 1]
+
+    def handle(self, path: str, headers) -> tuple:
+        '''Returns (status, headers, body) for a GET of path.'''
+        path = path.split("?")[0]
+        with self.lock:
+            if path in self.zips:
+                return self.send_file(self.zips[path], headers)
+            if path != "/" and not (path.endswith("/") and path.strip("/") in self.listings):
+                return 404, {}, b"Not found"
+            body = self.listing(path)
+            modified = self.modified[path.strip("/")]
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        last_modified = formatdate(modified, usegmt=True)
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag, "Last-Modified": last_modified}, b""
+        return 200, {"Content-Type": "text/html", "ETag": etag, "Last-Modified": last_modified}, body
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a simulated build server for local testing of update_API.py.")
+    parser.add_argument("--host", help="address to listen on.", default="127.0.0.1")
+    parser.add_argument("--port", help="port to listen on.", type=int, default=8000)
+    parser.add_argument("--latency", help="seconds of latency added to each request.", type=float, default=0.0)
+    parser.add_argument("--branches", help="number of branch folders.", type=int, default=20)
+    parser.add_argument("--builds", help="commits per branch.", type=int, default=10)
+    args = parser.parse_args()
+
+    sim = BuildServerSimulator(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        branches=args.branches,
+        builds=args.builds
+    ).start()
+    try:
+        sim.thread.join()
+    except KeyboardInterrupt:
+        sim.stop()
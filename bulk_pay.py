@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+import os
+import csv
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import dex_lightning as dex
+from dex_lightning import logger
+from payment_watcher import PaymentWatcher
+
+FINAL_STATES = ["succeeded", "failed", "rejected"]
+
+
+class RateLimiter():
+    '''Token bucket allowing `rate` calls per second, with bursts of up to `burst`.'''
+    def __init__(self, rate: float, burst: int=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            delay = 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        if delay:
+            time.sleep(delay)
+
+
+class BulkPayer():
+    '''
+    Pays a batch of invoices or keysend targets with bounded concurrency and
+    a rate cap, then tracks each payment until it succeeds or fails.
+    Every state change is appended to a JSONL results file, so a run can be
+    resumed: finished targets are skipped and sent payments are only tracked.
+    Targets whose send was interrupted before mm2 answered are marked
+    "unknown" and not resent unless retry_unknown is set, to avoid paying twice.
+    '''
+    def __init__(self, node: dex.LightningNode, results_file: str, concurrency: int=4, rate: float=10,
+                 poll_interval: float=2, timeout: float=600, retry_unknown: bool=False):
+        self.node = node
+        self.results_file = results_file
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate, burst=concurrency)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.retry_unknown = retry_unknown
+        self.lock = threading.Lock()
+        self.results = self.load_results()
+
+    @staticmethod
+    def load_targets(path: str) -> list:
+        '''
+        Reads targets from a CSV (with a header row) or JSONL file. Each target
+        has either an `invoice`, or a `destination` (or `pubkey`) and
+        `amount_in_msat`, with optional `expiry`, `memo` and `id` fields.
+        Without an `id`, the resume key is derived from the row's content
+        (the invoice, or destination, amount and memo) and its occurrence
+        among identical rows, so editing or reordering the file between runs
+        neither resends nor skips a payout.
+        '''
+        with open(path, "r") as f:
+            if path.endswith(".jsonl") or path.endswith(".json"):
+                rows = [json.loads(line) for line in f if line.strip()]
+            else:
+                rows = list(csv.DictReader(f))
+        targets = []
+        ids = set()
+        occurrences = {}
+        for row in rows:
+            if row.get("id"):
+                target = {"id": str(row["id"]).strip()}
+            else:
+                content = (row.get("invoice") or "").strip() or "/".join([
+                    (row.get("destination") or row.get("pubkey") or "").strip(),
+                    str(row.get("amount_in_msat") or "").strip(),
+                    (row.get("memo") or "").strip()
+                ])
+                key = hashlib.sha256(content.encode()).hexdigest()[:16]
+                occurrences.update({key: occurrences.get(key, 0) + 1})
+                target = {"id": f"{key}-{occurrences[key]}"}
+            if target["id"] in ids:
+                raise ValueError(f"Duplicate target id {target['id']}")
+            ids.add(target["id"])
+            if row.get("invoice"):
+                target.update({"invoice": row["invoice"].strip()})
+            else:
+                target.update({
+                    "destination": (row.get("destination") or row.get("pubkey") or "").strip(),
+                    "amount_in_msat": int(row.get("amount_in_msat") or 0),
+                    "expiry": int(row.get("expiry") or 24)
+                })
+                if not target["destination"] or target["amount_in_msat"] <= 0:
+                    raise ValueError(f"Target {target['id']} needs an invoice, or a destination and amount_in_msat")
+            targets.append(target)
+        return targets
+
+    def load_results(self) -> dict:
+        '''Returns the last recorded state per target id.'''
+        results = {}
+        if os.path.exists(self.results_file):
+            with open(self.results_file, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        results.update({entry["id"]: dict(results.get(entry["id"], {}), **entry)})
+        return results
+
+    def record(self, target_id: str, state: str, **fields) -> dict:
+        entry = dict(id=target_id, state=state, updated_at=int(time.time()), **fields)
+        with self.lock:
+            self.results.update({target_id: dict(self.results.get(target_id, {}), **entry)})
+            with open(self.results_file, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return entry
+
+    def send(self, target: dict) -> dict:
+        self.limiter.wait()
+        self.record(target["id"], "sending")
+        try:
+            if "invoice" in target:
+                resp = self.node.send_payment(invoice=target["invoice"])
+            else:
+                resp = self.node.send_payment(
+                    amount_in_msat=target["amount_in_msat"],
+                    pubkey=target["destination"],
+                    expiry=target["expiry"]
+                )
+        except Exception as e:
+            return self.record(target["id"], "unknown", error=str(e))
+        if "error" in resp:
+            return self.record(target["id"], "rejected", error=resp["error"])
+        return self.record(target["id"], "sent", payment_hash=resp["result"]["payment_hash"])
+
+    def run(self, targets: list) -> dict:
+        '''Sends every unfinished target and tracks them all, returning a count per final state.'''
+        # Resuming against results that match no target would pay everything again
+        if self.results and not any(i["id"] in self.results for i in targets):
+            raise ValueError(f"None of the targets are in {self.results_file}; use a new results file for a new batch")
+        to_send = []
+        for target in targets:
+            state = self.results.get(target["id"], {}).get("state")
+            if state in ["sending", "unknown"] and not self.retry_unknown:
+                if state == "sending":
+                    self.record(target["id"], "unknown", error="Interrupted before mm2 answered")
+                continue
+            if state is None or state in ["sending", "unknown"]:
+                to_send.append(target)
+        logger.info(f"Sending {len(to_send)} of {len(targets)} payments, {self.concurrency} at a time")
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(self.send, to_send))
+        self.track([i["id"] for i in targets])
+        return self.summary([i["id"] for i in targets])
+
+    def track(self, target_ids: list):
+        '''Watches sent payments until each is final or the timeout passes.'''
+        pending = {
+            self.results[i]["payment_hash"]: i for i in target_ids
+            if self.results.get(i, {}).get("state") == "sent"
+        }
+        if not pending:
+            return
+        done = threading.Semaphore(0)
+
+        def on_status(payment_hash, old_status, new_status, details):
+            if new_status in ["succeeded", "failed"]:
+                self.record(pending[payment_hash], new_status, payment_hash=payment_hash)
+                done.release()
+
+        watcher = PaymentWatcher(self.node, min_interval=self.poll_interval, max_interval=self.poll_interval * 5)
+        for payment_hash in pending:
+            watcher.watch(payment_hash, on_status, status="pending")
+        deadline = time.monotonic() + self.timeout
+        for i in pending:
+            if not done.acquire(timeout=max(0, deadline - time.monotonic())):
+                logger.warning("Timed out tracking payments, run again to resume tracking")
+                break
+        watcher.stop()
+
+    def summary(self, target_ids: list) -> dict:
+        counts = {}
+        for i in target_ids:
+            state = self.results.get(i, {}).get("state", "unsent")
+            counts.update({state: counts.get(state, 0) + 1})
+        return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pay a batch of invoices or keysend targets from a CSV or JSONL file.")
+    parser.add_argument("file", help="CSV or JSONL file of targets (invoice, or destination and amount_in_msat).")
+    parser.add_argument("-c", "--coin", help="lightning coin to pay with, e.g. tBTC.", default="tBTC")
+    parser.add_argument("-o", "--output", help="JSONL results file, used to resume.", default=None)
+    parser.add_argument("-j", "--concurrency", help="payments in flight at once.", type=int, default=4)
+    parser.add_argument("-r", "--rate", help="maximum payments sent per second.", type=float, default=10)
+    parser.add_argument("-t", "--timeout", help="seconds to track payments before giving up.", type=float, default=600)
+    parser.add_argument("--retry-unknown", help="resend targets interrupted before mm2 answered.", action="store_true")
+    parser.add_argument("--dex-url", help="AtomicDEX API url.", default="http://127.0.0.1:7783")
+    args = parser.parse_args()
+
+    node = dex.LightningNode(args.coin, dex_url=args.dex_url, activate=False)
+    payer = BulkPayer(
+        node,
+        args.output or f"{os.path.splitext(args.file)[0]}.results.jsonl",
+        concurrency=args.concurrency,
+        rate=args.rate,
+        timeout=args.timeout,
+        retry_unknown=args.retry_unknown
+    )
+    logger.info(f"Results: {payer.run(BulkPayer.load_targets(args.file))}")
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+import csv
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+import dex_lightning as dex
+from dex_lightning import logger
+from payment_store import PaymentStore
+
+# Exported per-channel columns, in order
+COLUMNS = [
+    "uuid", "counterparty_node_id", "capacity_sats", "local_ratio", "imbalance", "sent_msat", "fees_msat",
+    "payments", "moved_msat", "turnover", "utilization", "idle_seconds"
+]
+
+# Row layouts of the loaded tables. Destinations and uuids stay Python strings: compute() maps
+# them to channel indexes through a dict, which is much faster than sorting NumPy strings
+CHANNEL_DTYPE = [("uuid", object), ("peer", object), ("capacity_sats", np.int64), ("outbound_msat", np.int64), ("inbound_msat", np.int64)]
+PAYMENT_DTYPE = [("destination", object), ("amount_msat", np.int64), ("fee_msat", np.int64), ("created_at", np.int64)]
+SNAPSHOT_DTYPE = [("uuid", object), ("taken_at", np.int64), ("balance_msat", np.int64)]
+
+
+class ChannelAnalytics():
+    '''
+    Per-channel liquidity metrics over a time window, computed with NumPy
+    over columnar arrays of the open channels, the payment history and the
+    balance snapshots kept by PaymentStore:
+
+    - local_ratio: share of the balance on our side; imbalance: the same as
+      (outbound - inbound) / (outbound + inbound), from -1 to 1.
+    - sent_msat, fees_msat, payments: succeeded outbound payments whose
+      destination is the channel's peer. mm2 does not report which channel
+      a payment used, so each one goes to the peer's largest channel.
+      Inbound payments carry no source and are only counted in totals().
+    - moved_msat: sum of the balance changes seen in the snapshots (or
+      sent_msat if larger, when syncs missed a change); turnover is moved_msat
+      over the capacity.
+    - utilization: share of the window's buckets (hours by default) in which
+      the channel moved or sent anything, counted from when it was first seen.
+    - idle_seconds: time since the last movement or payment, NaN if none.
+    '''
+    def __init__(self, channels: dict, payments: dict, snapshots: dict, since: int, now: int=None, bucket: int=3600):
+        self.channels = channels
+        self.payments = payments
+        self.snapshots = snapshots
+        self.since = since
+        self.now = now or int(time.time())
+        self.bucket = bucket
+        self.result = None
+
+    @classmethod
+    def from_store(cls, store: PaymentStore, window: int=30 * 86400, **kwargs):
+        '''Loads the open channels, and the payments and snapshots of the last `window` seconds.'''
+        now = int(time.time())
+        since = now - window
+        with store.lock:
+            # Plain tuples: NumPy builds arrays from them much faster than from sqlite3.Row
+            cursor = store.db.cursor()
+            cursor.row_factory = None
+            channels = cursor.execute(
+                "SELECT uuid, counterparty_node_id, COALESCE(capacity_sats, 0), COALESCE(outbound_capacity_msat, 0), "
+                "COALESCE(inbound_capacity_msat, 0) FROM open_channels"
+            ).fetchall()
+            payments = cursor.execute(
+                "SELECT destination, COALESCE(amount_in_msat, 0), COALESCE(fee_paid_msat, 0), created_at FROM payments "
+                "WHERE status = 'succeeded' AND created_at >= ? AND payment_type = 'Outbound Payment'", (since,)
+            ).fetchall()
+            inbound = cursor.execute(
+                "SELECT COUNT(*), COALESCE(SUM(amount_in_msat), 0) FROM payments "
+                "WHERE status = 'succeeded' AND created_at >= ? AND payment_type = 'Inbound Payment'", (since,)
+            ).fetchone()
+            # The last snapshot before the window is the baseline for the first change in it
+            snapshots = cursor.execute(
+                "SELECT uuid, taken_at, COALESCE(balance_msat, 0) FROM channel_snapshots WHERE taken_at >= ? "
+                "UNION ALL SELECT uuid, MAX(taken_at), COALESCE(balance_msat, 0) FROM channel_snapshots WHERE taken_at < ? GROUP BY uuid",
+                (since, since)
+            ).fetchall()
+        analytics = cls(
+            cls.channel_arrays(channels),
+            cls.payment_arrays(payments),
+            cls.snapshot_arrays(snapshots),
+            since,
+            now,
+            **kwargs
+        )
+        analytics.payments.update({"inbound_count": inbound[0], "inbound_msat": inbound[1]})
+        return analytics
+
+    @classmethod
+    def from_records(cls, channels: list, payments: list, snapshots: list=None, window: int=30 * 86400, **kwargs):
+        '''Builds the arrays from list_open_channels and list_payments records, e.g. without a store.'''
+        now = int(time.time())
+        since = now - window
+        outbound = [
+            i for i in payments if i.get("status") == "succeeded" and (i.get("created_at") or 0) >= since
+            and i.get("payment_type", {}).get("type") == "Outbound Payment"
+        ]
+        inbound = [
+            i.get("amount_in_msat") or 0 for i in payments if i.get("status") == "succeeded"
+            and (i.get("created_at") or 0) >= since and i.get("payment_type", {}).get("type") == "Inbound Payment"
+        ]
+        analytics = cls(
+            cls.channel_arrays([(
+                i["uuid"], i.get("counterparty_node_id"), i.get("funding_tx_value_sats") or 0,
+                i.get("outbound_capacity_msat") or 0, i.get("inbound_capacity_msat") or 0
+            ) for i in channels]),
+            cls.payment_arrays([(
+                i["payment_type"].get("destination"), i.get("amount_in_msat") or 0, i.get("fee_paid_msat") or 0, i["created_at"]
+            ) for i in outbound]),
+            cls.snapshot_arrays(snapshots or []),
+            since,
+            now,
+            **kwargs
+        )
+        analytics.payments.update({"inbound_count": len(inbound), "inbound_msat": sum(inbound)})
+        return analytics
+
+    @staticmethod
+    def channel_arrays(rows: list) -> dict:
+        table = np.fromiter(rows, dtype=CHANNEL_DTYPE, count=len(rows))
+        return {
+            "uuid": table["uuid"].astype(str),
+            "peer": np.array([i or "" for i in table["peer"]], dtype=str),
+            "capacity_sats": table["capacity_sats"],
+            "outbound_msat": table["outbound_msat"],
+            "inbound_msat": table["inbound_msat"]
+        }
+
+    @staticmethod
+    def payment_arrays(rows: list) -> dict:
+        table = np.fromiter(rows, dtype=PAYMENT_DTYPE, count=len(rows))
+        payments = {name: table[name] for name in table.dtype.names}
+        payments.update({"inbound_count": 0, "inbound_msat": 0})
+        return payments
+
+    @staticmethod
+    def snapshot_arrays(rows: list) -> dict:
+        table = np.fromiter(rows, dtype=SNAPSHOT_DTYPE, count=len(rows))
+        return {name: table[name] for name in table.dtype.names}
+
+    @staticmethod
+    def encode(values: np.ndarray, codes: dict) -> np.ndarray:
+        '''Maps each value to its integer code, -1 where it has none.'''
+        return np.fromiter(map(codes.get, values, itertools.repeat(-1)), np.int64, len(values))
+
+    def compute(self) -> dict:
+        '''Returns a dict of per-channel arrays, one entry per column in COLUMNS.'''
+        channels = self.channels
+        n = len(channels["uuid"])
+        capacity_msat = channels["capacity_sats"] * 1000
+        outbound = channels["outbound_msat"].astype(np.float64)
+        inbound = channels["inbound_msat"].astype(np.float64)
+        total = outbound + inbound
+        with np.errstate(divide="ignore", invalid="ignore"):
+            local_ratio = np.where(total > 0, outbound / total, np.nan)
+        buckets_total = max(1, -(-(self.now - self.since) // self.bucket))
+
+        # Each peer's payments go to its largest channel: ascending capacity, so the largest is set last
+        peer_channel = {}
+        for i in np.argsort(channels["capacity_sats"], kind="stable").tolist():
+            if channels["peer"][i]:
+                peer_channel.update({str(channels["peer"][i]): i})
+
+        payments = self.payments
+        target = self.encode(payments["destination"], peer_channel)
+        paid = target >= 0
+        target, paid_at = target[paid], payments["created_at"][paid]
+        sent = np.bincount(target, weights=payments["amount_msat"][paid], minlength=n)
+        fees = np.bincount(target, weights=payments["fee_msat"][paid], minlength=n)
+        count = np.bincount(target, minlength=n)
+        last = np.full(n, -1, dtype=np.int64)
+        np.maximum.at(last, target, paid_at)
+
+        # Balance movement between consecutive snapshots of the same channel
+        snapshots = self.snapshots
+        index = self.encode(snapshots["uuid"], {str(u): i for i, u in enumerate(channels["uuid"])})
+        known = index >= 0
+        index, taken_at, balance = index[known], snapshots["taken_at"][known], snapshots["balance_msat"][known]
+        order = np.lexsort((taken_at, index))
+        index, taken_at, balance = index[order], taken_at[order], balance[order]
+        seen = np.full(n, self.now, dtype=np.int64)
+        np.minimum.at(seen, index, taken_at)
+        first_seen = np.where(np.bincount(index, minlength=n) > 0, np.maximum(seen, self.since), self.since)
+        delta = np.abs(np.diff(balance))
+        changed = (index[1:] == index[:-1]) & (delta > 0) & (taken_at[1:] >= self.since)
+        moved_index, moved_at = index[1:][changed], taken_at[1:][changed]
+        moved = np.maximum(np.bincount(moved_index, weights=delta[changed], minlength=n), sent)
+        np.maximum.at(last, moved_index, moved_at)
+
+        # Buckets with any activity, counted once per channel
+        active = np.zeros((n, buckets_total), dtype=bool)
+        last_bucket = buckets_total - 1
+        active[target, np.clip((paid_at - self.since) // self.bucket, 0, last_bucket)] = True
+        active[moved_index, np.clip((moved_at - self.since) // self.bucket, 0, last_bucket)] = True
+        buckets_active = active.sum(axis=1)
+        buckets_open = np.maximum(1, -(-(self.now - first_seen) // self.bucket))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.result = {
+                "uuid": channels["uuid"],
+                "counterparty_node_id": channels["peer"],
+                "capacity_sats": channels["capacity_sats"],
+                "local_ratio": local_ratio,
+                "imbalance": np.where(total > 0, (outbound - inbound) / total, np.nan),
+                "sent_msat": sent.astype(np.int64),
+                "fees_msat": fees.astype(np.int64),
+                "payments": count,
+                "moved_msat": moved.astype(np.int64),
+                "turnover": np.where(capacity_msat > 0, moved / capacity_msat, np.nan),
+                "utilization": np.minimum(1.0, buckets_active / buckets_open),
+                "idle_seconds": np.where(last >= 0, self.now - last, np.nan)
+            }
+        return self.result
+
+    def rows(self, sort: str="turnover", descending: bool=True) -> list:
+        '''Returns one dict per channel, sorted by a column (NaN last).'''
+        result = self.result or self.compute()
+        key = result[sort]
+        if key.dtype.kind == "f":
+            key = np.where(np.isnan(key), -np.inf if descending else np.inf, key)
+        order = np.argsort(key, kind="stable")
+        if descending:
+            order = order[::-1]
+        columns = [result[i].tolist() for i in COLUMNS]
+        return [
+            {name: (None if isinstance(v, float) and v != v else v) for name, v in zip(COLUMNS, (c[i] for c in columns))}
+            for i in order.tolist()
+        ]
+
+    def totals(self, idle_after: int=7 * 86400) -> dict:
+        result = self.result or self.compute()
+        idle = np.isnan(result["idle_seconds"]) | (result["idle_seconds"] > idle_after)
+        capacity_msat = int(result["capacity_sats"].sum()) * 1000
+        return {
+            "since": self.since,
+            "until": self.now,
+            "channels": len(result["uuid"]),
+            "capacity_sats": int(result["capacity_sats"].sum()),
+            "idle_channels": int(idle.sum()),
+            "sent_msat": int(result["sent_msat"].sum()),
+            "fees_msat": int(result["fees_msat"].sum()),
+            "unattributed_sent_msat": int(self.payments["amount_msat"].sum() - result["sent_msat"].sum()),
+            "received_msat": int(self.payments["inbound_msat"]),
+            "received_payments": int(self.payments["inbound_count"]),
+            "moved_msat": int(result["moved_msat"].sum()),
+            "turnover": int(result["moved_msat"].sum()) / capacity_msat if capacity_msat else None
+        }
+
+    def write_json(self, path: str, sort: str="turnover"):
+        with open(path, "w") as f:
+            json.dump({"totals": self.totals(), "channels": self.rows(sort)}, f, indent=2)
+
+    def write_csv(self, path: str, sort: str="turnover"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(self.rows(sort))
+
+    def write(self, path: str, sort: str="turnover"):
+        '''Exports to CSV if path ends in .csv, else to JSON.'''
+        if path.lower().endswith(".csv"):
+            self.write_csv(path, sort)
+        else:
+            self.write_json(path, sort)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-channel liquidity analytics from the local payment store.")
+    parser.add_argument("-c", "--coin", help="lightning coin, e.g. tBTC.", default="tBTC")
+    parser.add_argument("-d", "--days", help="length of the window, in days.", type=float, default=30)
+    parser.add_argument("-s", "--sort", help="column to sort by.", choices=COLUMNS[2:], default="turnover")
+    parser.add_argument("-o", "--output", help="JSON or CSV file to write (default: print JSON).", default=None)
+    parser.add_argument("--sync", help="sync the store with mm2 first.", action="store_true")
+    parser.add_argument("--dex-url", help="AtomicDEX API url.", default="http://127.0.0.1:7783")
+    args = parser.parse_args()
+
+    store = PaymentStore(dex.LightningNode(args.coin, dex_url=args.dex_url, activate=False))
+    if args.sync:
+        logger.info(f"Synced: {store.sync()}")
+    analytics = ChannelAnalytics.from_store(store, window=int(args.days * 86400))
+    if args.output:
+        analytics.write(args.output, args.sort)
+        logger.info(f"Channel analytics written to {args.output}")
+    else:
+        print(json.dumps({"totals": analytics.totals(), "channels": analytics.rows(args.sort)}, indent=2))
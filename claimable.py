@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import time
+import threading
+from collections import Counter
+from dex_lightning import logger
+
+# get_claimable_balances entry types, by category
+CATEGORIES = {
+    "ClaimableOnChannelClose": "open",
+    "ClaimableAwaitingConfirmations": "sweeping",
+    "ContentiousClaimable": "timelocked",
+    "MaybeTimeoutClaimableHTLC": "timelocked",
+    "MaybePreimageClaimableHTLC": "timelocked",
+    "CounterpartyRevokedOutputClaimable": "revoked"
+}
+CATEGORY_ORDER = ["open", "sweeping", "timelocked", "revoked", "other"]
+
+
+def entry_key(balance: dict) -> tuple:
+    '''Hashable form of a balance entry, so equal entries count as one item of a multiset.'''
+    return tuple(sorted((k, v) for k, v in balance.items() if not isinstance(v, (dict, list))))
+
+
+class ClaimableAggregator():
+    '''
+    Running per-category totals of a node's claimable funds: open channel
+    balances, sweeps awaiting confirmations, timelocked (HTLC and contentious)
+    outputs and revoked outputs, plus the closed channels whose funds have not
+    been claimed yet. Each update compares the new entries with the previous
+    ones position by position and only keys and applies those that differ,
+    so totals are never re-summed. refresh() only asks mm2 again once the
+    payment store reports a channel change, the lightning balance moves, or
+    `max_age` seconds have passed (as sweeps confirm without either).
+    '''
+    def __init__(self, max_age: float=60):
+        self.max_age = max_age
+        self.totals = {i: 0 for i in CATEGORY_ORDER}
+        self.counts = {i: 0 for i in CATEGORY_ORDER}
+        self.unclaimed = {}
+        self.unclaimed_sats = 0
+        self.last = []
+        self.store = None
+        self.stale = False
+        self.unclaimed_stale = True
+        self.refreshed = None
+        self.lightning_balance = None
+        self.lock = threading.Lock()
+
+    def apply(self, key: tuple, count: int):
+        balance = dict(key)
+        category = CATEGORIES.get(balance.get("type"), "other")
+        self.totals[category] += (balance.get("claimable_amount_satoshis") or 0) * count
+        self.counts[category] += count
+
+    def update_balances(self, balances: list) -> int:
+        '''Applies a get_claimable_balances result list, returning the number of entries that changed.'''
+        with self.lock:
+            if balances is self.last or balances == self.last:
+                return 0
+            # Entries equal at the same position cancel out, so only the rest are keyed;
+            # what is left is the multiset difference, whatever the order of the lists
+            added, removed = Counter(), Counter()
+            for old, new in zip(self.last, balances):
+                if old != new:
+                    removed[entry_key(old)] += 1
+                    added[entry_key(new)] += 1
+            shared = min(len(self.last), len(balances))
+            removed.update(entry_key(i) for i in self.last[shared:])
+            added.update(entry_key(i) for i in balances[shared:])
+            added, removed = added - removed, removed - added
+            for key, count in removed.items():
+                self.apply(key, -count)
+            for key, count in added.items():
+                self.apply(key, count)
+            self.last = balances
+            return sum(added.values()) + sum(removed.values())
+
+    def update_unclaimed(self, channels: list) -> int:
+        '''Applies the current list of closed channels without a claiming_tx, diffed by uuid.'''
+        with self.lock:
+            unclaimed = {i["uuid"]: i.get("claimed_balance") or 0 for i in channels}
+            changed = 0
+            for uuid in self.unclaimed.keys() - unclaimed.keys():
+                self.unclaimed_sats -= self.unclaimed.pop(uuid)
+                changed += 1
+            for uuid, amount in unclaimed.items():
+                if self.unclaimed.get(uuid) != amount:
+                    self.unclaimed_sats += amount - self.unclaimed.get(uuid, 0)
+                    self.unclaimed.update({uuid: amount})
+                    changed += 1
+            return changed
+
+    def on_store_change(self, kind: str, channels: list):
+        '''PaymentStore listener: a changed open or closed channel changes what is claimable.'''
+        self.stale = True
+        if kind == "closed":
+            self.unclaimed_stale = True
+
+    def refresh(self, node, store=None) -> bool:
+        '''
+        Brings the totals up to date if anything may have changed: fetches the
+        claimable balances and, from the local store, the unclaimed closed
+        channels. Returns whether mm2 was asked.
+        '''
+        if store is not None and store is not self.store:
+            store.add_listener(self.on_store_change)
+            self.store = store
+            self.unclaimed_stale = True
+        if node.lightning_balance != self.lightning_balance:
+            self.lightning_balance = node.lightning_balance
+            self.stale = True
+        changed = self.stale
+        fetched = changed or self.refreshed is None or time.monotonic() - self.refreshed >= self.max_age
+        if fetched:
+            self.stale = False
+            self.refreshed = time.monotonic()
+            # After a known change a cached response would be out of date
+            resp = node.get_claimable_balances(True, nolog=True, refresh=changed)
+            if "error" in resp:
+                logger.debug(f"Claimable balances refresh failed: {resp['error']}")
+            else:
+                self.update_balances(resp["result"])
+        if store is not None and store.synced and self.unclaimed_stale:
+            self.unclaimed_stale = False
+            self.update_unclaimed(store.unclaimed_channels())
+        return fetched
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "totals": dict(self.totals),
+                "counts": dict(self.counts),
+                "unclaimed_channels": len(self.unclaimed),
+                "unclaimed_sats": self.unclaimed_sats
+            }
+
+    def summary(self) -> str:
+        '''One line for the status header, e.g. "Claimable 1200000 sats | open 1000000 | sweeping 200000 (2)".'''
+        snapshot = self.snapshot()
+        totals, counts = snapshot["totals"], snapshot["counts"]
+        parts = [f"Claimable {sum(totals.values())} sats", f"open {totals['open']}"]
+        parts += [f"{i} {totals[i]} ({counts[i]})" for i in CATEGORY_ORDER[1:] if counts[i]]
+        if snapshot["unclaimed_channels"]:
+            parts.append(f"{snapshot['unclaimed_channels']} closed unclaimed")
+        return " | ".join(parts)
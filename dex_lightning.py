@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 import os
 import sys
-import time
-import json
-import random
 import logging
-import requests
-from dotenv import load_dotenv
-from logger import CustomFormatter
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from logger import CustomFormatter, QueueLogHandler, Redacted
+from transport import DexTransport
+from rpc_cache import RPCCache
+from activation import ActivationParams
+from electrum_rank import ElectrumRanker
+from init_tracker import InitTracker
 
 # create logger with 'lightning_app'
 logger = logging.getLogger("dex_lightning")
@@ -16,28 +18,71 @@ logger.setLevel(logging.DEBUG)
 # create console handler with a higher log level
 handler = logging.StreamHandler()
 handler.setFormatter(CustomFormatter())
-logger.addHandler(handler)
+# records are formatted and written on a background thread, off the RPC path
+logger.addHandler(QueueLogHandler(handler))
+
+MM2_USERPASS = None
+# Slack on top of an init task's deadline for its cancel request and last poll
+INIT_TIMEOUT_GRACE = 30
+
+
+def get_userpass(ask=input) -> str:
+    '''
+    Resolves the userpass on first use (environment, then .env, then `ask`),
+    so importing this module never blocks on a prompt.
+    '''
+    global MM2_USERPASS
+    if MM2_USERPASS is None:
+        MM2_USERPASS = os.getenv("MM2_USERPASS")
+    if not MM2_USERPASS:
+        from dotenv import load_dotenv
+        load_dotenv()
+        MM2_USERPASS = os.getenv("MM2_USERPASS")
+    if not MM2_USERPASS:
+        logger.warning("MM2_USERPASS not set! Set it in a .env file in this folder. For more information, refer to https://help.pythonanywhere.com/pages/environment-variables-for-web-apps/")
+        MM2_USERPASS = ask("Enter your userpass: ")
+    return MM2_USERPASS
 
-load_dotenv()
-MM2_USERPASS = os.getenv("MM2_USERPASS")
-if not MM2_USERPASS:
-    logger.warning("MM2_USERPASS not set! Set it in a .env file in this folder. For more information, refer to https://help.pythonanywhere.com/pages/environment-variables-for-web-apps/")
-    MM2_USERPASS = input("Enter your userpass: ")
 
 class LightningNode:
-    def __init__(self, coin, dex_url="http://127.0.0.1:7783", name="dragonhound-lightning", port=9735, color="000000", payment_retries=5):
+    def __init__(self, coin, dex_url="http://127.0.0.1:7783", name="dragonhound-lightning", port=9735, color="000000", payment_retries=5,
+                 transport: DexTransport=None, pool_size: int=10, connect_timeout: float=3.05, read_timeout: float=60,
+                 activate: bool=True, cache_ttls: dict=None, cache: RPCCache=None, electrum_servers: int=2,
+                 background_init: bool=False, init_deadline: float=60, on_init_progress=None):
         '''
         Coin should be the base ticker: e.g. tBTC
         We must activate the segwit variant of the coin before we can create
-        a lightning node for it.        
+        a lightning node for it.
+        Nodes using the same dex_url share one pooled transport unless a
+        transport is passed in explicitly.
+        Pass activate=False to skip coin activation and lightning
+        initialization, e.g. when the coin is already enabled.
+        Read-only responses are cached for the seconds given per method in
+        cache_ttls (see rpc_cache.DEFAULT_TTLS); a TTL of 0 disables caching.
+        Nodes can share one cache by passing it in.
+        The platform coin is activated with the `electrum_servers` fastest
+        servers, as ranked by electrum_rank.ElectrumRanker.
+        With background_init=True the constructor returns as soon as the
+        lightning init task is started (see initialize_lightning).
         '''
         self.dex_url = dex_url
+        if transport is None:
+            transport = DexTransport.shared(
+                dex_url,
+                pool_size=pool_size,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout
+            )
+        self.transport = transport
+        self.cache = cache or RPCCache(cache_ttls)
         self.name = name
         self.port = port
         self.color = color
         self.lightning_address = "no address found"
         self.lightning_balance = 0
         self.payment_retries = payment_retries
+        self.electrum_servers = electrum_servers
+        self.activation_servers = []
         self.platform_coin = f"{coin.split('-')[0]}-segwit"
         self.coin = f"{coin.split('-')[0]}-lightning"
         self.lightning_address = "no address found"
@@ -45,35 +90,105 @@ class LightningNode:
         self.coin_address = "no address found"
         self.coin_balance = 0
         self.coin_pubkey = "no pubkey found"
-        self.activate_coin(coin)
-        self.get_pubkey()
-        self.initialize_lightning()
-        
-
-    def dexAPI(self, params: dict, nolog: bool=False) -> dict:
-        params.update({"userpass": MM2_USERPASS})
-        if not nolog: logger.debug(f"PARAMS: {params}")
-        resp = requests.post(self.dex_url, json.dumps(params)).json()
+        self.init_future = None
+        if activate:
+            self.activate_coin(coin)
+            self.get_pubkey()
+            self.initialize_lightning(background=background_init, deadline=init_deadline, on_progress=on_init_progress)
+
+
+    def dexAPI(self, params: dict, nolog: bool=False, refresh: bool=False, cache: bool=True) -> dict:
+        '''
+        Sends a request, serving read-only methods from the cache unless
+        refresh is set. With cache=False the response is not cached either.
+        '''
+        resp = None if refresh or not cache else self.cache.get(params)
+        if resp is not None:
+            self.transport.metrics.hit(params.get("method"))
+            if not nolog: logger.info("RESP (cached): %s", Redacted(resp))
+            return resp
+        params.update({"userpass": get_userpass()})
+        if not nolog: logger.debug("PARAMS: %s", Redacted(params))
+        resp = self.transport.post(params)
+        if cache:
+            self.cache.update(params, resp)
         if not nolog:
             if "error" in resp:
-                logger.warning(f"ERROR: {resp}")
+                logger.warning("ERROR: %s", Redacted(resp))
             else:
-                logger.info(f"RESP: {resp}")
+                logger.info("RESP: %s", Redacted(resp))
         return resp
 
+    def dexAPI_batch(self, params_list: list, nolog: bool=False, refresh: bool=False) -> list:
+        '''
+        Sends several requests in one round trip, returning one response per request.
+        Cached responses are filled in locally and only the misses are sent.
+        '''
+        results = [None if refresh else self.cache.get(params) for params in params_list]
+        pending = [params for params, resp in zip(params_list, results) if resp is None]
+        for params, resp in zip(params_list, results):
+            if resp is not None: self.transport.metrics.hit(params.get("method"))
+        if not pending:
+            return results
+        for params in pending:
+            params.update({"userpass": get_userpass()})
+        if not nolog: logger.debug("BATCH PARAMS: %s", Redacted(pending))
+        resp = self.transport.post(pending)
+        if not isinstance(resp, list) or len(resp) != len(pending):
+            logger.warning("Batch request rejected, falling back to single requests: %s", Redacted(resp))
+            resp = [self.dexAPI(params, nolog=True, refresh=True) for params in pending]
+        resp = iter(resp)
+        for i, params in enumerate(params_list):
+            if results[i] is None:
+                results[i] = next(resp)
+                self.cache.update(params, results[i])
+                if not nolog:
+                    if "error" in results[i]:
+                        logger.warning("ERROR: %s", Redacted(results[i]))
+                    else:
+                        logger.info("RESP: %s", Redacted(results[i]))
+        return results
+
+    def refresh(self, method: str=None):
+        '''Drops cached responses so the next read goes to mm2.'''
+        self.cache.invalidate(method)
+
+    def batch(self, params_list: list=None, nolog: bool=False, refresh: bool=False):
+        '''
+        Sends params_list as a single batch request, or returns an RPCBatch
+        context manager which sends everything queued in it on exit:
+            with node.batch() as batch:
+                batch.add(params, callback)
+        '''
+        if params_list is not None:
+            return self.dexAPI_batch(params_list, nolog=nolog, refresh=refresh)
+        return RPCBatch(self, nolog=nolog, refresh=refresh)
+
     def activate_coin(self, coin: str) -> dict:
-        activation_params = requests.get(f"https://stats.kmd.io/api/atomicdex/activation_commands/?coin={coin}").json()
+        resp = self.dexAPI(self.get_activation_params(coin))
+        if "error" in resp and "already" not in str(resp["error"]):
+            self.demote_servers()
+        return resp
+
+    def demote_servers(self):
+        '''Lowers the ranking of the electrum servers used to activate the platform coin.'''
+        if self.activation_servers:
+            ElectrumRanker.shared().demote(self.platform_coin.split('-')[0], self.activation_servers)
+
+    def get_activation_params(self, coin: str) -> dict:
+        '''Returns the activation command for the segwit variant of the coin.'''
+        activation_params = ActivationParams.shared().get(coin) or {}
         if "coin" in activation_params:
             activation_params.update({"coin": self.platform_coin})
             
         if "servers" in activation_params:
-            servers = activation_params["servers"]
-            activation_params.update({"servers": [random.choice(servers)]})
-            
+            servers = ElectrumRanker.shared().rank(coin, activation_params["servers"], self.electrum_servers)
+            activation_params.update({"servers": servers})
+            self.activation_servers = servers
         else:
             logger.critical(f"Coin {coin} not found in UTXO activation params! Exiting...")
             sys.exit(1)
-        return self.dexAPI(activation_params)
+        return activation_params
 
     def get_pubkey(self):
         params = {
@@ -86,28 +201,50 @@ class LightningNode:
         self.coin_pubkey = resp["result"]["public_key"]
         return resp
 
-    def get_coin_balance(self):
+    def get_coin_balance(self, refresh: bool=False):
         params = {
             "method": "my_balance",
             "coin": self.platform_coin
         }
-        resp = self.dexAPI(params, nolog=True)
-        self.coin_address = resp["address"]
-        self.coin_balance = resp["balance"]
+        resp = self.dexAPI(params, nolog=True, refresh=refresh)
+        self.set_coin_balance(resp)
         return resp
 
-    def get_lightning_balance(self):
+    def get_lightning_balance(self, refresh: bool=False):
         params = {
             "method": "my_balance",
             "coin": self.coin
         }
-        resp = self.dexAPI(params, nolog=True)
+        resp = self.dexAPI(params, nolog=True, refresh=refresh)
+        self.set_lightning_balance(resp)
+        return resp
+
+    def get_balances(self, refresh: bool=False) -> list:
+        '''Fetches the platform coin and lightning balances in one round trip.'''
+        with self.batch(nolog=True, refresh=refresh) as batch:
+            batch.add({"method": "my_balance", "coin": self.platform_coin}, self.set_coin_balance)
+            batch.add({"method": "my_balance", "coin": self.coin}, self.set_lightning_balance)
+        return batch.results
+
+    def set_coin_balance(self, resp: dict):
+        self.coin_address = resp["address"]
+        self.coin_balance = resp["balance"]
+
+    def set_lightning_balance(self, resp: dict):
         self.lightning_address = resp["address"]
         self.lightning_balance = resp["balance"]
-        return resp
 
-    def initialize_lightning(self):
-        '''Creates a lightning node for the coin'''
+    def initialize_lightning(self, background: bool=False, deadline: float=60, on_progress=None):
+        '''
+        Creates a lightning node for the coin. The init task is polled by the
+        shared InitTracker until it is Ok or Error, or cancelled after
+        `deadline` seconds. on_progress(node, resp) is called on each status
+        change. With background=True a Future for the final status response
+        is returned immediately; use wait_initialized() or
+        asyncio.wrap_future(node.init_future) to wait for it. An init request
+        that fails then resolves the Future with its error response, rather
+        than exiting, so other coins being initialized are not affected.
+        '''
         params = {
             "method": "task::enable_lightning::init",
             "mmrpc": "2.0",
@@ -123,44 +260,58 @@ class LightningNode:
             "id": 762
         }
         resp = self.dexAPI(params)
+        error = None
         if "error" in resp:
             if resp["error"].find("already activated") == -1:
                 print(resp["error"])
-                logger.warning(f"Error intializing {self.coin}!")
-                exit(1)
-            return
-        else:
-            if "result" not in resp:
-                logger.warning(f"No result for {self.coin}!")
-                exit(1)
-            if "task_id" not in resp["result"]:
-                logger.warning(f"No task_id for {self.coin}!")
+                error = f"Error intializing {self.coin}!"
+        elif "result" not in resp:
+            error = f"No result for {self.coin}!"
+        elif "task_id" not in resp["result"]:
+            error = f"No task_id for {self.coin}!"
+        if error is not None:
+            logger.warning(error)
+            if not background:
                 exit(1)
+            resp = resp if "error" in resp else {"error": error}
+        if "error" in resp:
+            self.init_future = Future()
+            self.init_future.set_result(resp)
+            return self.init_future if background else None
         task_id = resp["result"]["task_id"]
-        i = 0
-        '''Loop status until it's either Ok or Error'''
-        while True:
-            i += 1
-            resp = self.init_lightning_status(task_id)
-            if i == 30:
-                resp = self.init_lightning_cancel(task_id)
-                break
-            if "error" in resp:
-                break
-            if resp["result"]["status"] in ["Ok", "Error"]:
-                if resp["result"]["status"] == "Ok":
-                    self.lightning_address = resp["result"]["details"]["address"]
-                    self.lightning_balance = resp["result"]["details"]["balance"]["spendable"]
-                    logger.info(f"Lightning node for {self.coin} created! Address: {self.lightning_address} Balance: {self.lightning_balance}")
-                if resp["result"]["status"] == "Error":
-                    self.lightning_address = resp["result"]["details"]["address"]
-                    self.lightning_balance = resp["result"]["details"]["balance"]["spendable"]
-                    self.coin_address = resp["result"]["details"]["address"]
-                    self.coin_balance = resp["result"]["details"]["balance"]["spendable"]
-                    self.coin_pubkey = resp["result"]["details"]["balance"]["spendable"]
-                    
-                break
-            time.sleep(2)
+        self.init_future = InitTracker.shared().track(self, task_id, deadline=deadline, on_progress=on_progress)
+        if background:
+            return self.init_future
+        return self.wait_initialized(deadline + INIT_TIMEOUT_GRACE)
+
+    def wait_initialized(self, timeout: float=None) -> dict:
+        '''
+        Blocks until a background initialize_lightning finishes, returning its
+        final status. A timeout or a failure of the tracker is returned as an
+        error response.
+        '''
+        if self.init_future is None:
+            return None
+        try:
+            return self.init_future.result(timeout)
+        except FutureTimeoutError:
+            error = f"Timed out after {timeout}s waiting for {self.coin} to initialize"
+        except Exception as e:
+            error = f"Tracking the {self.coin} init task failed: {e}"
+        logger.warning(error)
+        return {"error": error}
+
+    def apply_init_status(self, resp: dict):
+        '''Updates the node from a final `task::enable_lightning::status` response.'''
+        if "error" in resp:
+            logger.warning(f"Error initializing {self.coin}: {resp['error']}")
+        elif resp["result"]["status"] == "Ok":
+            self.lightning_address = resp["result"]["details"]["address"]
+            self.lightning_balance = resp["result"]["details"]["balance"]["spendable"]
+            logger.info(f"Lightning node for {self.coin} created! Address: {self.lightning_address} Balance: {self.lightning_balance}")
+        elif resp["result"]["status"] == "Error":
+            logger.warning(f"Error initializing {self.coin}: {resp['result']['details']}")
+            self.demote_servers()
 
     def init_lightning_status(self, task_id: int) -> dict:
         params = {
@@ -175,6 +326,20 @@ class LightningNode:
         response = self.dexAPI(params)
         return response
 
+    def init_lightning_statuses(self, task_ids: list) -> list:
+        '''Polls the status of several lightning init tasks in one round trip.'''
+        return self.dexAPI_batch([
+            {
+                "mmrpc": "2.0",
+                "method": "task::enable_lightning::status",
+                "params": {
+                    "task_id": task_id,
+                    "forget_if_finished": False
+                },
+                "id": 762
+            } for task_id in task_ids
+        ])
+
     def init_lightning_cancel(self, task_id: int) -> dict:
         params = {
             "mmrpc": "2.0",
@@ -221,7 +386,7 @@ class LightningNode:
         }
         return self.dexAPI(params)
 
-    def add_trusted_node(self):
+    def add_trusted_node(self, node_id: str) -> dict:
         params = {
             "mmrpc": "2.0",
             "method": "lightning::nodes::add_trusted_node",
@@ -260,28 +425,30 @@ class LightningNode:
 
         return self.dexAPI(params)
 
-    def update_channel(self, uuid: str, proportional_fee_in_millionths_sats: int,
-                       base_fee_msat: int, cltv_expiry_delta: int, max_dust_htlc_exposure_msat: int,
-                       force_close_avoidance_max_fee_sats: int) -> dict:
+    def update_channel(self, uuid: str, proportional_fee_in_millionths_sats: int=None,
+                       base_fee_msat: int=None, cltv_expiry_delta: int=None, max_dust_htlc_exposure_msat: int=None,
+                       force_close_avoidance_max_fee_sats: int=None, nolog: bool=False) -> dict:
+        '''Updates a channel's options. Options left as None are not sent, so mm2 keeps their current values.'''
+        channel_options = {
+            "proportional_fee_in_millionths_sats": proportional_fee_in_millionths_sats,
+            "base_fee_msat": base_fee_msat,
+            "cltv_expiry_delta": cltv_expiry_delta,
+            "max_dust_htlc_exposure_msat": max_dust_htlc_exposure_msat,
+            "force_close_avoidance_max_fee_sats": force_close_avoidance_max_fee_sats
+        }
         params = {
             "mmrpc": "2.0",
             "method": "lightning::channels::update_channel",
             "params": {
                 "coin": self.coin,
                 "uuid": uuid,
-                "channel_options": {
-                    "proportional_fee_in_millionths_sats": proportional_fee_in_millionths_sats,
-                    "base_fee_msat": base_fee_msat,
-                    "cltv_expiry_delta": cltv_expiry_delta,
-                    "max_dust_htlc_exposure_msat": max_dust_htlc_exposure_msat,
-                    "force_close_avoidance_max_fee_sats": force_close_avoidance_max_fee_sats
-                }
+                "channel_options": {k: v for k, v in channel_options.items() if v is not None}
             },
             "id": 762
         }
-        return self.dexAPI(params)
+        return self.dexAPI(params, nolog=nolog)
 
-    def list_open_channels(self):
+    def list_open_channels(self, page: int=None, limit: int=None, nolog: bool=False, cache: bool=True):
         params = {
             "mmrpc": "2.0",
             "method": "lightning::channels::list_open_channels_by_filter",
@@ -290,9 +457,13 @@ class LightningNode:
             },
             "id": 762
         }
-        return self.dexAPI(params)
+        if limit is not None:
+            params["params"].update({"limit": limit})
+        if page is not None:
+            params["params"].update({"paging_options": {"PageNumber": page}})
+        return self.dexAPI(params, nolog=nolog, cache=cache)
 
-    def list_closed_channels(self):
+    def list_closed_channels(self, page: int=None, limit: int=None, nolog: bool=False, cache: bool=True):
         params = {
             "mmrpc": "2.0",
             "method": "lightning::channels::list_closed_channels_by_filter",
@@ -301,7 +472,11 @@ class LightningNode:
             },
             "id": 762
         }
-        return self.dexAPI(params)
+        if limit is not None:
+            params["params"].update({"limit": limit})
+        if page is not None:
+            params["params"].update({"paging_options": {"PageNumber": page}})
+        return self.dexAPI(params, nolog=nolog, cache=cache)
 
     def generate_invoice(self, description: str, amount_in_msat: int=10000, expiry: int=600) -> dict:
         params = {
@@ -317,6 +492,22 @@ class LightningNode:
         }
         return self.dexAPI(params)
 
+    def generate_invoices(self, count: int, description: str, amount_in_msat: int=10000, expiry: int=600, nolog: bool=False) -> list:
+        '''Generates `count` invoices with the same terms in one round trip.'''
+        return self.dexAPI_batch([
+            {
+                "method": "lightning::payments::generate_invoice",
+                "mmrpc": "2.0",
+                "params": {
+                    "coin": self.coin,
+                    "description": description,
+                    "amount_in_msat": amount_in_msat,
+                    "expiry": expiry
+                },
+                "id": 762
+            } for i in range(count)
+        ], nolog=nolog)
+
     def send_payment(self, invoice: str="", amount_in_msat: int=0, pubkey: str="", expiry: int=24):
         params = {
             "mmrpc": "2.0",
@@ -356,6 +547,20 @@ class LightningNode:
         }
         return self.dexAPI(params)
 
+    def get_payments_details(self, payment_hashes: list, nolog: bool=False, refresh: bool=False) -> list:
+        '''Looks up several payments in one round trip, returning results in order.'''
+        return self.dexAPI_batch([
+            {
+                "method": "lightning::payments::get_payment_details",
+                "mmrpc": "2.0",
+                "params": {
+                    "coin": self.coin,
+                    "payment_hash": payment_hash
+                },
+                "id": 762
+            } for payment_hash in payment_hashes
+        ], nolog=nolog, refresh=refresh)
+
     def list_payments(self, page: int=1, limit: int=10) -> dict:
         params = {
             "method": "lightning::payments::list_payments_by_filter",
@@ -411,7 +616,66 @@ class LightningNode:
         }
         return self.dexAPI(params)
 
-    def get_claimable_balances(self, include_open_channels_balances: bool=True) -> dict:
+    def list_payments_by_filter(self, filter: dict=None, page: int=1, limit: int=10, nolog: bool=False, cache: bool=True) -> dict:
+        '''Lists one page of payments matching an mm2 payments filter, e.g. {"status": "pending"}.'''
+        params = {
+            "method": "lightning::payments::list_payments_by_filter",
+            "mmrpc": "2.0",
+            "params": {
+                "coin": self.coin,
+                "limit": limit,
+                "paging_options": {
+                    "PageNumber": page
+                }
+            },
+            "id": 762
+        }
+        if filter:
+            params["params"].update({"filter": filter})
+        return self.dexAPI(params, nolog=nolog, cache=cache)
+
+    def iter_payments(self, filter: dict=None, page_size: int=100, prefetch: int=2):
+        '''
+        Yields every payment matching filter, newest first. Up to `prefetch`
+        further pages are fetched in the background while the current page is
+        consumed, so at most prefetch + 1 pages are held in memory; with
+        prefetch=0 pages are fetched one at a time. Pages past the reported
+        total_pages are never requested, and pages are not cached. Stops at
+        the end of the history; an error page raises RuntimeError, so callers
+        can tell a cut-short walk from a complete one.
+        '''
+        executor = ThreadPoolExecutor(max_workers=max(1, prefetch), thread_name_prefix="iter_payments")
+        pending = deque()
+        next_page = 1
+
+        def fetch(page):
+            return self.list_payments_by_filter(filter, page=page, limit=page_size, nolog=True, cache=False)
+
+        try:
+            # The page count is only known from the first page, so nothing is fetched ahead of it
+            pending.append(executor.submit(fetch, next_page))
+            next_page += 1
+            while pending:
+                resp = pending.popleft().result()
+                if "error" in resp:
+                    raise RuntimeError(f"list_payments_by_filter failed: {resp['error']}")
+                payments = resp["result"]["payments"]
+                total_pages = resp["result"].get("total_pages")
+                more = payments and (total_pages is None or next_page <= total_pages)
+                while more and len(pending) < prefetch:
+                    pending.append(executor.submit(fetch, next_page))
+                    next_page += 1
+                    more = total_pages is None or next_page <= total_pages
+                yield from payments
+                if not payments:
+                    return
+                if more and not pending:
+                    pending.append(executor.submit(fetch, next_page))
+                    next_page += 1
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_claimable_balances(self, include_open_channels_balances: bool=True, nolog: bool=False, refresh: bool=False) -> dict:
         params = {
             "mmrpc": "2.0",
             "method": "lightning::channels::get_claimable_balances",
@@ -421,7 +685,42 @@ class LightningNode:
             },
             "id": 762
         }
-        return self.dexAPI(params)
+        return self.dexAPI(params, nolog=nolog, refresh=refresh)
+
+
+class RPCBatch():
+    '''
+    Queues requests for a LightningNode and sends them as one batch request.
+    Each callback is called with its own response, unless that response is an error.
+    '''
+    def __init__(self, node: LightningNode, nolog: bool=False, refresh: bool=False):
+        self.node = node
+        self.nolog = nolog
+        self.refresh = refresh
+        self.calls = []
+        self.results = []
+
+    def add(self, params: dict, callback=None) -> int:
+        '''Queues a request, returning the index of its response in results.'''
+        self.calls.append((params, callback))
+        return len(self.calls) - 1
+
+    def send(self) -> list:
+        if self.calls:
+            self.results = self.node.dexAPI_batch([params for params, _ in self.calls], nolog=self.nolog, refresh=self.refresh)
+            for (params, callback), resp in zip(self.calls, self.results):
+                if callback is not None and "error" not in resp:
+                    callback(resp)
+            self.calls = []
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.send()
+
 
 if __name__ == "__main__":
     node = LightningNode("tBTC")
\ No newline at end of file
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import socket
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from logger import CustomFormatter
+
+# create logger with 'lightning_app'
+logger = logging.getLogger("electrum_rank")
+logger.setLevel(logging.DEBUG)
+
+# create console handler with a higher log level
+handler = logging.StreamHandler()
+handler.setFormatter(CustomFormatter())
+logger.addHandler(handler)
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class ElectrumRanker():
+    '''
+    Ranks Electrum servers by probed latency (TCP/TLS connect plus a
+    `server.version` request). Scores are persisted between runs and blended
+    with new probes, with older scores counting for less the older they are.
+    Servers which fail a probe or an activation are scored as slow.
+    '''
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, rank_file=f"{PROJECT_ROOT}/electrum_rank.json", timeout=3.0, half_life=86400,
+                 failure_penalty=10.0, reprobe_after=300, max_workers=16):
+        self.rank_file = rank_file
+        self.timeout = timeout
+        self.half_life = half_life
+        self.failure_score = timeout * failure_penalty
+        self.reprobe_after = reprobe_after
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.scores = self.load()
+
+    @classmethod
+    def shared(cls):
+        '''Returns the process-wide ranker, so every node shares one ranking.'''
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def load(self) -> dict:
+        if not os.path.exists(self.rank_file):
+            return {}
+        try:
+            with open(self.rank_file, "r") as f:
+                return json.load(f)
+        except (IOError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable electrum ranking {self.rank_file}: {e}")
+            return {}
+
+    def save(self):
+        temp_file = f"{self.rank_file}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(self.scores, f, indent=4)
+        os.replace(temp_file, self.rank_file)
+
+    def probe(self, server: dict) -> float:
+        '''Returns the seconds taken to connect and get a server.version reply, or None on failure.'''
+        host, port = server["url"].rsplit(":", 1)
+        request = json.dumps({"jsonrpc": "2.0", "method": "server.version", "params": ["dex_lightning_tui", "1.4"], "id": 0})
+        started = time.perf_counter()
+        try:
+            with socket.create_connection((host, int(port)), timeout=self.timeout) as sock:
+                if server.get("protocol", "TCP").upper() in ["SSL", "WSS"]:
+                    import ssl
+                    context = ssl.create_default_context()
+                    # Only latency is measured here, mm2 does its own certificate checks
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+                    sock = context.wrap_socket(sock, server_hostname=host)
+                if server.get("protocol", "TCP").upper() != "WSS":
+                    sock.sendall(f"{request}\n".encode())
+                    if not sock.makefile("rb").readline():
+                        return None
+                return time.perf_counter() - started
+        except (OSError, ValueError) as e:
+            logger.debug(f"Electrum probe of {server['url']} failed: {e}")
+            return None
+
+    def record(self, coin: str, url: str, latency: float):
+        '''Blends a new latency (None for a failure) into the stored score for url.'''
+        now = time.time()
+        latency = self.failure_score if latency is None else latency
+        entry = self.scores.setdefault(coin, {}).get(url)
+        if entry is None:
+            score = latency
+        else:
+            # The old score counts for at most half, and less the older it is
+            weight = min(0.5, 0.5 ** ((now - entry["updated"]) / self.half_life))
+            score = weight * entry["score"] + (1 - weight) * latency
+        self.scores[coin].update({url: {"score": score, "updated": now}})
+
+    def rank(self, coin: str, servers: list, count: int=2) -> list:
+        '''Returns the `count` best servers for coin, probing them all concurrently if due.'''
+        with self.lock:
+            known = self.scores.get(coin, {})
+            due = [i for i in servers if time.time() - known.get(i["url"], {}).get("updated", 0) > self.reprobe_after]
+        if due:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(due))) as executor:
+                latencies = list(executor.map(self.probe, due))
+            with self.lock:
+                for server, latency in zip(due, latencies):
+                    self.record(coin, server["url"], latency)
+                self.save()
+        with self.lock:
+            known = self.scores.get(coin, {})
+            ranked = sorted(servers, key=lambda i: known.get(i["url"], {}).get("score", self.failure_score))
+        logger.debug(f"Electrum servers for {coin} by latency: {[i['url'] for i in ranked]}")
+        return ranked[:count]
+
+    def demote(self, coin: str, servers: list):
+        '''Records a failure for servers, e.g. after a failed activation.'''
+        with self.lock:
+            for server in servers:
+                self.record(coin, server["url"], None)
+            self.save()
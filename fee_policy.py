@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+import os
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import dex_lightning as dex
+from dex_lightning import logger
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+CHANNEL_OPTIONS = [
+    "proportional_fee_in_millionths_sats",
+    "base_fee_msat",
+    "cltv_expiry_delta",
+    "max_dust_htlc_exposure_msat",
+    "force_close_avoidance_max_fee_sats"
+]
+
+
+def local_ratio(channel: dict) -> float:
+    '''Share of the channel's balance on our side, from 0 (all remote) to 1 (all local).'''
+    outbound = channel.get("outbound_capacity_msat", 0) or 0
+    inbound = channel.get("inbound_capacity_msat", 0) or 0
+    if outbound + inbound:
+        return outbound / (outbound + inbound)
+    capacity = channel.get("funding_tx_value_sats") or 0
+    return (channel.get("balance_msat", 0) or 0) / (capacity * 1000) if capacity else 0.0
+
+
+# Channel properties a rule's "match" and a curve's "by" can refer to
+INPUTS = {
+    "local_ratio": local_ratio,
+    "capacity": lambda c: c.get("funding_tx_value_sats") or 0
+}
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# Rule "match" keys: name -> (value check, test(channel, value))
+MATCHERS = {
+    "uuid": (lambda v: isinstance(v, str), lambda c, v: c.get("uuid") == v),
+    "peer": (lambda v: isinstance(v, str), lambda c, v: (c.get("counterparty_node_id") or "").startswith(v)),
+    "min_capacity": (is_number, lambda c, v: INPUTS["capacity"](c) >= v),
+    "max_capacity": (is_number, lambda c, v: INPUTS["capacity"](c) <= v),
+    "min_local_ratio": (is_number, lambda c, v: local_ratio(c) >= v),
+    "max_local_ratio": (is_number, lambda c, v: local_ratio(c) <= v),
+    "is_public": (lambda v: isinstance(v, bool), lambda c, v: bool(c.get("is_public")) == v),
+    "is_outbound": (lambda v: isinstance(v, bool), lambda c, v: bool(c.get("is_outbound")) == v)
+}
+
+
+def interpolate(points: list, x: float) -> float:
+    '''Piecewise linear curve through sorted [x, y] points, flat beyond both ends.'''
+    if x <= points[0][0]:
+        return points[0][1]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        if x <= x1:
+            return y0 + (y1 - y0) * (x - x0) / (x1 - x0) if x1 != x0 else y1
+    return points[-1][1]
+
+
+class FeePolicy():
+    '''
+    Ordered list of declarative rules, each a dict like
+
+        {"match": {"max_local_ratio": 0.2}, "set": {"base_fee_msat": 0,
+         "proportional_fee_in_millionths_sats": {"by": "local_ratio", "points": [[0, 2000], [0.2, 500]]}}}
+
+    Every rule whose "match" conditions all hold (an empty match holds for
+    every channel) sets its options, so later rules override earlier ones;
+    a rule with "final": true stops the evaluation. An option value is an
+    integer or a piecewise linear curve over local_ratio or capacity (sats).
+    Options no rule sets are left as they are.
+    '''
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.validate()
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            if "rules" not in data:
+                raise ValueError(f"{path}: expected a list of rules or a dict with 'rules'")
+            data = data["rules"]
+        return cls(data)
+
+    def validate(self):
+        if not isinstance(self.rules, list):
+            raise ValueError("Rules must be a list")
+        for i, rule in enumerate(self.rules):
+            if not isinstance(rule, dict) or not isinstance(rule.get("match", {}), dict) \
+                    or not isinstance(rule.get("set", {}), dict):
+                raise ValueError(f"Rule {i}: must be a dict with optional 'match' and 'set' dicts")
+            unknown = [k for k in rule.get("match", {}) if k not in MATCHERS]
+            unknown += [k for k in rule.get("set", {}) if k not in CHANNEL_OPTIONS]
+            if unknown:
+                raise ValueError(f"Rule {i}: unknown keys {unknown}")
+            for name, value in rule.get("match", {}).items():
+                if not MATCHERS[name][0](value):
+                    raise ValueError(f"Rule {i}: invalid {name} value {value!r}")
+            for option, value in rule.get("set", {}).items():
+                if isinstance(value, dict):
+                    points = value.get("points")
+                    if value.get("by") not in list(INPUTS) or not isinstance(points, list) or not points \
+                            or any(not isinstance(p, list) or len(p) != 2 or not all(is_number(n) for n in p) for p in points):
+                        raise ValueError(f"Rule {i}: {option} needs 'by' in {list(INPUTS)} and numeric [x, y] 'points'")
+                    value.update({"points": sorted(points)})
+                elif not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                    raise ValueError(f"Rule {i}: {option} must be a non-negative integer or a curve")
+
+    def matches(self, rule: dict, channel: dict) -> bool:
+        return all(MATCHERS[k][1](channel, v) for k, v in rule.get("match", {}).items())
+
+    def evaluate(self, channel: dict) -> dict:
+        '''Returns the channel_options the rules ask for on this channel.'''
+        options = {}
+        for rule in self.rules:
+            if not self.matches(rule, channel):
+                continue
+            for option, value in rule.get("set", {}).items():
+                if isinstance(value, dict):
+                    value = max(0, round(interpolate(value["points"], INPUTS[value["by"]](channel))))
+                options.update({option: value})
+            if rule.get("final"):
+                break
+        return options
+
+
+class FeePolicyEngine():
+    '''
+    Applies a FeePolicy to every open channel of a node. plan() compares the
+    options the policy asks for with each channel's current ones and keeps
+    only the differences; apply() sends one update_channel per changed
+    channel, carrying only the changed options, with bounded concurrency.
+    mm2 may not report a channel's current options, so the options applied
+    by the last run are kept in a state file and used as the fallback.
+    '''
+    def __init__(self, node: dex.LightningNode, policy: FeePolicy, concurrency: int=8,
+                 state_file: str=None, page_size: int=100):
+        self.node = node
+        self.policy = policy
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.state_file = state_file or f"{PROJECT_ROOT}/{node.coin}_fee_policy_state.json"
+        self.lock = threading.Lock()
+        self.state = self.load_state()
+
+    def load_state(self) -> dict:
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file, "r") as f:
+            return json.load(f)
+
+    def save_state(self):
+        tmp = f"{self.state_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_file)
+
+    def iter_channels(self):
+        '''Yields every open channel, one page at a time.'''
+        page = 1
+        while True:
+            resp = self.node.list_open_channels(page=page, limit=self.page_size, nolog=True, cache=False)
+            if "error" in resp:
+                raise RuntimeError(f"list_open_channels failed: {resp['error']}")
+            channels = resp["result"]["open_channels"]
+            yield from channels
+            if not channels or page >= resp["result"].get("total_pages", page):
+                return
+            page += 1
+
+    def current(self, channel: dict) -> dict:
+        '''Current options: what mm2 reports, else what the last run applied.'''
+        return dict(self.state.get(channel["uuid"], {}), **(channel.get("config") or {}))
+
+    def plan(self) -> list:
+        '''Returns one entry per channel whose options differ from the policy.'''
+        changes = []
+        uuids = set()
+        for channel in self.iter_channels():
+            uuids.add(channel["uuid"])
+            current = self.current(channel)
+            diff = {
+                option: (current.get(option), value)
+                for option, value in self.policy.evaluate(channel).items()
+                if current.get(option) != value
+            }
+            if diff:
+                changes.append({
+                    "uuid": channel["uuid"],
+                    "peer": channel.get("counterparty_node_id"),
+                    "local_ratio": local_ratio(channel),
+                    "changes": diff
+                })
+        # Forget channels that have been closed since the last run
+        with self.lock:
+            self.state = {k: v for k, v in self.state.items() if k in uuids}
+        return changes
+
+    def update(self, change: dict) -> bool:
+        options = {option: new for option, (old, new) in change["changes"].items()}
+        try:
+            resp = self.node.update_channel(change["uuid"], nolog=True, **options)
+        except Exception as e:
+            logger.warning(f"update_channel {change['uuid']} failed: {e}")
+            return False
+        if "error" in resp:
+            logger.warning(f"update_channel {change['uuid']} failed: {resp['error']}")
+            return False
+        with self.lock:
+            self.state.update({change["uuid"]: dict(self.state.get(change["uuid"], {}), **options)})
+        return True
+
+    def apply(self, changes: list) -> dict:
+        '''Sends the planned updates, returning counts of updated and failed channels.'''
+        results = []
+        if changes:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                results = list(executor.map(self.update, changes))
+        self.save_state()
+        return {"updated": results.count(True), "failed": results.count(False)}
+
+    def run(self, dry_run: bool=False) -> tuple:
+        '''Plans and, unless dry_run, applies. Returns (changes, result).'''
+        changes = self.plan()
+        if dry_run:
+            return changes, {"updated": 0, "failed": 0}
+        return changes, self.apply(changes)
+
+    @staticmethod
+    def format_diff(changes: list) -> list:
+        '''Renders a plan as one line per changed option.'''
+        lines = []
+        for change in changes:
+            lines.append(f"{change['uuid']}  peer {(change['peer'] or '')[:16]}  local {change['local_ratio']:.0%}")
+            for option, (old, new) in change["changes"].items():
+                lines.append(f"    {option}: {'unset' if old is None else old} -> {new}")
+        return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set channel fees on every open channel from a JSON rule file.")
+    parser.add_argument("policy", help="JSON file with a list of rules (or {\"rules\": [...]}).")
+    parser.add_argument("-c", "--coin", help="lightning coin, e.g. tBTC.", default="tBTC")
+    parser.add_argument("-j", "--concurrency", help="update_channel requests in flight at once.", type=int, default=8)
+    parser.add_argument("-n", "--dry-run", help="print the changes without sending them.", action="store_true")
+    parser.add_argument("--state-file", help="options applied by previous runs.", default=None)
+    parser.add_argument("--dex-url", help="AtomicDEX API url.", default="http://127.0.0.1:7783")
+    args = parser.parse_args()
+
+    node = dex.LightningNode(args.coin, dex_url=args.dex_url, activate=False)
+    engine = FeePolicyEngine(node, FeePolicy.load(args.policy), concurrency=args.concurrency, state_file=args.state_file)
+    changes, result = engine.run(dry_run=args.dry_run)
+    for line in FeePolicyEngine.format_diff(changes):
+        print(line)
+    logger.info(f"{len(changes)} channels to update{' (dry run)' if args.dry_run else ''}: {result}")
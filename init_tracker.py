@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import time
+import threading
+from concurrent.futures import Future
+
+# Polling starts fast and backs off, as most tasks finish within a few polls
+INITIAL_INTERVAL = 0.1
+MAX_INTERVAL = 2.0
+BACKOFF = 1.5
+
+
+class InitTask():
+    def __init__(self, node, task_id: int, deadline: float, on_progress=None):
+        self.node = node
+        self.task_id = task_id
+        self.deadline = time.monotonic() + deadline
+        self.on_progress = on_progress
+        self.future = Future()
+        self.interval = INITIAL_INTERVAL
+        self.next_poll = time.monotonic() + INITIAL_INTERVAL
+        self.last_status = None
+
+
+class InitTracker():
+    '''
+    Polls pending `task::enable_lightning` tasks from a single background
+    thread, with adaptive backoff and a deadline per task. Due tasks that
+    share a transport are polled together in one batch request. Each task
+    resolves a Future with its final status response (or the cancel
+    response if its deadline passes).
+    '''
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self.tasks = []
+        self.cond = threading.Condition()
+        self.thread = None
+
+    @classmethod
+    def shared(cls):
+        '''Returns the process-wide tracker, so every node is polled by one thread.'''
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def track(self, node, task_id: int, deadline: float=60, on_progress=None) -> Future:
+        '''
+        Starts tracking task_id for node. on_progress(node, resp) is called
+        from the tracker thread whenever the task status changes.
+        '''
+        task = InitTask(node, task_id, deadline, on_progress)
+        with self.cond:
+            self.tasks.append(task)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="InitTracker", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+        return task.future
+
+    def run(self):
+        try:
+            while True:
+                with self.cond:
+                    while True:
+                        if not self.tasks:
+                            self.thread = None
+                            return
+                        now = time.monotonic()
+                        due = [i for i in self.tasks if i.next_poll <= now]
+                        if due:
+                            break
+                        self.cond.wait(min(i.next_poll for i in self.tasks) - now)
+                for group in self.group_by_transport(due):
+                    self.poll(group)
+        finally:
+            with self.cond:
+                # Should the loop itself fail, no task is left waiting on a dead thread
+                if self.thread is threading.current_thread():
+                    self.thread = None
+                    for task in list(self.tasks):
+                        self.fail(task, RuntimeError("InitTracker stopped unexpectedly"))
+
+    def group_by_transport(self, tasks: list) -> list:
+        groups = {}
+        for task in tasks:
+            groups.setdefault(id(task.node.transport), []).append(task)
+        return list(groups.values())
+
+    def poll(self, tasks: list):
+        try:
+            responses = tasks[0].node.init_lightning_statuses([i.task_id for i in tasks])
+        except Exception as e:
+            responses = [{"error": f"Status request failed: {e}"} for i in tasks]
+        for task, resp in zip(tasks, responses):
+            try:
+                self.update(task, resp)
+            except Exception as e:
+                self.fail(task, e)
+
+    def update(self, task: InitTask, resp: dict):
+        status = resp.get("result", {}).get("status") if "error" not in resp else "Error"
+        if status != task.last_status or status in ["Ok", "Error"]:
+            task.last_status = status
+            if task.on_progress is not None:
+                try:
+                    task.on_progress(task.node, resp)
+                except Exception:
+                    pass
+        if "error" in resp or status in ["Ok", "Error"]:
+            task.node.apply_init_status(resp)
+            self.finish(task, resp)
+        elif time.monotonic() >= task.deadline:
+            resp = task.node.init_lightning_cancel(task.task_id)
+            task.node.demote_servers()
+            self.finish(task, resp)
+        else:
+            task.interval = min(task.interval * BACKOFF, MAX_INTERVAL)
+            task.next_poll = min(time.monotonic() + task.interval, task.deadline)
+
+    def finish(self, task: InitTask, resp: dict):
+        with self.cond:
+            self.tasks.remove(task)
+        task.future.set_result(resp)
+
+    def fail(self, task: InitTask, exc: Exception):
+        with self.cond:
+            if task in self.tasks:
+                self.tasks.remove(task)
+        if not task.future.done():
+            task.future.set_exception(exc)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import time
+import threading
+from collections import deque
+from dex_lightning import logger
+
+
+class InvoicePool():
+    '''
+    Keeps a number of ready invoices per (amount, description) template so
+    checkout never waits on mm2. A background thread refills each template
+    in batch requests, and invoices are retired `retire_margin` seconds
+    before they expire. take() is O(1) and falls back to generating an
+    invoice on demand only when the pool for that template is empty.
+    '''
+    def __init__(self, node, size: int=10, batch_size: int=10, expiry: int=3600, retire_margin: int=60,
+                 refill_interval: float=5):
+        self.node = node
+        self.size = size
+        self.batch_size = batch_size
+        self.expiry = expiry
+        self.retire_margin = retire_margin
+        self.refill_interval = refill_interval
+        self.templates = {}
+        self.pools = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.stats = {"taken": 0, "misses": 0, "retired": 0, "generated": 0}
+
+    def add_template(self, amount_in_msat: int, description: str, size: int=None, expiry: int=None) -> tuple:
+        '''Starts pooling invoices for amount_in_msat and description, returning the template key.'''
+        key = (amount_in_msat, description)
+        expiry = self.expiry if expiry is None else expiry
+        # Invoices are retired retire_margin seconds before expiry, so a shorter one would be regenerated endlessly
+        if expiry <= self.retire_margin:
+            raise ValueError(f"expiry must be longer than the {self.retire_margin}s retire margin, got {expiry}")
+        with self.lock:
+            self.templates.update({key: {
+                "amount_in_msat": amount_in_msat,
+                "description": description,
+                "size": self.size if size is None else size,
+                "expiry": expiry
+            }})
+            self.pools.setdefault(key, deque())
+        self.wakeup.set()
+        return key
+
+    def start(self):
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name="InvoicePool", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while not self.stopped.is_set():
+            # Cleared before refilling, so a take() during the refill wakes the next one
+            self.wakeup.clear()
+            try:
+                self.refill()
+            except Exception as e:
+                logger.warning(f"Invoice pool refill failed: {e}")
+            self.wakeup.wait(self.refill_interval)
+
+    def retire(self, key: tuple) -> int:
+        '''Drops invoices near expiry from the head of a pool. Call with the lock held.'''
+        pool = self.pools[key]
+        now = time.time()
+        retired = 0
+        while pool and pool[0]["retire_at"] <= now:
+            pool.popleft()
+            retired += 1
+        self.stats["retired"] += retired
+        return retired
+
+    def refill(self):
+        '''Tops every template up to its size, batch_size invoices per request.'''
+        for key, template in list(self.templates.items()):
+            while not self.stopped.is_set():
+                with self.lock:
+                    self.retire(key)
+                    missing = template["size"] - len(self.pools[key])
+                if missing <= 0:
+                    break
+                created_at = time.time()
+                responses = self.node.generate_invoices(
+                    min(missing, self.batch_size),
+                    template["description"],
+                    amount_in_msat=template["amount_in_msat"],
+                    expiry=template["expiry"],
+                    nolog=True
+                )
+                invoices = [
+                    dict(i["result"], retire_at=created_at + template["expiry"] - self.retire_margin)
+                    for i in responses if "result" in i
+                ]
+                with self.lock:
+                    self.pools[key].extend(invoices)
+                    self.stats["generated"] += len(invoices)
+                if not invoices:
+                    logger.warning(f"Could not generate invoices for {key}: {responses[:1]}")
+                    break
+
+    def take(self, amount_in_msat: int, description: str) -> dict:
+        '''
+        Returns an unused invoice ({"payment_hash", "invoice"}) for the
+        template, generating one on demand if its pool is empty.
+        '''
+        key = (amount_in_msat, description)
+        with self.lock:
+            if key in self.pools:
+                self.retire(key)
+                pool = self.pools[key]
+                if pool:
+                    invoice = pool.popleft()
+                    self.stats["taken"] += 1
+                    if len(pool) <= self.templates[key]["size"] // 2:
+                        self.wakeup.set()
+                    return {"payment_hash": invoice["payment_hash"], "invoice": invoice["invoice"]}
+            self.stats["misses"] += 1
+            expiry = self.templates.get(key, {}).get("expiry", self.expiry)
+        self.wakeup.set()
+        resp = self.node.generate_invoice(description, amount_in_msat=amount_in_msat, expiry=expiry)
+        return resp.get("result")
+
+    def available(self) -> dict:
+        '''Returns the number of ready invoices per template.'''
+        with self.lock:
+            return {key: len(pool) for key, pool in self.pools.items()}
@@ -1,8 +1,17 @@
 #!/usr/bin/env python3
 import sys
 import logging
-from logger import CustomFormatter
+from logger import CustomFormatter, flush_logs
 import dex_lightning as dex
+from node_manager import NodeManager
+from payment_store import PaymentStore
+from bulk_pay import BulkPayer
+from invoice_pool import InvoicePool
+from payment_watcher import PaymentWatcher
+from status_refresher import StatusRefresher
+from metrics import RPCMetrics
+from fee_policy import CHANNEL_OPTIONS, FeePolicy, FeePolicyEngine
+from claimable import ClaimableAggregator, CATEGORY_ORDER
 
 # create logger with 'lightning_app'
 logger = logging.getLogger("lib_tui")
@@ -14,7 +23,15 @@ handler.setFormatter(CustomFormatter())
 logger.addHandler(handler)
 
 
+# Set by the full-screen front end to answer prompts itself instead of input()
+input_hook = None
+
+
 def color_input(msg):
+  if input_hook is not None:
+      return input_hook(msg)
+  # Let queued log lines print before the prompt
+  flush_logs()
   return input(colorize(msg, "orange"))
 
 
@@ -46,54 +63,99 @@ def colorize(string, color):
 
 
 class LightningTUI():
-    def __init__(self, coin: str=None, node: dex.LightningNode=None):
+    def __init__(self, coin: str=None, node: dex.LightningNode=None, refresh_interval: float=10):
         self.menu_items = [
             {"Initialize Lightning": self.start_lightning},
+            {"Switch Lightning Node": self.switch_node},
             {"Connect to Lightning Node": self.connect_to_node},
             {"Add Trusted Node": self.add_trusted_node},
             {"Remove Trusted Node": self.remove_trusted_node},
             {"List Trusted Nodes": self.list_trusted_nodes},
             {"Open Channel": self.open_channel},
             {"Update Channel": self.update_channel},
+            {"Apply Fee Policy": self.apply_fee_policy},
             {"List Open Channels": self.list_open_channels},
             {"List Closed Channels": self.list_closed_channels},
             {"Generate Invoice": self.generate_invoice},
+            {"Point of Sale": self.point_of_sale},
             {"Pay Invoice": self.pay_invoice},
             {"Pay Keysend": self.pay_keysend},
+            {"Bulk Pay from File": self.bulk_pay},
             {"List Payments": self.list_payments},
+            {"Channel Analytics": self.channel_analytics},
             {"View Payment Details": self.get_payment_details},
             {"Get Claimable Balances": self.get_claimable_balances},
+            {"Metrics": self.get_metrics},
             {"View Lightning Explorers": self.get_lightning_explorers},
             {"Grab a coffee from StarBlocks": self.get_coffee},
             {"Help!": self.get_help},
             {"Exit TUI": self.exit_tui}
         ]
+        # Actions after which the status header is refreshed straight away
+        self.write_actions = [
+            self.start_lightning, self.switch_node, self.connect_to_node, self.open_channel, self.update_channel,
+            self.apply_fee_policy, self.generate_invoice, self.point_of_sale, self.pay_invoice, self.pay_keysend, self.bulk_pay
+        ]
         self.coin = coin
         self.port = None
         self.name = None
         self.color = None
+        self.manager = NodeManager()
+        if node is not None:
+            self.manager.add_node(coin or node.platform_coin.split('-')[0], node)
         self.node = node
-        self.status = self.get_status()
+        self.stores = {}
+        self.watchers = {}
+        self.invoice_pools = {}
+        self.claimables = {}
+        self.status = {"lightning_status": "Not Initialized"}
+        self.refresher = StatusRefresher(self.get_status, refresh_interval, initial=self.status).start()
 
     def start_lightning(self):
-        
-        if self.status['lightning_status'] == "Initialized":
-            return
-        self.coin = color_input(" Select coin to initialize lightning [tBTC, BTC, LTC]: ") or "tBTC"
-        while self.coin not in ["tBTC", "BTC", "LTC"]:
-            logging.warning("Invalid coin selection. Please try again.")
-            self.coin = color_input(" Select coin to initialize lightning [tBTC, BTC, LTC]: ") or "tBTC"
+        coins = []
+        while not coins:
+            selected = color_input(" Select coins to initialize lightning, comma separated [tBTC, BTC, LTC]: ") or "tBTC"
+            coins = [i.strip() for i in selected.split(",") if i.strip()]
+            if [i for i in coins if i not in ["tBTC", "BTC", "LTC"]]:
+                logging.warning("Invalid coin selection. Please try again.")
+                coins = []
+        coins = [i for i in coins if i not in self.manager.nodes]
+        if not coins:
+            return self.node
+        dex.get_userpass(ask=color_input)
         self.port = color_input(" Select lightning port [9735]: ") or "9735"
         self.name = color_input(" Select lightning node name: ") or "dragonhound-lightning"
         self.color = color_input(" Select lightning node color (in hex): ") or "000000"
-        self.node = dex.LightningNode(
-            coin=self.coin,
+        self.manager.start(
+            coins,
             port=self.port,
             name=self.name,
-            color=self.color
+            color=self.color,
+            on_progress=self.show_init_progress
         )
-        self.status = self.get_status()
+        self.coin = self.manager.active
+        self.node = self.manager.node
+        for node in self.manager.nodes.values():
+            self.get_store(node)
         return self.node
+
+    def switch_node(self):
+        if not self.manager.nodes:
+            print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
+            return
+        coins = list(self.manager.nodes)
+        coin = color_input(f" Select lightning node {coins}: ") or self.manager.active
+        if coin not in coins:
+            logger.warning(f"No lightning node for {coin}.")
+            return
+        self.coin = coin
+        self.node = self.manager.switch(coin)
+
+    def show_init_progress(self, node, resp):
+        if "error" in resp:
+            print(colorize(f"{' '*6}{node.coin}: {resp['error']}", "red"))
+        else:
+            print(colorize(f"{' '*6}{node.coin}: {resp['result']['status']} {resp['result']['details']}", "cyan"))
     
     def get_coffee(self):
         print(colorize(f"{' '*6}Once you:", "cyan"))
@@ -117,6 +179,50 @@ class LightningTUI():
         print(colorize(f"{' '*6}https://explorer.acinq.co/", "green"))
 
 
+    def get_store(self, node: dex.LightningNode=None) -> PaymentStore:
+        '''Returns the local payment store for a node (default: the active one), starting its background sync.'''
+        node = node or self.node
+        if node is None:
+            return None
+        if node.coin not in self.stores:
+            self.stores.update({node.coin: PaymentStore(node).start()})
+        return self.stores[node.coin]
+
+    def get_claimable(self, node: dex.LightningNode=None) -> ClaimableAggregator:
+        '''Returns the claimable balance totals for a node (default: the active one).'''
+        node = node or self.node
+        if node.coin not in self.claimables:
+            self.claimables.update({node.coin: ClaimableAggregator()})
+        return self.claimables[node.coin]
+
+    def get_watcher(self, node: dex.LightningNode=None) -> PaymentWatcher:
+        '''Returns the payment watcher for a node (default: the active one).'''
+        node = node or self.node
+        if node.coin not in self.watchers:
+            self.watchers.update({node.coin: PaymentWatcher(node)})
+        return self.watchers[node.coin]
+
+    def get_invoice_pool(self, node: dex.LightningNode=None) -> InvoicePool:
+        '''Returns the invoice pool for a node (default: the active one), starting its background refill.'''
+        node = node or self.node
+        if node.coin not in self.invoice_pools:
+            self.invoice_pools.update({node.coin: InvoicePool(node).start()})
+        return self.invoice_pools[node.coin]
+
+    def watch_payment(self, resp: dict):
+        '''Reports status changes of a payment or invoice in the background, keeping the store current.'''
+        if "result" not in resp:
+            return
+        node = self.node
+        store = self.get_store(node)
+
+        def on_status(payment_hash, old_status, new_status, details):
+            logger.info(f"Payment {payment_hash} is {new_status}")
+            if details is not None:
+                store.add_payment(details)
+
+        self.get_watcher(node).watch(resp["result"]["payment_hash"], on_status, status="pending")
+
     def get_coin_balance(self):
         return self.node.get_coin_balance()
     
@@ -126,13 +232,27 @@ class LightningTUI():
     def get_pubkey(self):
         return self.node.get_pubkey()
     
+    def run_action(self, index: int):
+        '''Runs a menu item, asking for a status refresh if it changed node state.'''
+        action = list(self.menu_items[index].values())[0]
+        try:
+            return action()
+        finally:
+            if action in self.write_actions:
+                self.refresher.refresh()
+
+    def get_status_snapshot(self) -> tuple:
+        '''Returns the last refreshed status and its age in seconds, without any RPC.'''
+        return self.refresher.snapshot()
+
     def get_status(self):
         if self.node is None:
             return {"lightning_status": "Not Initialized"}
         if self.node.coin_pubkey is None:
             self.get_pubkey()
-        self.get_coin_balance()
-        self.get_lightning_balance()
+        self.manager.get_balances()
+        claimable = self.get_claimable()
+        claimable.refresh(self.node, self.stores.get(self.node.coin))
 
         self.status = {
             "coin": self.node.coin,
@@ -145,7 +265,10 @@ class LightningTUI():
             "lightning_port": self.node.port,
             "lightning_name": self.node.name,
             "lightning_color": self.node.color,
-            "lightning_status": "Initialized"
+            "lightning_status": "Initialized",
+            "nodes": list(self.manager.nodes),
+            "active_node": self.manager.active,
+            "claimable": claimable.summary()
         }
         return self.status
 
@@ -155,7 +278,6 @@ class LightningTUI():
             return
         node_address = color_input(" Enter lightning node address to connect to: ") or "038863cf8ab91046230f561cd5b386cbff8309fa02e3f0c3ed161a3aeb64a643b9@203.132.94.196:9735"
         self.node.connect_to_node(node_address)
-        self.status = self.get_status()
     
     def open_channel(self):
         if self.node is None:
@@ -169,20 +291,36 @@ class LightningTUI():
             logger.warning(" Lightning not initialized. Please initialize lightning first.")
             return
         uuid = color_input(" Enter channel uuid: ")
-        proportional_fee_in_millionths_sats = color_input(" Enter proportional_fee_in_millionths_sats: ")
-        base_fee_msat = color_input(" Enter base_fee_msat: ")
-        cltv_expiry_delta = color_input(" Enter cltv_expiry_delta: ")
-        max_dust_htlc_exposure_msat = color_input(" Enter max_dust_htlc_exposure_msat: ")
-        force_close_avoidance_max_fee_sats = color_input(" Enter force_close_avoidance_max_fee_sats: ")
-        self.node.update_channel(
-            uuid=uuid,
-            proportional_fee_in_millionths_sats=proportional_fee_in_millionths_sats,
-            base_fee_msat=base_fee_msat,
-            cltv_expiry_delta=cltv_expiry_delta,
-            max_dust_htlc_exposure_msat=max_dust_htlc_exposure_msat,
-            force_close_avoidance_max_fee_sats=force_close_avoidance_max_fee_sats
-        )
-    
+        options = {}
+        for option in CHANNEL_OPTIONS:
+            while option not in options:
+                value = color_input(f" Enter {option} (Enter to keep): ")
+                try:
+                    options.update({option: int(value) if value else None})
+                except ValueError:
+                    logger.warning(f"Invalid {option} (must be an integer). Please try again.")
+        self.node.update_channel(uuid=uuid, **options)
+
+    def apply_fee_policy(self):
+        if self.node is None:
+            logger.warning(" Lightning not initialized. Please initialize lightning first.")
+            return
+        path = color_input(" Enter fee policy file [fee_policy.json]: ") or "fee_policy.json"
+        try:
+            engine = FeePolicyEngine(self.node, FeePolicy.load(path))
+            changes = engine.plan()
+        except (OSError, ValueError, RuntimeError) as e:
+            logger.warning(f"Could not apply fee policy: {e}")
+            return
+        if not changes:
+            print(colorize(f"{' '*6}Every channel already matches the policy.", "cyan"))
+            return
+        for line in FeePolicyEngine.format_diff(changes):
+            print(colorize(f"{' '*6}{line}", "table"))
+        if color_input(f" Update {len(changes)} channels? [y/N]: ").lower() not in ["y", "yes"]:
+            return
+        logger.info(f"Fee policy applied: {engine.apply(changes)}")
+
     def generate_invoice(self):
         if self.node is None:
             print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
@@ -202,18 +340,49 @@ class LightningTUI():
             except:
                 logger.warning("Invalid expiry (must be an integer). Please try again.")
 
-        self.node.generate_invoice(
+        self.watch_payment(self.node.generate_invoice(
             description=description,
             amount_in_msat=amount_in_msat,
             expiry=expiry
-        )
+        ))
     
+    def point_of_sale(self):
+        '''Hands out invoices for one amount and description from a pre-generated pool, one per Enter.'''
+        if self.node is None:
+            print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
+            return
+        description = color_input(" Enter description: ")
+        amount_in_msat = None
+        while amount_in_msat is None:
+            try:
+                amount_in_msat = int(color_input(" Enter amount_in_msat: "))
+            except:
+                logger.warning("Invalid amount_in_msat (must be an integer). Please try again.")
+
+        size = None
+        while size is None:
+            try:
+                size = int(color_input(" Enter invoices to keep ready [10]: ") or 10)
+            except:
+                logger.warning("Invalid number of invoices (must be an integer). Please try again.")
+
+        pool = self.get_invoice_pool()
+        pool.add_template(amount_in_msat, description, size=size)
+        while color_input(" Press Enter for the next invoice, or q to quit: ").strip().lower() != "q":
+            invoice = pool.take(amount_in_msat, description)
+            if invoice is None:
+                logger.warning("Could not generate an invoice.")
+                continue
+            print(colorize(f"{' '*6}{invoice['invoice']}", "green"))
+            self.watch_payment({"result": invoice})
+        logger.info(f"Invoice pool: {pool.stats}")
+
     def pay_invoice(self):
         if self.node is None:
             print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
             return
         invoice = color_input(" Enter invoice: ")
-        self.node.send_payment(invoice=invoice)
+        self.watch_payment(self.node.send_payment(invoice=invoice))
     
     def pay_keysend(self):
         if self.node is None:
@@ -235,23 +404,51 @@ class LightningTUI():
             except:
                 logger.warning("Invalid expiry (must be an integer). Please try again.")
 
-        self.node.send_payment(
+        self.watch_payment(self.node.send_payment(
             amount_in_msat=amount_in_msat,
             pubkey=pubkey,
             expiry=expiry
-        )
+        ))
     
+    def bulk_pay(self):
+        if self.node is None:
+            print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
+            return
+        path = color_input(" Enter CSV or JSONL file of invoices / keysend targets: ")
+        try:
+            targets = BulkPayer.load_targets(path)
+        except (IOError, ValueError) as e:
+            logger.warning(f"Could not read {path}: {e}")
+            return
+        results_file = color_input(" Enter results file (used to resume) [<file>.results.jsonl]: ") or f"{path.rsplit('.', 1)[0]}.results.jsonl"
+        concurrency = None
+        while concurrency is None:
+            try:
+                concurrency = int(color_input(" Enter payments in flight at once [4]: ") or 4)
+            except:
+                logger.warning("Invalid concurrency (must be an integer). Please try again.")
+        payer = BulkPayer(self.node, results_file, concurrency=concurrency)
+        logger.info(f"Bulk payment results: {payer.run(targets)} (details in {results_file})")
+
     def list_open_channels(self):
         if self.node is None:
             print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
             return
-        self.node.list_open_channels()
+        self.show_table("open")
     
     def list_closed_channels(self):
         if self.node is None:
             print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
             return
-        self.node.list_closed_channels()
+        self.show_table("closed")
+
+    def show_table(self, kind: str):
+        '''Pages through open or closed channels or payments, from the local store once it has synced.'''
+        # Imported here as table_view itself uses colorize and color_input from this module
+        from table_view import TableView, StoreSource, RPCSource
+        store = self.get_store()
+        source = StoreSource(store, kind) if store.synced else RPCSource(self.node, kind)
+        TableView(source).run()
 
     def list_trusted_nodes(self):
         if self.node is None:
@@ -278,21 +475,97 @@ class LightningTUI():
             print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
             return
         payment_hash = color_input(" Enter payment_hash: ") or "414f9b3524fc4e48c99f2723952732d8bc2eba1b35ce3bf2a70f5144b40f599e"
-        self.node.get_payment_details(payment_hash)
+        store = self.get_store()
+        payment = store.get_payment(payment_hash)
+        if payment is not None and payment["status"] != "pending":
+            logger.info(f"PAYMENT (local): {payment}")
+            return
+        resp = self.node.get_payment_details(payment_hash)
+        if "result" in resp:
+            store.add_payment(resp["result"]["payment_details"])
     
     def list_payments(self):
         if self.node is None:
             print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
             return
-        self.node.list_payments()
+        self.show_table("payments")
     
+    def channel_analytics(self):
+        if self.node is None:
+            print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
+            return
+        # Imported here to keep NumPy out of the TUI's startup time
+        from channel_analytics import ChannelAnalytics, COLUMNS
+        store = self.get_store()
+        if not store.synced:
+            store.sync()
+        days = None
+        while days is None:
+            try:
+                days = float(color_input(" Enter window in days [30]: ") or 30)
+            except ValueError:
+                logger.warning("Invalid window (must be a number). Please try again.")
+        sort = color_input(f" Sort by {COLUMNS[2:]} [turnover]: ") or "turnover"
+        if sort not in COLUMNS[2:]:
+            logger.warning(f"Unknown column {sort}, sorting by turnover.")
+            sort = "turnover"
+        analytics = ChannelAnalytics.from_store(store, window=int(days * 86400))
+        totals = analytics.totals()
+        print(colorize(f"{' '*6}{'uuid':<14}{'peer':<14}{'capacity':>11}{'local':>7}{'sent sats':>12}{'pays':>6}{'turnover':>10}{'util':>6}{'idle':>8}", "cyan"))
+        for i in analytics.rows(sort):
+            idle = "never" if i["idle_seconds"] is None else f"{i['idle_seconds'] / 86400:.1f}d"
+            local = "-" if i["local_ratio"] is None else f"{i['local_ratio']:.0%}"
+            turnover = "-" if i["turnover"] is None else f"{i['turnover']:.2f}"
+            color = "red" if i["idle_seconds"] is None or i["idle_seconds"] > 7 * 86400 else "table"
+            print(colorize(
+                f"{' '*6}{i['uuid'][:12]:<14}{i['counterparty_node_id'][:12]:<14}{i['capacity_sats']:>11}{local:>7}"
+                f"{i['sent_msat'] // 1000:>12}{i['payments']:>6}{turnover:>10}{i['utilization']:>6.0%}{idle:>8}", color
+            ))
+        print(colorize(
+            f"{' '*6}{totals['channels']} channels, {totals['idle_channels']} idle over 7 days, "
+            f"{totals['sent_msat'] // 1000} sats sent ({totals['unattributed_sent_msat'] // 1000} to non-peers), "
+            f"{totals['received_msat'] // 1000} sats received in {totals['received_payments']} payments", "cyan"
+        ))
+        path = color_input(" Export to JSON or CSV file (Enter to skip): ")
+        if path:
+            analytics.write(path, sort)
+            logger.info(f"Channel analytics written to {path}")
+
     def get_claimable_balances(self):
         if self.node is None:
             print(colorize(" Lightning not initialized. Please initialize lightning first.", "red"))
             return
-        include_open_channels_balances  = color_input(" Enter include_open_channels_balances: ") or True
-        self.node.get_claimable_balances(include_open_channels_balances)
-    
+        include_open_channels_balances = color_input(" Include open channel balances? [Y/n]: ").lower() not in ["n", "no", "false", "0"]
+        resp = self.node.get_claimable_balances(include_open_channels_balances)
+        if "error" in resp or not include_open_channels_balances:
+            return
+        claimable = self.get_claimable()
+        claimable.update_balances(resp["result"])
+        claimable.update_unclaimed(self.get_store().unclaimed_channels())
+        snapshot = claimable.snapshot()
+        for category in CATEGORY_ORDER:
+            print(colorize(f"{' '*6}{category:<12}{snapshot['totals'][category]:>14} sats{snapshot['counts'][category]:>6} outputs", "table"))
+        if snapshot["unclaimed_channels"]:
+            print(colorize(f"{' '*6}{snapshot['unclaimed_channels']} closed channels not claimed yet ({snapshot['unclaimed_sats']} sats)", "cyan"))
+
+    def get_metrics(self):
+        metrics = RPCMetrics.shared()
+        rows = metrics.summary()
+        if not rows:
+            print(colorize(f"{' '*6}No RPCs sent yet.", "cyan"))
+            return
+        print(colorize(f"{' '*6}{'method':<46}{'calls':>7}{'cached':>8}{'errors':>8}{'avg ms':>9}{'p50 ms':>9}{'p99 ms':>9}{'total s':>9}{'share':>7}", "cyan"))
+        for i in rows:
+            color = "red" if i["errors"] else "table"
+            print(colorize(
+                f"{' '*6}{i['method']:<46}{i['calls']:>7}{i['cache_hits']:>8}{i['errors']:>8}{i['avg_ms']:>9.1f}"
+                f"{i['p50_ms']:>9.1f}{i['p99_ms']:>9.1f}{i['total_s']:>9.2f}{i['share']:>7.0%}", color
+            ))
+        path = color_input(" Write Prometheus metrics to file (Enter to skip): ")
+        if path:
+            metrics.write(path)
+            logger.info(f"Metrics written to {path}")
+
     def exit_tui(self):
         print(colorize(" Exiting TUI", "red"))
         sys.exit()
@@ -1,7 +1,42 @@
 #!/usr/bin/env python3
-import os
 import time
+# Taken before the other imports, so the startup report includes them
+STARTED = time.perf_counter()
+import sys
+import queue
+import argparse
+import threading
+import lib_tui
+import screen
 from lib_tui import LightningTUI, colorize, color_input
+from screen import Screen
+from logger import json_log, flush_logs
+from metrics import RPCMetrics
+
+
+class StartupTimer():
+    '''Records how long each startup phase took, up to the first interactive frame.'''
+    def __init__(self, start: float):
+        self.start = start
+        self.last = start
+        self.phases = []
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def total_ms(self) -> float:
+        return (self.last - self.start) * 1000
+
+    def report(self) -> str:
+        lines = [f"{' '*6}{phase:<12}{elapsed * 1000:8.1f} ms" for phase, elapsed in self.phases]
+        lines.append(f"{' '*6}{'total':<12}{self.total_ms():8.1f} ms")
+        return "\n".join(["Startup time by phase:"] + lines)
+
+
+startup = StartupTimer(STARTED)
+startup.mark("imports")
 
 header = '''
                         _                  _      _____  ________   __  
@@ -19,43 +54,229 @@ header = '''
                                            __/ |                               __/ |
                                           |___/                               |___/   
 '''
+header_lines = header.strip("\n").split("\n")
 author = '{:^100}'.format('AtomicDEX Lightning TUI v0.1 by Dragonhound')
 
 
-def main():
-    tui = LightningTUI()
-    status = tui.get_status()
+def format_age(age):
+    if age is None:
+        return "refreshing..."
+    if age < 60:
+        return f"updated {int(age)}s ago"
+    return f"updated {int(age // 60)}m ago"
+
+
+def status_lines(status, age, width=100):
+    if status['lightning_status'] != "Initialized":
+        return [colorize(f"{'Lightning not initialized. Please initialize lightning first.':^{width}}", "red")]
+    lines = [
+        f"[{status['lightning_name']} | {status['lightning_status']} | Port {status['lightning_port']} | Color #{status['lightning_color']}]",
+        f"[{status['platform_coin']} | {status['coin_address']} | {status['coin_balance']}]",
+        f"[{status['coin']} | {status['lightning_address']} | {status['lightning_balance']}]"
+    ]
+    if len(status['nodes']) > 1:
+        nodes = ' | '.join([f"{i}*" if i == status['active_node'] else i for i in status['nodes']])
+        lines.append(f"[Nodes: {nodes}]")
+    if status.get('claimable'):
+        lines.append(f"[{status['claimable']}]")
+    lines = [colorize(f"{i:^{width}}", 'orange') for i in lines]
+    lines.append(colorize(f"{f'[Status {format_age(age)}]':^{width}}", 'darkgrey'))
+    return lines
+
+
+class PromptCancelled(Exception):
+    pass
+
+
+class FullScreenTUI():
+    '''
+    Full-screen front end for LightningTUI. Menu actions run on a worker
+    thread and their output (prints and console logs) goes to a scrollable
+    pane, so the screen keeps redrawing and taking keys while an RPC is in
+    flight. Prompts from color_input are answered on the bottom line.
+    Only rows that changed are rewritten on each frame.
+
+    Keys: up/down (or k/j) and left/right to select, digits to jump to an
+    item, Enter to run it, PgUp/PgDn/Home/End to scroll the output, q to quit.
+    While a prompt is open, Enter submits and Esc cancels the action.
+    '''
+    def __init__(self, tui: LightningTUI, frame_interval: float=0.25):
+        self.tui = tui
+        self.frame_interval = frame_interval
+        self.items = [list(i.keys())[0] for i in tui.menu_items]
+        self.screen = Screen()
+        self.pane = self.screen.pane
+        self.selected = 0
+        self.scroll = 0
+        self.pane_height = 1
+        self.digits = ""
+        self.busy = None
+        self.prompt = None
+        self.quit = False
+        self.lock = threading.Lock()
+
+    def run(self, on_ready=None):
+        '''Runs until quit. on_ready is called after the first frame; returning True stops there.'''
+        lib_tui.input_hook = self.ask
+        try:
+            with self.screen:
+                while not self.quit:
+                    self.screen.draw(self.render())
+                    if on_ready is not None and on_ready():
+                        break
+                    on_ready = None
+                    for key in self.screen.read_keys(self.frame_interval):
+                        self.handle(key)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            lib_tui.input_hook = None
+
+    def ask(self, msg):
+        '''Prompt hook called from the worker thread; blocks until the user answers.'''
+        answer = queue.Queue(maxsize=1)
+        with self.lock:
+            self.prompt = {"msg": msg, "buffer": "", "answer": answer}
+        result = answer.get()
+        if result is None:
+            raise PromptCancelled
+        self.pane.write(f"{colorize(msg, 'orange')}{result}\n")
+        return result
+
+    def menu_rows(self, width):
+        columns = 2 if width >= 80 else 1
+        per_column = -(-len(self.items) // columns)
+        column_width = width // columns
+        rows = []
+        for row in range(per_column):
+            cells = []
+            for column in range(columns):
+                i = column * per_column + row
+                if i >= len(self.items):
+                    continue
+                cell = f"{' '*2}[{i}] {self.items[i]}"[:column_width - 1].ljust(column_width - 1)
+                cells.append(f"\x1b[7m{cell}\x1b[0m" if i == self.selected else colorize(cell, 'blue'))
+            rows.append(" ".join(cells))
+        return rows, per_column
+
+    def render(self):
+        size = self.screen.get_size()
+        width, height = size.columns, size.lines
+        status, age = self.tui.get_status_snapshot()
+        top = [colorize(f"{'AtomicDEX Lightning TUI v0.1 by Dragonhound':^{width}}", 'cyan')]
+        top += status_lines(status, age, width)
+        menu, per_column = self.menu_rows(width)
+        if height - len(top) - len(menu) - 3 >= len(header_lines) + 6:
+            top = [colorize(i, 'lightgreen') for i in header_lines] + top
+        if self.busy:
+            title = f" Output - running {self.busy} "
+        else:
+            title = " Output "
+        self.pane_height = max(1, height - len(top) - len(menu) - 3)
+        self.scroll = max(0, min(self.scroll, len(self.pane) - self.pane_height))
+        output = self.pane.tail(self.pane_height, self.scroll)
+        lines = top + [""] + menu + [colorize(f"{title:─^{width}}", 'darkgrey')] + output
+        lines += [""] * (height - 1 - len(lines))
+        with self.lock:
+            prompt = self.prompt
+        if prompt is not None:
+            lines.append(colorize(prompt["msg"], 'orange') + prompt["buffer"] + "\x1b[7m \x1b[0m")
+        else:
+            lines.append(colorize(" ↑↓←→ select  Enter run  PgUp/PgDn scroll  q quit", 'darkgrey'))
+        return lines
+
+    def handle(self, key):
+        with self.lock:
+            prompt = self.prompt
+        if prompt is not None:
+            if key == "enter":
+                self.answer(prompt["buffer"])
+            elif key == "escape":
+                self.answer(None)
+            elif key == "backspace":
+                prompt["buffer"] = prompt["buffer"][:-1]
+            elif len(key) == 1 and key.isprintable():
+                prompt["buffer"] += key
+            return
+        per_column = self.menu_rows(self.screen.get_size().columns)[1]
+        if key in ["up", "k"]:
+            self.selected = (self.selected - 1) % len(self.items)
+        elif key in ["down", "j"]:
+            self.selected = (self.selected + 1) % len(self.items)
+        elif key == "left":
+            self.selected = max(0, self.selected - per_column)
+        elif key == "right":
+            self.selected = min(len(self.items) - 1, self.selected + per_column)
+        elif key.isdigit():
+            self.digits = (self.digits + key)[-2:]
+            if int(self.digits) >= len(self.items):
+                self.digits = key
+            self.selected = int(self.digits)
+        elif key == "enter":
+            self.digits = ""
+            self.start(self.selected)
+        elif key == "pageup":
+            self.scroll += self.pane_height
+        elif key == "pagedown":
+            self.scroll = max(0, self.scroll - self.pane_height)
+        elif key == "home":
+            self.scroll = len(self.pane)
+        elif key == "end":
+            self.scroll = 0
+        elif key == "q":
+            self.quit = True
+
+    def answer(self, value):
+        with self.lock:
+            prompt = self.prompt
+            self.prompt = None
+        prompt["answer"].put(value)
+
+    def start(self, index):
+        if self.busy:
+            self.pane.write(colorize(f"Still running {self.busy}, please wait.\n", 'error'))
+            return
+        self.busy = self.items[index]
+        self.scroll = 0
+        self.pane.write(colorize(f"> {self.items[index]}\n", 'cyan'))
+        threading.Thread(target=self.run_action, args=(index,), name="TUIAction", daemon=True).start()
+
+    def run_action(self, index):
+        try:
+            self.tui.run_action(index)
+        except PromptCancelled:
+            self.pane.write(colorize("Cancelled.\n", 'error'))
+        except SystemExit:
+            self.quit = True
+        except Exception as e:
+            self.pane.write(colorize(f"Error: {e}\n", 'error'))
+        finally:
+            self.busy = None
+
 
+def classic_main(tui, on_ready=None):
     while True:
+        status, age = tui.get_status_snapshot()
         try:
-            os.system('clear')
+            print("\033[H\033[J", end="")
             print(colorize(header, 'lightgreen'))
             print(colorize(author, 'cyan'))
             print("")
-            if status['lightning_status'] == "Initialized":
-                line1 = f"[{status['lightning_name']} | {status['lightning_status']} | Port {status['lightning_port']} | Color #{status['lightning_color']}]"
-                line2 = f"[{status['platform_coin']} | {status['coin_address']} | {status['coin_balance']}]"
-                line3 = f"[{status['coin']} | {status['lightning_address']} | {status['lightning_balance']}]"
-                print(colorize('{:^100}'.format(line1), 'orange'))
-                print(colorize('{:^100}'.format(line2), 'orange'))
-                print(colorize('{:^100}'.format(line3), 'orange'))
-
-            else: print(colorize('{:^100}'.format("Lightning not initialized. Please initialize lightning first."), "red"))
+            print("\n".join(status_lines(status, age)))
             print("")
 
             try:
-                for item in tui.menu_items:
-                    i = tui.menu_items.index(item)
+                for i, item in enumerate(tui.menu_items):
                     option = list(item.keys())[0]
                     print(colorize(f"{' '*6}[{i}] {option}", 'blue'))
+                if on_ready is not None and on_ready():
+                    return
+                on_ready = None
                 choice = color_input("\n Select menu option: ")
                 if int(choice) < 0:
                     raise ValueError
                 print("")
-                if int(choice) == 0:
-                    node = list(tui.menu_items[int(choice)].values())[0]()
-                else:
-                    list(tui.menu_items[int(choice)].values())[0]()
+                tui.run_action(int(choice))
                 print("")
             except (ValueError, IndexError):
                 print(colorize("Invalid menu option!", 'error'))
@@ -65,11 +286,41 @@ def main():
                 pass
         except KeyboardInterrupt:
             tui.exit_tui()
-        status = tui.get_status()
         input(colorize("Press Enter to continue...", 'orange'))
 
+
+def main(refresh_interval=10, classic=False, splash=True, startup_report=False, budget_ms=None):
+    '''
+    Runs the TUI. With startup_report it stops at the first interactive frame
+    and prints the time spent per startup phase, returning 1 if that took
+    longer than budget_ms.
+    '''
+    if splash:
+        show_logo()
+        startup.mark("splash")
+    tui = LightningTUI(refresh_interval=refresh_interval)
+    startup.mark("tui_init")
+
+    def on_ready():
+        startup.mark("first_frame")
+        return startup_report
+
+    if classic or not screen.supported():
+        classic_main(tui, on_ready)
+    else:
+        FullScreenTUI(tui).run(on_ready)
+    if not startup_report:
+        return 0
+    flush_logs()
+    print(startup.report())
+    if budget_ms is not None and startup.total_ms() > budget_ms:
+        print(colorize(f"Startup took {startup.total_ms():.1f} ms, over the {budget_ms} ms budget", 'error'))
+        return 1
+    return 0
+
+
 def show_logo(logofile="logo.txt"):
-    os.system('clear')
+    print("\033[H\033[J", end="")
     print("\n")
     with (open(logofile, "r")) as logo:
         for line in logo:
@@ -86,7 +337,27 @@ def show_logo(logofile="logo.txt"):
     print("\n")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AtomicDEX Lightning TUI")
+    parser.add_argument("--refresh-interval", help="seconds between background status refreshes.", type=float, default=10)
+    parser.add_argument("--classic", help="use the line-based menu instead of the full-screen one.", action="store_true")
+    parser.add_argument("--log-json", help="append per-RPC method, duration and size records to this file as JSON lines.", default=None)
+    parser.add_argument("--metrics-port", help="serve Prometheus RPC metrics on this port at /metrics.", type=int, default=None)
+    parser.add_argument("--no-splash", help="skip the animated logo.", action="store_true")
+    parser.add_argument("--startup-report", help="exit at the first interactive frame and print startup time by phase.", action="store_true")
+    parser.add_argument("--budget-ms", help="with --startup-report, exit with status 1 if startup took longer than this.", type=float, default=None)
+    args = parser.parse_args()
+    if args.log_json:
+        json_log(args.log_json)
+    if args.metrics_port:
+        RPCMetrics.shared().serve(args.metrics_port)
+    startup.mark("args")
 
-    show_logo()
-    main()
-    print("Done, Exiting...")
\ No newline at end of file
+    status = main(
+        refresh_interval=args.refresh_interval,
+        classic=args.classic,
+        splash=not args.no_splash,
+        startup_report=args.startup_report or args.budget_ms is not None,
+        budget_ms=args.budget_ms
+    )
+    print("Done, Exiting...")
+    sys.exit(status)
\ No newline at end of file
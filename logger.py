@@ -1,4 +1,15 @@
+import json
+import copy
+import queue
+import atexit
 import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# Keys whose values are never written to logs
+SECRET_KEYS = ["userpass", "rpc_password", "passphrase", "seed", "mnemonic"]
+# Extra record fields written by JSONFormatter when present
+RPC_FIELDS = ["method", "duration_ms", "request_bytes", "response_bytes", "status"]
+
 
 class CustomFormatter(logging.Formatter):
 
@@ -36,7 +47,100 @@ class CustomFormatter(logging.Formatter):
         logging.CRITICAL: bold_red + format + reset
     }
 
+    # Built once, instead of a new Formatter per record
+    FORMATTERS = {level: logging.Formatter(fmt) for level, fmt in FORMATS.items()}
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
+        formatter = self.FORMATTERS.get(record.levelno, self.FORMATTERS[logging.DEBUG])
         return formatter.format(record)
+
+
+class JSONFormatter(logging.Formatter):
+    '''Formats records as JSON lines, including any RPC_FIELDS set through `extra`.'''
+    def format(self, record):
+        line = {
+            "time": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for field in RPC_FIELDS:
+            if hasattr(record, field):
+                line.update({field: getattr(record, field)})
+        return json.dumps(line, default=str)
+
+
+def redact(value):
+    '''Masks SECRET_KEYS in a request, or in each request of a batch.'''
+    if isinstance(value, dict):
+        return {k: "***" if k in SECRET_KEYS else v for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(i) if isinstance(i, dict) else i for i in value]
+    return value
+
+
+class Redacted():
+    '''
+    Log argument which renders a request or response only when the record
+    is emitted, with secrets masked and the text cut to max_length. Pass it
+    as a %s argument so nothing is rendered for disabled levels.
+    '''
+    max_length = 8000
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        text = str(redact(self.value))
+        if len(text) > self.max_length:
+            return f"{text[:self.max_length]}... ({len(text)} chars)"
+        return text
+
+
+class QueueLogHandler(QueueHandler):
+    '''
+    Hands records to a background thread which formats and writes them with
+    `handlers`, so the logging thread never waits on the console or a file.
+    Records are queued unformatted; their arguments must not be changed
+    after logging. flush() waits until every queued record is written.
+    '''
+    def __init__(self, *handlers):
+        super().__init__(queue.Queue())
+        self.handlers = list(handlers)
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def flush(self):
+        if self.listener._thread is not None:
+            self.queue.join()
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+
+def flush_logs():
+    '''Waits for every QueueLogHandler to write out its queued records.'''
+    for log in [logging.getLogger()] + [i for i in logging.Logger.manager.loggerDict.values() if isinstance(i, logging.Logger)]:
+        for handler in log.handlers:
+            if isinstance(handler, QueueLogHandler):
+                handler.flush()
+
+
+def json_log(path: str, name: str="dex_lightning.rpc") -> logging.Logger:
+    '''Writes the `name` logger to path as JSON lines from a background thread, enabling it at DEBUG.'''
+    log = logging.getLogger(name)
+    file_handler = logging.FileHandler(path)
+    file_handler.setFormatter(JSONFormatter())
+    log.addHandler(QueueLogHandler(file_handler))
+    log.setLevel(logging.DEBUG)
+    return log
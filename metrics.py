@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+import os
+import bisect
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+def error_class(resp) -> str:
+    '''Returns the mm2 error_type of an error response, None for a result.'''
+    if isinstance(resp, dict) and "error" in resp:
+        return resp.get("error_type") or "Error"
+    return None
+
+
+def label(value) -> str:
+    '''Escapes a label value for the Prometheus text format: backslash, double quote and newline.'''
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MethodStats():
+    def __init__(self, buckets: list):
+        self.count = 0
+        self.cache_hits = 0
+        self.duration_sum = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.buckets = [0] * (len(buckets) + 1)
+        self.errors = {}
+
+
+class RPCMetrics():
+    '''
+    Per-method RPC counters, latency histograms, byte totals and error tallies.
+    The transports record every request; requests in a batch are each
+    counted with the batch's latency and an even share of its bytes. Use
+    export() for the Prometheus text format, write() for a textfile
+    collector, or serve() for an HTTP /metrics endpoint.
+    '''
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, buckets: list=None):
+        self.bounds = buckets or DEFAULT_BUCKETS
+        self.methods = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    @classmethod
+    def shared(cls):
+        '''Returns the process-wide instance used by default by every transport.'''
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def get_stats(self, method: str) -> MethodStats:
+        '''Returns the stats of a method. Call with the lock held.'''
+        stats = self.methods.get(method)
+        if stats is None:
+            stats = MethodStats(self.bounds)
+            self.methods.update({method: stats})
+        return stats
+
+    def observe(self, method: str, duration: float, request_bytes: int=0, response_bytes: int=0, error: str=None):
+        with self.lock:
+            stats = self.get_stats(method)
+            stats.count += 1
+            stats.duration_sum += duration
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            stats.buckets[bisect.bisect_left(self.bounds, duration)] += 1
+            if error is not None:
+                stats.errors.update({error: stats.errors.get(error, 0) + 1})
+
+    def record(self, params, resp, duration: float, request_bytes: int, response_bytes: int):
+        '''Records a request dict (or batch list) and its decoded response.'''
+        if not isinstance(params, list):
+            self.observe(params.get("method"), duration, request_bytes, response_bytes, error_class(resp))
+            return
+        results = resp if isinstance(resp, list) and len(resp) == len(params) else [resp] * len(params)
+        for request, result in zip(params, results):
+            self.observe(
+                request.get("method"),
+                duration,
+                request_bytes // len(params),
+                response_bytes // len(params),
+                error_class(result)
+            )
+
+    def hit(self, method: str):
+        '''Counts a response served from the cache, which never reaches a transport.'''
+        with self.lock:
+            self.get_stats(method).cache_hits += 1
+
+    def reset(self):
+        with self.lock:
+            self.methods = {}
+
+    def quantile(self, stats: MethodStats, q: float) -> float:
+        '''Estimates a latency quantile from the histogram, interpolating within a bucket.'''
+        if not stats.count:
+            return 0.0
+        rank = q * stats.count
+        seen = 0
+        for i, count in enumerate(stats.buckets):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def summary(self) -> list:
+        '''Returns one row per method, the most time-consuming first.'''
+        with self.lock:
+            total = sum(i.duration_sum for i in self.methods.values()) or 1
+            rows = [{
+                "method": method,
+                "calls": stats.count,
+                "cache_hits": stats.cache_hits,
+                "errors": sum(stats.errors.values()),
+                "avg_ms": stats.duration_sum / stats.count * 1000 if stats.count else 0.0,
+                "p50_ms": self.quantile(stats, 0.5) * 1000,
+                "p99_ms": self.quantile(stats, 0.99) * 1000,
+                "total_s": stats.duration_sum,
+                "share": stats.duration_sum / total,
+                "response_bytes": stats.response_bytes
+            } for method, stats in self.methods.items()]
+        return sorted(rows, key=lambda i: i["total_s"], reverse=True)
+
+    def export(self) -> str:
+        '''Renders every metric in the Prometheus text exposition format.'''
+        lines = [
+            "# HELP dex_rpc_requests_total AtomicDEX API requests sent, by method.",
+            "# TYPE dex_rpc_requests_total counter"
+        ]
+        with self.lock:
+            methods = [(label(m), s) for m, s in sorted(self.methods.items())]
+            lines += [f'dex_rpc_requests_total{{method="{m}"}} {s.count}' for m, s in methods]
+            lines += [
+                "# HELP dex_rpc_cache_hits_total Responses served from the local cache, by method.",
+                "# TYPE dex_rpc_cache_hits_total counter"
+            ]
+            lines += [f'dex_rpc_cache_hits_total{{method="{m}"}} {s.cache_hits}' for m, s in methods]
+            lines += [
+                "# HELP dex_rpc_errors_total Error responses, by method and mm2 error_type.",
+                "# TYPE dex_rpc_errors_total counter"
+            ]
+            for m, s in methods:
+                lines += [f'dex_rpc_errors_total{{method="{m}",error="{label(e)}"}} {n}' for e, n in sorted(s.errors.items())]
+            for name, attr in [("request", "request_bytes"), ("response", "response_bytes")]:
+                lines += [
+                    f"# HELP dex_rpc_{name}_bytes_total Bytes of JSON {name} bodies, by method.",
+                    f"# TYPE dex_rpc_{name}_bytes_total counter"
+                ]
+                lines += [f'dex_rpc_{name}_bytes_total{{method="{m}"}} {getattr(s, attr)}' for m, s in methods]
+            lines += [
+                "# HELP dex_rpc_duration_seconds Request latency, by method.",
+                "# TYPE dex_rpc_duration_seconds histogram"
+            ]
+            for m, s in methods:
+                cumulative = 0
+                for bound, count in zip(self.bounds + ["+Inf"], s.buckets):
+                    cumulative += count
+                    lines.append(f'dex_rpc_duration_seconds_bucket{{method="{m}",le="{bound}"}} {cumulative}')
+                lines.append(f'dex_rpc_duration_seconds_sum{{method="{m}"}} {s.duration_sum}')
+                lines.append(f'dex_rpc_duration_seconds_count{{method="{m}"}} {s.count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        '''Writes export() to path atomically, e.g. for the node_exporter textfile collector.'''
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.export())
+        os.replace(tmp, path)
+
+    def serve(self, port: int=9762, host: str="127.0.0.1") -> ThreadingHTTPServer:
+        '''Serves export() at http://host:port/metrics from a background thread.'''
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ["/", "/metrics"]:
+                    self.send_error(404)
+                    return
+                body = metrics.export().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="RPCMetrics", daemon=True).start()
+        return self.server
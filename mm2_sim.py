@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+import json
+import time
+import random
+import argparse
+import threading
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from logger import CustomFormatter
+
+# create logger with 'lightning_app'
+logger = logging.getLogger("mm2_sim")
+logger.setLevel(logging.DEBUG)
+
+# create console handler with a higher log level
+handler = logging.StreamHandler()
+handler.setFormatter(CustomFormatter())
+logger.addHandler(handler)
+
+
+class MM2Simulator():
+    '''
+    In-process stand-in for the AtomicDEX API, implementing the subset of
+    methods used by dex_lightning.py. Responses follow the mm2 shapes closely
+    enough for the client, with configurable latency, error injection and
+    dataset sizes. Batch (list) requests are answered with a list.
+    '''
+    def __init__(self, host="127.0.0.1", port=0, userpass=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 init_polls=2, settle_delay=0.5, payments=100, open_channels=10, closed_channels=5, seed=762):
+        self.host = host
+        self.port = port
+        self.userpass = userpass
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.init_polls = init_polls
+        self.settle_delay = settle_delay
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+        self.requests = 0
+        self.activated = set()
+        self.tasks = {}
+        self.next_task_id = 1
+        self.trusted_nodes = {}
+        self.pubkey = self.random_hex(66)
+        self.peers = [f"02{self.random_hex(64)}" for i in range(max(open_channels + closed_channels, 1))]
+        self.open_channels = [self.make_open_channel(i) for i in range(open_channels)]
+        self.closed_channels = [self.make_closed_channel(i + open_channels) for i in range(closed_channels)]
+        self.payments = {}
+        now = int(time.time())
+        for i in range(payments):
+            payment = self.make_payment(now - (payments - i) * 60)
+            self.payments.update({payment["payment_hash"]: payment})
+        self.methods = {
+            "version": self.version,
+            "electrum": self.electrum,
+            "enable": self.electrum,
+            "my_balance": self.my_balance,
+            "get_public_key": self.get_public_key,
+            "task::enable_lightning::init": self.init_lightning,
+            "task::enable_lightning::status": self.init_lightning_status,
+            "task::enable_lightning::cancel": self.init_lightning_cancel,
+            "lightning::nodes::connect_to_node": self.connect_to_node,
+            "lightning::nodes::list_trusted_nodes": self.list_trusted_nodes,
+            "lightning::nodes::add_trusted_node": self.add_trusted_node,
+            "lightning::nodes::remove_trusted_node": self.remove_trusted_node,
+            "lightning::channels::open_channel": self.open_channel,
+            "lightning::channels::update_channel": self.update_channel,
+            "lightning::channels::list_open_channels_by_filter": self.list_open_channels,
+            "lightning::channels::list_closed_channels_by_filter": self.list_closed_channels,
+            "lightning::channels::get_claimable_balances": self.get_claimable_balances,
+            "lightning::payments::generate_invoice": self.generate_invoice,
+            "lightning::payments::send_payment": self.send_payment,
+            "lightning::payments::get_payment_details": self.get_payment_details,
+            "lightning::payments::list_payments_by_filter": self.list_payments
+        }
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        '''Starts serving on a background thread. Port 0 picks a free port.'''
+        sim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.dumps(sim.handle(json.loads(self.rfile.read(length)))).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"mm2 simulator listening on {self.url}")
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def deactivate(self, coin: str):
+        '''Forgets that a coin was activated, so it can be initialized again.'''
+        with self.lock:
+            self.activated.discard(coin)
+
+    def handle(self, request):
+        '''Answers a request dict, or a batch list of them, after the configured latency.'''
+        delay = self.latency + self.random.uniform(0, self.jitter) if self.jitter else self.latency
+        if delay:
+            time.sleep(delay)
+        if isinstance(request, list):
+            return [self.call(i) for i in request]
+        return self.call(request)
+
+    def call(self, request: dict):
+        with self.lock:
+            self.requests += 1
+            if self.userpass is not None and request.get("userpass") != self.userpass:
+                return self.error(request, "Userpass is invalid!", "UserpassIsInvalid")
+            if self.error_rate and self.random.random() < self.error_rate:
+                return self.error(request, "Simulated internal error", "Internal")
+            method = self.methods.get(request.get("method"))
+            if method is None:
+                return self.error(request, f"No such method: {request.get('method')}", "NoSuchMethod")
+            try:
+                result = method(request.get("params", request))
+            except SimulatedError as e:
+                return self.error(request, str(e), e.error_type)
+        if request.get("mmrpc") == "2.0":
+            return {"mmrpc": "2.0", "result": result, "id": request.get("id")}
+        return result
+
+    def error(self, request: dict, message: str, error_type: str) -> dict:
+        if request.get("mmrpc") == "2.0":
+            return {"mmrpc": "2.0", "error": message, "error_type": error_type, "id": request.get("id")}
+        return {"error": message}
+
+    def random_hex(self, length: int) -> str:
+        return "".join(self.random.choice("0123456789abcdef") for i in range(length))
+
+    def make_open_channel(self, i: int) -> dict:
+        capacity = self.random.choice([100000, 250000, 500000, 1000000])
+        balance_msat = self.random.randint(0, capacity) * 1000
+        return {
+            "uuid": f"{self.random_hex(8)}-{self.random_hex(4)}-{self.random_hex(4)}-{self.random_hex(4)}-{self.random_hex(12)}",
+            "channel_id": self.random_hex(64),
+            "counterparty_node_id": self.peers[i],
+            "funding_tx": self.random_hex(64),
+            "funding_tx_output_index": 0,
+            "funding_tx_value_sats": capacity,
+            "is_outbound": self.random.random() < 0.5,
+            "balance_msat": balance_msat,
+            "outbound_capacity_msat": balance_msat,
+            "inbound_capacity_msat": capacity * 1000 - balance_msat,
+            "current_confirmations": 6,
+            "required_confirmations": 3,
+            "is_ready": True,
+            "is_usable": True,
+            "is_public": False
+        }
+
+    def make_closed_channel(self, i: int) -> dict:
+        channel = self.make_open_channel(i)
+        now = int(time.time())
+        return {
+            "uuid": channel["uuid"],
+            "channel_id": channel["channel_id"],
+            "counterparty_node_id": channel["counterparty_node_id"],
+            "funding_tx": channel["funding_tx"],
+            "closing_tx": self.random_hex(64),
+            "closure_reason": self.random.choice(["CooperativeClosure", "HolderForceClosed", "CounterpartyForceClosed"]),
+            "claiming_tx": self.random.choice([None, self.random_hex(64)]),
+            "claimed_balance": channel["balance_msat"] // 1000,
+            "funding_tx_value_sats": channel["funding_tx_value_sats"],
+            "is_outbound": channel["is_outbound"],
+            "is_public": False,
+            "is_closed_by_counterparty": channel["is_outbound"],
+            "created_at": now - 86400,
+            "closed_at": now - 3600
+        }
+
+    def make_payment(self, created_at: int, outbound: bool=None, amount_in_msat: int=None,
+                     description: str=None, status: str=None, destination: str=None) -> dict:
+        if outbound is None:
+            outbound = self.random.random() < 0.5
+        payment_type = {"type": "Inbound Payment"}
+        if outbound:
+            payment_type = {"type": "Outbound Payment", "destination": destination or self.random.choice(self.peers)}
+        return {
+            "payment_hash": self.random_hex(64),
+            "payment_type": payment_type,
+            "description": description if description is not None else f"payment {self.random.randint(1, 1000000)}",
+            "amount_in_msat": amount_in_msat if amount_in_msat is not None else self.random.randint(1, 100000) * 1000,
+            "fee_paid_msat": self.random.randint(0, 2000) if outbound else None,
+            "status": status or self.random.choice(["succeeded", "succeeded", "succeeded", "pending", "failed"]),
+            "created_at": created_at,
+            "last_updated": created_at
+        }
+
+    def page(self, records: list, params: dict, key: str) -> dict:
+        limit = int(params.get("limit", 10))
+        paging = params.get("paging_options", {"PageNumber": 1})
+        if "FromId" in paging:
+            ids = [i.get("payment_hash", i.get("uuid")) for i in records]
+            skipped = ids.index(paging["FromId"]) + 1 if paging["FromId"] in ids else 0
+        else:
+            skipped = (int(paging.get("PageNumber", 1)) - 1) * limit
+        return {
+            key: records[skipped:skipped + limit],
+            "limit": limit,
+            "skipped": skipped,
+            "total": len(records),
+            "total_pages": (len(records) + limit - 1) // limit,
+            "paging_options": paging
+        }
+
+    def settle(self, payment: dict):
+        '''Pending payments made through the simulator succeed after settle_delay.'''
+        if payment["status"] == "pending" and payment.get("settles_at") and time.time() >= payment["settles_at"]:
+            payment.update({"status": "succeeded", "last_updated": int(time.time())})
+        return {i: payment[i] for i in payment if i != "settles_at"}
+
+    def version(self, params):
+        return {"result": "2.0.0-beta_sim", "datetime": "2023-05-01T00:00:00+00:00"}
+
+    def electrum(self, params):
+        coin = params.get("coin")
+        self.activated.add(coin)
+        return {
+            "result": "success",
+            "address": f"tb1q{self.random_hex(38)}",
+            "balance": "1.0",
+            "unspendable_balance": "0",
+            "coin": coin,
+            "required_confirmations": 1,
+            "requires_notarization": False
+        }
+
+    def my_balance(self, params):
+        coin = params.get("coin")
+        if coin not in self.activated:
+            raise SimulatedError(f"No such coin {coin}", "NoSuchCoin")
+        return {"address": f"addr-{coin}", "balance": "1.0", "unspendable_balance": "0", "coin": coin}
+
+    def get_public_key(self, params):
+        return {"public_key": self.pubkey}
+
+    def init_lightning(self, params):
+        ticker = params["ticker"]
+        if ticker in self.activated:
+            raise SimulatedError(f"{ticker} already activated", "CoinIsAlreadyActivated")
+        task_id = self.next_task_id
+        self.next_task_id += 1
+        self.tasks.update({task_id: {"ticker": ticker, "polls": self.init_polls}})
+        return {"task_id": task_id}
+
+    def init_lightning_status(self, params):
+        task = self.tasks.get(params["task_id"])
+        if task is None:
+            raise SimulatedError(f"No such task '{params['task_id']}'", "NoSuchTask")
+        if task["polls"] > 0:
+            steps = ["ActivatingCoin", "ConnectingToLightningNetwork", "GettingBalances"]
+            task["polls"] -= 1
+            return {"status": "InProgress", "details": steps[task["polls"] % len(steps)]}
+        self.activated.add(task["ticker"])
+        if params.get("forget_if_finished", True):
+            self.tasks.pop(params["task_id"])
+        return {
+            "status": "Ok",
+            "details": {
+                "platform_coin": task["ticker"].replace("lightning", "segwit"),
+                "address": self.pubkey,
+                "balance": {"spendable": "0", "unspendable": "0"}
+            }
+        }
+
+    def init_lightning_cancel(self, params):
+        if self.tasks.pop(params["task_id"], None) is None:
+            raise SimulatedError(f"No such task '{params['task_id']}'", "NoSuchTask")
+        return "success"
+
+    def connect_to_node(self, params):
+        return f"Connected successfully to node : {params['node_address']}"
+
+    def list_trusted_nodes(self, params):
+        return {"trusted_nodes": sorted(self.trusted_nodes.get(params["coin"], set()))}
+
+    def add_trusted_node(self, params):
+        self.trusted_nodes.setdefault(params["coin"], set()).add(params["node_id"])
+        return {"added_node": params["node_id"]}
+
+    def remove_trusted_node(self, params):
+        self.trusted_nodes.setdefault(params["coin"], set()).discard(params["node_id"])
+        return {"removed_node": params["node_id"]}
+
+    def open_channel(self, params):
+        channel = self.make_open_channel(0)
+        channel.update({"counterparty_node_id": params["node_address"].split("@")[0], "is_outbound": True})
+        self.open_channels.append(channel)
+        return {"uuid": channel["uuid"], "node_address": params["node_address"]}
+
+    def update_channel(self, params):
+        for channel in self.open_channels:
+            if channel["uuid"] == params["uuid"]:
+                channel.update({"config": dict(channel.get("config", {}), **params["channel_options"])})
+                return {"channel_options": channel["config"]}
+        raise SimulatedError(f"Channel with uuid: {params['uuid']} is not found", "NoSuchChannel")
+
+    def list_open_channels(self, params):
+        return self.page(self.open_channels, params, "open_channels")
+
+    def list_closed_channels(self, params):
+        return self.page(self.closed_channels, params, "closed_channels")
+
+    def get_claimable_balances(self, params):
+        balances = [
+            {"type": "ClaimableAwaitingConfirmations", "claimable_amount_satoshis": i["claimed_balance"], "confirmation_height": 100}
+            for i in self.closed_channels if i["claiming_tx"] is None
+        ]
+        if params.get("include_open_channels_balances", True) not in [False, "false", "False"]:
+            balances += [
+                {"type": "ClaimableOnChannelClose", "claimable_amount_satoshis": i["balance_msat"] // 1000}
+                for i in self.open_channels
+            ]
+        return balances
+
+    def generate_invoice(self, params):
+        payment = self.make_payment(int(time.time()), outbound=False, amount_in_msat=params.get("amount_in_msat"),
+                                    description=params.get("description", ""), status="pending")
+        self.payments.update({payment["payment_hash"]: payment})
+        return {"payment_hash": payment["payment_hash"], "invoice": f"lntb{self.random_hex(200)}"}
+
+    def send_payment(self, params):
+        payment = params.get("payment", {})
+        if payment.get("type") not in ["invoice", "keysend"]:
+            raise SimulatedError("Invalid payment type", "InvalidRequest")
+        record = self.make_payment(int(time.time()), outbound=True, amount_in_msat=payment.get("amount_in_msat"),
+                                   status="pending", destination=payment.get("destination"))
+        record.update({"settles_at": time.time() + self.settle_delay})
+        self.payments.update({record["payment_hash"]: record})
+        return {"payment_hash": record["payment_hash"]}
+
+    def get_payment_details(self, params):
+        payment = self.payments.get(params["payment_hash"])
+        if payment is None:
+            raise SimulatedError(f"Payment with hash: {params['payment_hash']} is not found", "NoSuchPayment")
+        return {"payment_details": self.settle(payment)}
+
+    def list_payments(self, params):
+        payment_type = params.get("filter", {}).get("payment_type", {}).get("type")
+        payments = [
+            i for i in reversed(self.payments.values())
+            if payment_type is None or i["payment_type"]["type"] == payment_type
+        ]
+        page = self.page(payments, params, "payments")
+        page.update({"payments": [self.settle(i) for i in page["payments"]]})
+        return page
+
+
+class SimulatedError(Exception):
+    def __init__(self, message: str, error_type: str):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a simulated AtomicDEX API for local testing and benchmarks.")
+    parser.add_argument("--host", help="address to listen on.", default="127.0.0.1")
+    parser.add_argument("--port", help="port to listen on.", type=int, default=7783)
+    parser.add_argument("--userpass", help="userpass to require, any is accepted if not set.", default=None)
+    parser.add_argument("--latency", help="seconds of latency added to each request.", type=float, default=0.0)
+    parser.add_argument("--jitter", help="extra random latency, up to this many seconds.", type=float, default=0.0)
+    parser.add_argument("--error-rate", help="fraction of requests answered with an error.", type=float, default=0.0)
+    parser.add_argument("--init-polls", help="status polls before lightning init completes.", type=int, default=2)
+    parser.add_argument("--payments", help="number of payments in the history.", type=int, default=100)
+    parser.add_argument("--open-channels", help="number of open channels.", type=int, default=10)
+    parser.add_argument("--closed-channels", help="number of closed channels.", type=int, default=5)
+    args = parser.parse_args()
+
+    sim = MM2Simulator(
+        host=args.host,
+        port=args.port,
+        userpass=args.userpass,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        init_polls=args.init_polls,
+        payments=args.payments,
+        open_channels=args.open_channels,
+        closed_channels=args.closed_channels
+    ).start()
+    try:
+        sim.thread.join()
+    except KeyboardInterrupt:
+        sim.stop()
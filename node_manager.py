@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+from concurrent.futures import ThreadPoolExecutor
+import dex_lightning as dex
+from transport import DexTransport
+from rpc_cache import RPCCache
+
+
+class NodeManager():
+    '''
+    Holds one LightningNode per coin on a single mm2 instance. Coins are
+    activated concurrently over one shared transport and response cache,
+    the pubkey lookup is done once for all of them, and their init tasks are
+    polled together, so bringing up several coins takes about as long as
+    the slowest one.
+    '''
+    def __init__(self, dex_url="http://127.0.0.1:7783", transport: DexTransport=None, max_workers: int=4, cache_ttls: dict=None):
+        self.dex_url = dex_url
+        self.transport = transport or DexTransport.shared(dex_url)
+        self.cache = RPCCache(cache_ttls)
+        self.max_workers = max_workers
+        self.nodes = {}
+        self.active = None
+
+    @property
+    def node(self) -> dex.LightningNode:
+        '''The node currently selected with switch().'''
+        return self.nodes.get(self.active)
+
+    def add_node(self, coin: str, node: dex.LightningNode):
+        '''Registers an already initialized node.'''
+        self.nodes.update({coin: node})
+        if self.active is None:
+            self.active = coin
+
+    def start(self, coins: list, port: int=9735, name: str="dragonhound-lightning", color: str="000000",
+              deadline: float=60, on_progress=None, **node_kwargs) -> dict:
+        '''
+        Activates coins concurrently, giving each lightning node its own
+        listening port counting up from `port`. Returns the final init status
+        response per coin. Coins which are already managed are skipped, and
+        only coins whose lightning node came up are added; the others are
+        reported and left out.
+        '''
+        new_nodes = {}
+        for coin in coins:
+            if coin in self.nodes or coin in new_nodes:
+                continue
+            new_nodes.update({coin: dex.LightningNode(
+                coin,
+                dex_url=self.dex_url,
+                name=name,
+                port=int(port) + len(self.nodes) + len(new_nodes),
+                color=color,
+                transport=self.transport,
+                cache=self.cache,
+                activate=False,
+                **node_kwargs
+            )})
+        if not new_nodes:
+            return {}
+
+        def activate(coin):
+            try:
+                return new_nodes[coin].activate_coin(coin)
+            except SystemExit:
+                # get_activation_params exits for a coin it has no params for
+                return {"error": f"No activation params for {coin}"}
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(new_nodes))) as executor:
+            activations = dict(zip(new_nodes, executor.map(activate, new_nodes)))
+
+        results = {}
+        for coin, resp in activations.items():
+            if "error" in resp and "already" not in str(resp["error"]):
+                results.update({coin: resp})
+                new_nodes.pop(coin)
+        if new_nodes:
+            pubkey = self.get_pubkey(new_nodes)
+            for node in new_nodes.values():
+                node.coin_pubkey = pubkey
+
+        for coin, node in new_nodes.items():
+            node.initialize_lightning(background=True, deadline=deadline, on_progress=on_progress)
+        for coin, node in new_nodes.items():
+            results.update({coin: node.wait_initialized(deadline + dex.INIT_TIMEOUT_GRACE)})
+            if self.initialized(results[coin]):
+                self.add_node(coin, node)
+        for coin, resp in results.items():
+            if coin not in self.nodes:
+                dex.logger.warning(f"Lightning node for {coin} not started: {resp.get('error') or resp.get('result')}")
+        return results
+
+    @staticmethod
+    def initialized(resp: dict) -> bool:
+        '''Whether a final init status response means the lightning node is running.'''
+        if "error" in resp:
+            return "already activated" in str(resp["error"])
+        return resp.get("result", {}).get("status") == "Ok"
+
+    def get_pubkey(self, nodes: dict=None) -> str:
+        '''Looks up the pubkey once, as it is shared by every coin on this mm2.'''
+        for node in self.nodes.values():
+            if node.coin_pubkey != "no pubkey found":
+                return node.coin_pubkey
+        node = next(iter((nodes or self.nodes).values()))
+        node.get_pubkey()
+        return node.coin_pubkey
+
+    def switch(self, coin: str) -> dex.LightningNode:
+        if coin not in self.nodes:
+            raise KeyError(f"No lightning node for {coin}")
+        self.active = coin
+        return self.node
+
+    def get_balances(self, refresh: bool=False) -> list:
+        '''Fetches the platform and lightning balances of every node in one round trip.'''
+        if not self.nodes:
+            return []
+        first = next(iter(self.nodes.values()))
+        with first.batch(nolog=True, refresh=refresh) as batch:
+            for node in self.nodes.values():
+                batch.add({"method": "my_balance", "coin": node.platform_coin}, node.set_coin_balance)
+                batch.add({"method": "my_balance", "coin": node.coin}, node.set_lightning_balance)
+        return batch.results
+
+    def get_status(self, refresh: bool=False) -> dict:
+        '''Returns a status summary per coin, plus the active coin.'''
+        self.get_balances(refresh=refresh)
+        return {
+            "active": self.active,
+            "nodes": {
+                coin: {
+                    "coin": node.coin,
+                    "platform_coin": node.platform_coin,
+                    "coin_address": node.coin_address,
+                    "coin_balance": node.coin_balance,
+                    "lightning_address": node.lightning_address,
+                    "lightning_balance": node.lightning_balance,
+                    "lightning_port": node.port
+                } for coin, node in self.nodes.items()
+            }
+        }
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import sqlite3
+import threading
+from dex_lightning import logger
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS payments (
+    payment_hash TEXT PRIMARY KEY,
+    payment_type TEXT,
+    destination TEXT,
+    description TEXT,
+    amount_in_msat INTEGER,
+    fee_paid_msat INTEGER,
+    status TEXT,
+    created_at INTEGER,
+    last_updated INTEGER,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS payments_created_at ON payments (created_at);
+CREATE INDEX IF NOT EXISTS payments_status ON payments (status, created_at);
+CREATE INDEX IF NOT EXISTS payments_amount ON payments (amount_in_msat);
+CREATE INDEX IF NOT EXISTS payments_description ON payments (description);
+CREATE INDEX IF NOT EXISTS payments_flow ON payments (status, payment_type, created_at, destination, amount_in_msat, fee_paid_msat);
+CREATE TABLE IF NOT EXISTS open_channels (
+    uuid TEXT PRIMARY KEY,
+    counterparty_node_id TEXT,
+    capacity_sats INTEGER,
+    balance_msat INTEGER,
+    outbound_capacity_msat INTEGER,
+    inbound_capacity_msat INTEGER,
+    is_outbound INTEGER,
+    is_usable INTEGER,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS closed_channels (
+    uuid TEXT PRIMARY KEY,
+    counterparty_node_id TEXT,
+    capacity_sats INTEGER,
+    claimed_balance INTEGER,
+    closure_reason TEXT,
+    claiming_tx TEXT,
+    created_at INTEGER,
+    closed_at INTEGER,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS closed_channels_closed_at ON closed_channels (closed_at);
+CREATE TABLE IF NOT EXISTS channel_snapshots (
+    uuid TEXT,
+    taken_at INTEGER,
+    balance_msat INTEGER,
+    PRIMARY KEY (uuid, taken_at)
+);
+CREATE INDEX IF NOT EXISTS channel_snapshots_taken_at ON channel_snapshots (taken_at);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value INTEGER
+);
+'''
+
+PAYMENT_COLUMNS = ["created_at", "last_updated", "amount_in_msat", "fee_paid_msat", "status", "description", "destination", "payment_type"]
+OPEN_CHANNEL_COLUMNS = ["capacity_sats", "balance_msat", "outbound_capacity_msat", "inbound_capacity_msat", "counterparty_node_id", "is_usable"]
+# Force-closed funds are swept within the channel's to_self_delay (at most 2016 blocks, about two
+# weeks), so a channel closed longer ago than this without a claiming_tx will not get one
+CLAIM_WINDOW = 30 * 86400
+# Closed channels still waiting for their funds: cooperative closes pay out in the closing tx itself
+PENDING_CLAIM = "claiming_tx IS NULL AND closure_reason NOT LIKE 'Cooperative%' AND closed_at >= ?"
+
+CLOSED_CHANNEL_COLUMNS = ["closed_at", "created_at", "capacity_sats", "claimed_balance", "counterparty_node_id", "closure_reason"]
+
+
+class PaymentStore():
+    '''
+    Local SQLite index of a lightning node's payments and channels.
+    sync() only fetches payments and closed channels newer than the stored
+    high-water marks, replaces the (small) open channel set, and re-checks
+    payments still pending. Queries are answered locally from indexed tables.
+    Each open channel's balance is also logged to channel_snapshots whenever
+    it changes between syncs, as a history of the channel's movement.
+    Listeners added with add_listener(fn) are called as fn(kind, channels)
+    with the open or closed channels that changed in a sync.
+    '''
+    def __init__(self, node, db_file: str=None, page_size: int=100, refresh_interval: float=30):
+        self.node = node
+        self.db_file = db_file or f"{PROJECT_ROOT}/{node.coin}_payments.db"
+        self.page_size = page_size
+        self.refresh_interval = refresh_interval
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.synced = False
+        self.listeners = []
+        self.db = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+            self.synced = self.get_state("payments_hwm") is not None
+
+    def close(self):
+        self.stop()
+        with self.lock:
+            self.db.close()
+
+    def get_state(self, name: str):
+        row = self.db.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row["value"]
+
+    def set_state(self, name: str, value):
+        self.db.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)", (name, value))
+
+    def add_listener(self, listener):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def notify(self, kind: str, channels: list):
+        for listener in self.listeners:
+            try:
+                listener(kind, channels)
+            except Exception as e:
+                logger.warning(f"Payment store listener failed: {e}")
+
+    def start(self):
+        '''Syncs on a background thread every refresh_interval seconds.'''
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name=f"PaymentStore-{self.node.coin}", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning(f"Payment store sync for {self.node.coin} failed: {e}")
+            self.stopped.wait(self.refresh_interval)
+
+    def sync(self) -> dict:
+        '''Fetches new records from mm2, returning the number of rows written per table.'''
+        counts = {
+            "payments": self.sync_payments(),
+            "pending": self.reconcile_pending(),
+            "open_channels": self.sync_open_channels(),
+            "closed_channels": self.sync_closed_channels()
+        }
+        self.synced = True
+        return counts
+
+    def sync_payments(self) -> int:
+        hwm = self.get_state("payments_hwm") or 0
+        rows = []
+        newest = hwm
+        complete = True
+        payments = self.node.iter_payments(page_size=self.page_size)
+        try:
+            for payment in payments:
+                # Payments are listed newest first, so stop once past the high-water mark
+                if payment["created_at"] < hwm:
+                    payments.close()
+                    break
+                newest = max(newest, payment["created_at"])
+                rows.append(self.payment_row(payment))
+        except RuntimeError as e:
+            logger.warning(f"Payment sync for {self.node.coin} cut short: {e}")
+            complete = False
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO payments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            # The mark only moves after a complete walk, so unfetched older payments are retried next time
+            if complete:
+                self.set_state("payments_hwm", newest)
+        return len(rows)
+
+    def reconcile_pending(self) -> int:
+        '''Refreshes payments still pending locally, in batches of page_size.'''
+        with self.lock:
+            hashes = [i["payment_hash"] for i in self.db.execute("SELECT payment_hash FROM payments WHERE status = 'pending'")]
+        updated = 0
+        for i in range(0, len(hashes), self.page_size):
+            rows = []
+            for resp in self.node.get_payments_details(hashes[i:i + self.page_size]):
+                details = resp.get("result", {}).get("payment_details")
+                if details is not None and details.get("status") != "pending":
+                    rows.append(self.payment_row(details))
+            with self.lock, self.db:
+                self.db.executemany("INSERT OR REPLACE INTO payments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            updated += len(rows)
+        return updated
+
+    def sync_open_channels(self) -> int:
+        rows = []
+        try:
+            channels = list(self.iter_channels("open"))
+        except RuntimeError as e:
+            # A partial list would drop the missing channels from the table
+            logger.warning(f"Open channel sync for {self.node.coin} failed: {e}")
+            return 0
+        for channel in channels:
+            rows.append((
+                channel["uuid"],
+                channel.get("counterparty_node_id"),
+                channel.get("funding_tx_value_sats"),
+                channel.get("balance_msat"),
+                channel.get("outbound_capacity_msat"),
+                channel.get("inbound_capacity_msat"),
+                int(bool(channel.get("is_outbound"))),
+                int(bool(channel.get("is_usable"))),
+                json.dumps(channel)
+            ))
+        now = int(time.time())
+        with self.lock, self.db:
+            balances = dict(self.db.execute("SELECT uuid, balance_msat FROM open_channels").fetchall())
+            # Only changed balances are logged, so idle channels add no rows
+            snapshots = [(i[0], now, i[3]) for i in rows if i[0] not in balances or balances[i[0]] != i[3]]
+            self.db.execute("DELETE FROM open_channels")
+            self.db.executemany("INSERT INTO open_channels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.executemany("INSERT OR REPLACE INTO channel_snapshots VALUES (?, ?, ?)", snapshots)
+        changed = {i[0] for i in snapshots}
+        if changed:
+            self.notify("open", [i for i in channels if i["uuid"] in changed])
+        return len(rows)
+
+    def sync_closed_channels(self) -> int:
+        hwm = self.get_state("closed_channels_hwm") or 0
+        # Channels closed before the mark are re-read back to the oldest one still pending a claim,
+        # so a claiming_tx set after the close (e.g. a force-close sweep) is picked up
+        with self.lock:
+            pending = self.db.execute(
+                f"SELECT MIN(closed_at) FROM closed_channels WHERE {PENDING_CLAIM}", (int(time.time()) - CLAIM_WINDOW,)
+            ).fetchone()[0]
+        stop = hwm if pending is None else min(hwm, pending)
+        rows = []
+        newest = hwm
+        complete = True
+        try:
+            for channel in self.iter_channels("closed"):
+                closed_at = channel.get("closed_at") or 0
+                if closed_at < stop:
+                    break
+                newest = max(newest, closed_at)
+                rows.append((
+                    channel["uuid"],
+                    channel.get("counterparty_node_id"),
+                    channel.get("funding_tx_value_sats"),
+                    channel.get("claimed_balance"),
+                    channel.get("closure_reason"),
+                    channel.get("claiming_tx"),
+                    channel.get("created_at"),
+                    closed_at,
+                    json.dumps(channel)
+                ))
+        except RuntimeError as e:
+            logger.warning(f"Closed channel sync for {self.node.coin} cut short: {e}")
+            complete = False
+        with self.lock, self.db:
+            known = {
+                i["uuid"]: (i["claimed_balance"], i["claiming_tx"])
+                for i in self.db.execute("SELECT uuid, claimed_balance, claiming_tx FROM closed_channels WHERE closed_at >= ?", (stop,))
+            }
+            changed = [json.loads(i[8]) for i in rows if known.get(i[0]) != (i[3], i[5])]
+            self.db.executemany("INSERT OR REPLACE INTO closed_channels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if complete:
+                self.set_state("closed_channels_hwm", newest)
+        if changed:
+            self.notify("closed", changed)
+        return len(rows)
+
+    def iter_channels(self, kind: str):
+        '''Yields every open or closed channel, one page at a time. Raises RuntimeError on an error page.'''
+        method = self.node.list_open_channels if kind == "open" else self.node.list_closed_channels
+        page = 1
+        while True:
+            resp = method(page=page, limit=self.page_size, nolog=True, cache=False)
+            if "error" in resp:
+                raise RuntimeError(f"list_{kind}_channels failed: {resp['error']}")
+            channels = resp["result"][f"{kind}_channels"]
+            yield from channels
+            if not channels or page >= resp["result"].get("total_pages", page):
+                return
+            page += 1
+
+    def payment_row(self, payment: dict) -> tuple:
+        return (
+            payment["payment_hash"],
+            payment.get("payment_type", {}).get("type"),
+            payment.get("payment_type", {}).get("destination"),
+            payment.get("description"),
+            payment.get("amount_in_msat"),
+            payment.get("fee_paid_msat"),
+            payment.get("status"),
+            payment.get("created_at"),
+            payment.get("last_updated"),
+            json.dumps(payment)
+        )
+
+    def add_payment(self, payment: dict):
+        '''Stores a payment fetched outside of sync(), e.g. by get_payment_details.'''
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO payments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self.payment_row(payment))
+
+    def unclaimed_channels(self) -> list:
+        '''Returns the closed channels whose funds are still waiting to be claimed.'''
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT uuid, claimed_balance, closure_reason, closed_at FROM closed_channels WHERE {PENDING_CLAIM}",
+                (int(time.time()) - CLAIM_WINDOW,)
+            ).fetchall()
+        return [dict(i) for i in rows]
+
+    def get_payment(self, payment_hash: str) -> dict:
+        with self.lock:
+            row = self.db.execute("SELECT data FROM payments WHERE payment_hash = ?", (payment_hash,)).fetchone()
+        return None if row is None else json.loads(row["data"])
+
+    def payment_filters(self, status: str=None, payment_type: str=None, since: int=None, until: int=None,
+                        min_amount: int=None, max_amount: int=None, description_prefix: str=None,
+                        destination_prefix: str=None) -> tuple:
+        clauses = []
+        args = []
+        for clause, value in [
+            ("status = ?", status),
+            ("payment_type = ?", payment_type),
+            ("created_at >= ?", since),
+            ("created_at < ?", until),
+            ("amount_in_msat >= ?", min_amount),
+            ("amount_in_msat <= ?", max_amount)
+        ]:
+            if value is not None:
+                clauses.append(clause)
+                args.append(value)
+        for column, prefix in [("description", description_prefix), ("destination", destination_prefix)]:
+            if prefix:
+                # A range instead of LIKE, so an index on the column can be used
+                clauses.append(f"{column} >= ? AND {column} < ?")
+                args.extend([prefix, f"{prefix}\U0010ffff"])
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), args
+
+    def channel_filters(self, kind: str, peer_prefix: str=None, min_capacity: int=None, usable: bool=None,
+                        closure_reason_prefix: str=None) -> tuple:
+        clauses = []
+        args = []
+        if min_capacity is not None:
+            clauses.append("capacity_sats >= ?")
+            args.append(min_capacity)
+        if usable is not None and kind == "open":
+            clauses.append("is_usable = ?")
+            args.append(int(usable))
+        for column, prefix in [("counterparty_node_id", peer_prefix), ("closure_reason", closure_reason_prefix if kind == "closed" else None)]:
+            if prefix:
+                clauses.append(f"{column} >= ? AND {column} < ?")
+                args.extend([prefix, f"{prefix}\U0010ffff"])
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), args
+
+    def query_payments(self, order_by: str="created_at", descending: bool=True, limit: int=100, offset: int=0, **filters) -> list:
+        '''
+        Returns payments matching filters (status, payment_type, since, until,
+        min_amount, max_amount, description_prefix, destination_prefix),
+        sorted by a payment column.
+        '''
+        if order_by not in PAYMENT_COLUMNS:
+            raise ValueError(f"Can not sort payments by {order_by}")
+        where, args = self.payment_filters(**filters)
+        order = "DESC" if descending else "ASC"
+        # NULLS LAST (SQLite 3.30+) keeps rows without a value at the end either way and still uses the index
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT data FROM payments {where} ORDER BY {order_by} {order} NULLS LAST LIMIT ? OFFSET ?",
+                args + [limit, offset]
+            ).fetchall()
+        return [json.loads(i["data"]) for i in rows]
+
+    def count_payments(self, **filters) -> int:
+        where, args = self.payment_filters(**filters)
+        with self.lock:
+            return self.db.execute(f"SELECT COUNT(*) FROM payments {where}", args).fetchone()[0]
+
+    def query_channels(self, kind: str="open", order_by: str=None, descending: bool=True, limit: int=100, offset: int=0,
+                       **filters) -> list:
+        '''
+        Returns open or closed channels matching filters (peer_prefix,
+        min_capacity, usable, closure_reason_prefix), sorted by a channel column.
+        '''
+        columns = OPEN_CHANNEL_COLUMNS if kind == "open" else CLOSED_CHANNEL_COLUMNS
+        order_by = order_by or columns[0]
+        if order_by not in columns:
+            raise ValueError(f"Can not sort {kind} channels by {order_by}")
+        where, args = self.channel_filters(kind, **filters)
+        order = "DESC" if descending else "ASC"
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT data FROM {kind}_channels {where} ORDER BY {order_by} {order} NULLS LAST LIMIT ? OFFSET ?",
+                args + [limit, offset]
+            ).fetchall()
+        return [json.loads(i["data"]) for i in rows]
+
+    def count_channels(self, kind: str="open", **filters) -> int:
+        where, args = self.channel_filters(kind, **filters)
+        with self.lock:
+            return self.db.execute(f"SELECT COUNT(*) FROM {kind}_channels {where}", args).fetchone()[0]
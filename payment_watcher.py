@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import time
+import heapq
+import itertools
+import threading
+from dex_lightning import logger
+
+FINAL_STATUSES = ["succeeded", "failed"]
+
+
+class PaymentWatcher():
+    '''
+    Watches any number of payment hashes from a single thread. Hashes are
+    kept in a priority queue ordered by their next poll time; due hashes are
+    looked up together in batch requests, and each is polled again after an
+    interval that grows with its age (recent payments are polled often, old
+    ones rarely). On every status change the payment's callbacks are called
+    with (payment_hash, old_status, new_status, details), and an event dict
+    is put on `events` if a queue is given. Final payments stop being
+    watched, as do payments older than max_age.
+    '''
+    def __init__(self, node, min_interval: float=0.5, max_interval: float=60, age_factor: float=0.1,
+                 max_age: float=86400, batch_size: int=100, events=None):
+        self.node = node
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.age_factor = age_factor
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.events = events
+        self.heap = []
+        self.watched = {}
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.thread = None
+
+    def watch(self, payment_hash: str, callback=None, status: str=None):
+        '''Starts watching payment_hash; status is its last known status, if any.'''
+        with self.cond:
+            entry = self.watched.get(payment_hash)
+            if entry is None:
+                entry = {"added": time.monotonic(), "status": status, "callbacks": []}
+                self.watched.update({payment_hash: entry})
+                self.schedule(payment_hash, entry, self.min_interval)
+            if callback is not None:
+                entry["callbacks"].append(callback)
+            if self.thread is None:
+                self.stopped = False
+                self.thread = threading.Thread(target=self.run, name="PaymentWatcher", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def schedule(self, payment_hash: str, entry: dict, interval: float):
+        '''
+        Queues the next poll of a watched hash. Call with the lock held. Only
+        the queue entry with the hash's latest sequence number is polled, so
+        entries left by unwatch() or an earlier schedule are skipped.
+        '''
+        entry["seq"] = next(self.counter)
+        heapq.heappush(self.heap, (time.monotonic() + interval, entry["seq"], payment_hash))
+
+    def unwatch(self, payment_hash: str):
+        '''Stops watching payment_hash. Its queue entry is skipped when it comes due.'''
+        with self.cond:
+            self.watched.pop(payment_hash, None)
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def pending(self) -> int:
+        with self.cond:
+            return len(self.watched)
+
+    def run(self):
+        while True:
+            with self.cond:
+                due = []
+                while not due:
+                    if self.stopped or not self.watched:
+                        self.thread = None
+                        return
+                    now = time.monotonic()
+                    while self.heap and len(due) < self.batch_size and self.heap[0][0] <= now:
+                        due_at, seq, payment_hash = heapq.heappop(self.heap)
+                        if self.watched.get(payment_hash, {}).get("seq") == seq:
+                            due.append(payment_hash)
+                    if not due:
+                        self.cond.wait(self.heap[0][0] - now if self.heap else None)
+            try:
+                responses = self.node.get_payments_details(due, nolog=True, refresh=True)
+            except Exception as e:
+                logger.warning(f"Payment watcher lookup failed: {e}")
+                responses = [{} for i in due]
+            for payment_hash, resp in zip(due, responses):
+                self.update(payment_hash, resp)
+
+    def update(self, payment_hash: str, resp: dict):
+        details = resp.get("result", {}).get("payment_details")
+        with self.cond:
+            entry = self.watched.get(payment_hash)
+            if entry is None:
+                return
+            age = time.monotonic() - entry["added"]
+            old_status = entry["status"]
+            new_status = details.get("status") if details else old_status
+            final = new_status in FINAL_STATUSES
+            if final or age > self.max_age:
+                self.watched.pop(payment_hash)
+            else:
+                interval = min(self.max_interval, max(self.min_interval, age * self.age_factor))
+                self.schedule(payment_hash, entry, interval)
+            entry["status"] = new_status
+            callbacks = list(entry["callbacks"])
+        if new_status != old_status:
+            for callback in callbacks:
+                try:
+                    callback(payment_hash, old_status, new_status, details)
+                except Exception as e:
+                    logger.warning(f"Payment watcher callback failed for {payment_hash}: {e}")
+            if self.events is not None:
+                self.events.put({
+                    "payment_hash": payment_hash,
+                    "old_status": old_status,
+                    "status": new_status,
+                    "details": details
+                })
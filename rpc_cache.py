@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import json
+import time
+import pickle
+import threading
+
+# Seconds a successful response stays fresh, per read-only method.
+DEFAULT_TTLS = {
+    "get_public_key": 3600,
+    "my_balance": 5,
+    "lightning::nodes::list_trusted_nodes": 60,
+    "lightning::channels::list_open_channels_by_filter": 10,
+    "lightning::channels::list_closed_channels_by_filter": 60,
+    "lightning::channels::get_claimable_balances": 10,
+    "lightning::payments::list_payments_by_filter": 5,
+    "lightning::payments::get_payment_details": 2
+}
+
+# Read methods whose cached responses are dropped when a write method is called.
+INVALIDATES = {
+    "electrum": ["my_balance"],
+    "enable": ["my_balance"],
+    "task::enable_lightning::init": ["my_balance"],
+    "lightning::nodes::add_trusted_node": ["lightning::nodes::list_trusted_nodes"],
+    "lightning::nodes::remove_trusted_node": ["lightning::nodes::list_trusted_nodes"],
+    "lightning::channels::open_channel": [
+        "my_balance",
+        "lightning::channels::list_open_channels_by_filter",
+        "lightning::channels::get_claimable_balances"
+    ],
+    "lightning::channels::update_channel": ["lightning::channels::list_open_channels_by_filter"],
+    "lightning::payments::generate_invoice": ["lightning::payments::list_payments_by_filter"],
+    "lightning::payments::send_payment": [
+        "my_balance",
+        "lightning::channels::list_open_channels_by_filter",
+        "lightning::channels::get_claimable_balances",
+        "lightning::payments::list_payments_by_filter",
+        "lightning::payments::get_payment_details"
+    ]
+}
+
+
+class RPCCache():
+    '''
+    TTL cache for read-only AtomicDEX API responses, keyed by method and params.
+    Error responses are never cached, and calling a write method drops the
+    cached responses of every read method it affects. Responses are stored
+    pickled and every hit returns a fresh copy, so a caller changing its
+    response can not change what later hits see.
+    '''
+    def __init__(self, ttls: dict=None):
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.entries = {}
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+
+    def key(self, params: dict) -> str:
+        return json.dumps({i: params[i] for i in params if i not in ["userpass", "id"]}, sort_keys=True)
+
+    def get(self, params: dict):
+        '''Returns the cached response for params, or None if missing or expired.'''
+        method = params.get("method")
+        if not self.ttls.get(method):
+            return None
+        key = self.key(params)
+        with self.lock:
+            entry = self.entries.get(method, {}).get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses.update({method: self.misses.get(method, 0) + 1})
+                return None
+            self.hits.update({method: self.hits.get(method, 0) + 1})
+        # Several times faster than copy.deepcopy for JSON responses
+        return pickle.loads(entry[1])
+
+    def update(self, params: dict, resp):
+        '''Caches a successful read response, or invalidates the reads affected by a write.'''
+        method = params.get("method")
+        ttl = self.ttls.get(method)
+        cacheable = ttl and isinstance(resp, (dict, list)) and "error" not in resp
+        if cacheable:
+            key, data = self.key(params), pickle.dumps(resp, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            for i in INVALIDATES.get(method, []):
+                self.entries.pop(i, None)
+            if cacheable:
+                self.entries.setdefault(method, {}).update({key: (time.monotonic() + ttl, data)})
+
+    def invalidate(self, method: str=None):
+        '''Drops cached responses for one method, or for all methods.'''
+        with self.lock:
+            if method is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(method, None)
+
+    def stats(self) -> dict:
+        '''Returns hit/miss counters and the hit ratio per method.'''
+        with self.lock:
+            methods = sorted(set(self.hits) | set(self.misses))
+            return {
+                i: {
+                    "hits": self.hits.get(i, 0),
+                    "misses": self.misses.get(i, 0),
+                    "ttl": self.ttls.get(i),
+                    "hit_ratio": self.hits.get(i, 0) / (self.hits.get(i, 0) + self.misses.get(i, 0))
+                } for i in methods
+            }
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import select
+import shutil
+import logging
+import threading
+from collections import deque
+
+try:
+    import tty
+    import termios
+except ImportError:
+    termios = None
+
+ANSI_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+
+KEYS = {
+    "\x1b[A": "up",
+    "\x1bOA": "up",
+    "\x1b[B": "down",
+    "\x1bOB": "down",
+    "\x1b[C": "right",
+    "\x1bOC": "right",
+    "\x1b[D": "left",
+    "\x1bOD": "left",
+    "\x1b[5~": "pageup",
+    "\x1b[6~": "pagedown",
+    "\x1b[H": "home",
+    "\x1b[1~": "home",
+    "\x1b[F": "end",
+    "\x1b[4~": "end",
+    "\r": "enter",
+    "\n": "enter",
+    "\x7f": "backspace",
+    "\x08": "backspace",
+    "\x1b": "escape"
+}
+ESCAPES = sorted([i for i in KEYS if i.startswith("\x1b") and len(i) > 1], key=len, reverse=True)
+
+
+def supported() -> bool:
+    '''Full-screen mode needs a POSIX terminal on both stdin and stdout.'''
+    return termios is not None and sys.stdin.isatty() and sys.stdout.isatty()
+
+
+def clip(line: str, width: int) -> str:
+    '''Cuts a line to `width` visible characters, keeping its color codes.'''
+    parts = []
+    visible = 0
+    pos = 0
+    for match in ANSI_RE.finditer(line):
+        text = line[pos:match.start()]
+        if visible + len(text) > width:
+            parts.append(text[:width - visible])
+            return "".join(parts) + "\x1b[0m"
+        parts.append(text)
+        parts.append(match.group())
+        visible += len(text)
+        pos = match.end()
+    parts.append(line[pos:pos + width - visible])
+    return "".join(parts)
+
+
+def parse_keys(data: str) -> list:
+    '''Splits raw terminal input into key names ("up", "enter", ...) and characters.'''
+    keys = []
+    i = 0
+    while i < len(data):
+        if data[i] == "\x1b":
+            seq = next((s for s in ESCAPES if data.startswith(s, i)), "\x1b")
+        else:
+            seq = data[i]
+        keys.append(KEYS.get(seq, seq))
+        i += len(seq)
+    return keys
+
+
+class OutputPane():
+    '''
+    File-like scrollback buffer. While the screen is active, stdout, stderr
+    and the console log handlers write here instead of to the terminal.
+    '''
+    def __init__(self, max_lines: int=2000):
+        self.lines = deque(maxlen=max_lines)
+        self.partial = ""
+        self.lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        with self.lock:
+            lines = (self.partial + text.replace("\t", "    ").replace("\r", "")).split("\n")
+            self.partial = lines.pop()
+            self.lines.extend(lines)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+    def tail(self, count: int, offset: int=0) -> list:
+        '''Returns `count` lines ending `offset` lines above the newest one.'''
+        with self.lock:
+            lines = list(self.lines) + ([self.partial] if self.partial else [])
+        end = max(0, len(lines) - offset)
+        return lines[max(0, end - count):end]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.lines) + bool(self.partial)
+
+
+class Screen():
+    '''
+    Full-screen ANSI renderer. draw() compares the new frame with the last
+    one and only rewrites the rows that changed, so a frame costs one write
+    of the changed rows instead of clearing and reprinting the terminal.
+    Keys are read in cbreak mode, with a timeout so the caller can keep
+    redrawing while nothing is pressed. Used as a context manager, it
+    switches to the alternate screen and sends stdout, stderr and console
+    logging to `pane`, restoring them on exit.
+    '''
+    def __init__(self, pane: OutputPane=None):
+        self.out = sys.stdout
+        self.fd = sys.stdin.fileno()
+        self.pane = pane or OutputPane()
+        self.frame = []
+        self.size = None
+        self.saved_tty = None
+        self.saved_streams = []
+
+    def __enter__(self):
+        self.saved_tty = termios.tcgetattr(self.fd)
+        tty.setcbreak(self.fd)
+        self.out.write("\x1b[?1049h\x1b[?25l\x1b[2J")
+        self.out.flush()
+        self.redirect()
+        return self
+
+    def __exit__(self, *exc):
+        self.restore()
+        self.out.write("\x1b[0m\x1b[?25h\x1b[?1049l")
+        self.out.flush()
+        termios.tcsetattr(self.fd, termios.TCSADRAIN, self.saved_tty)
+
+    def redirect(self):
+        loggers = [logging.getLogger()] + [
+            i for i in logging.Logger.manager.loggerDict.values() if isinstance(i, logging.Logger)
+        ]
+        for log in loggers:
+            # Queue handlers write through the handlers they wrap
+            for handler in [i for h in log.handlers for i in getattr(h, "handlers", [h])]:
+                if type(handler) is logging.StreamHandler and handler.stream in [sys.stdout, sys.stderr]:
+                    self.saved_streams.append((handler, handler.setStream(self.pane)))
+        self.saved_streams.append((None, (sys.stdout, sys.stderr)))
+        sys.stdout = sys.stderr = self.pane
+
+    def restore(self):
+        for handler, stream in reversed(self.saved_streams):
+            if handler is None:
+                sys.stdout, sys.stderr = stream
+            else:
+                handler.setStream(stream)
+        self.saved_streams = []
+
+    def get_size(self) -> os.terminal_size:
+        return shutil.get_terminal_size()
+
+    def draw(self, lines: list) -> int:
+        '''Renders a frame, returning the number of rows rewritten.'''
+        size = self.get_size()
+        buf = []
+        if size != self.size:
+            self.size = size
+            self.frame = []
+            buf.append("\x1b[2J")
+        lines = [clip(i, size.columns) for i in lines[:size.lines]]
+        lines += [""] * (len(self.frame) - len(lines))
+        changed = 0
+        for row, line in enumerate(lines):
+            if row < len(self.frame) and self.frame[row] == line:
+                continue
+            buf.append(f"\x1b[{row + 1};1H{line}\x1b[0m\x1b[K")
+            changed += 1
+        self.frame = lines
+        if buf:
+            self.out.write("".join(buf))
+            self.out.flush()
+        return changed
+
+    def read_keys(self, timeout: float) -> list:
+        '''Waits up to `timeout` seconds for input, returning the keys pressed.'''
+        ready = select.select([self.fd], [], [], timeout)[0]
+        if not ready:
+            return []
+        return parse_keys(os.read(self.fd, 64).decode(errors="ignore"))
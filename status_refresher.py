@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import time
+import threading
+from dex_lightning import logger
+
+
+class StatusRefresher():
+    '''
+    Calls `source` on a background thread every `interval` seconds, and
+    straight away when refresh() is called, keeping the last result as a
+    snapshot. Readers get the snapshot and its age without waiting on mm2,
+    so a slow backend shows a stale header instead of a frozen screen.
+    '''
+    def __init__(self, source, interval: float=10, initial: dict=None):
+        self.source = source
+        self.interval = interval
+        self.status = initial or {}
+        self.updated = None
+        self.error = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name="StatusRefresher", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def refresh(self):
+        '''Asks for a new snapshot without waiting for it.'''
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeup.clear()
+            try:
+                status = self.source()
+                with self.lock:
+                    self.status = status
+                    self.updated = time.monotonic()
+                    self.error = None
+            except Exception as e:
+                logger.debug(f"Status refresh failed: {e}")
+                with self.lock:
+                    self.error = str(e)
+            self.wakeup.wait(self.interval)
+
+    def snapshot(self) -> tuple:
+        '''Returns the last status and its age in seconds (None before the first refresh).'''
+        with self.lock:
+            age = None if self.updated is None else time.monotonic() - self.updated
+            return self.status, age
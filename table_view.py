@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+import time
+from collections import OrderedDict
+from dex_lightning import logger
+from lib_tui import colorize, color_input
+
+
+def short(value, length: int=12) -> str:
+    value = "" if value is None else str(value)
+    return value if len(value) <= length else f"{value[:length - 2]}.."
+
+
+def timestamp(value) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(value)) if value else "-"
+
+
+def payment_type(payment: dict) -> str:
+    return (payment.get("payment_type") or {}).get("type", "")
+
+
+def destination(payment: dict) -> str:
+    return (payment.get("payment_type") or {}).get("destination")
+
+
+def to_bool(value: str) -> bool:
+    return str(value).lower() in ["1", "true", "yes", "y"]
+
+
+def to_payment_type(value: str) -> str:
+    return {"outbound": "Outbound Payment", "inbound": "Inbound Payment"}.get(value.lower(), value)
+
+
+# name: (header, width, store column or None, value getter, display formatter)
+COLUMNS = {
+    "payments": OrderedDict([
+        ("hash", ("Payment hash", 14, None, lambda i: i.get("payment_hash"), short)),
+        ("type", ("Type", 8, "payment_type", payment_type, lambda v: v.split(" ")[0])),
+        ("amount", ("Amount msat", 14, "amount_in_msat", lambda i: i.get("amount_in_msat"), str)),
+        ("fee", ("Fee msat", 9, "fee_paid_msat", lambda i: i.get("fee_paid_msat"), str)),
+        ("status", ("Status", 10, "status", lambda i: i.get("status"), str)),
+        ("created", ("Created", 16, "created_at", lambda i: i.get("created_at"), timestamp)),
+        ("peer", ("Destination", 14, "destination", destination, short)),
+        ("description", ("Description", 24, "description", lambda i: i.get("description"), str))
+    ]),
+    "open": OrderedDict([
+        ("uuid", ("Channel uuid", 14, None, lambda i: i.get("uuid"), short)),
+        ("peer", ("Peer", 14, "counterparty_node_id", lambda i: i.get("counterparty_node_id"), short)),
+        ("capacity", ("Capacity sats", 14, "capacity_sats", lambda i: i.get("funding_tx_value_sats"), str)),
+        ("balance", ("Balance msat", 14, "balance_msat", lambda i: i.get("balance_msat"), str)),
+        ("outbound", ("Outbound msat", 14, "outbound_capacity_msat", lambda i: i.get("outbound_capacity_msat"), str)),
+        ("inbound", ("Inbound msat", 14, "inbound_capacity_msat", lambda i: i.get("inbound_capacity_msat"), str)),
+        ("usable", ("Usable", 7, "is_usable", lambda i: bool(i.get("is_usable")), str))
+    ]),
+    "closed": OrderedDict([
+        ("uuid", ("Channel uuid", 14, None, lambda i: i.get("uuid"), short)),
+        ("peer", ("Peer", 14, "counterparty_node_id", lambda i: i.get("counterparty_node_id"), short)),
+        ("capacity", ("Capacity sats", 14, "capacity_sats", lambda i: i.get("funding_tx_value_sats"), str)),
+        ("claimed", ("Claimed sats", 13, "claimed_balance", lambda i: i.get("claimed_balance"), str)),
+        ("reason", ("Closure reason", 24, "closure_reason", lambda i: i.get("closure_reason"), str)),
+        ("closed", ("Closed", 16, "closed_at", lambda i: i.get("closed_at"), timestamp))
+    ])
+}
+
+# name: (store filter, parser)
+FILTERS = {
+    "payments": {
+        "status": ("status", str),
+        "type": ("payment_type", to_payment_type),
+        "min_amount": ("min_amount", int),
+        "max_amount": ("max_amount", int),
+        "since": ("since", int),
+        "until": ("until", int),
+        "description": ("description_prefix", str),
+        "peer": ("destination_prefix", str)
+    },
+    "open": {
+        "peer": ("peer_prefix", str),
+        "min_capacity": ("min_capacity", int),
+        "usable": ("usable", to_bool)
+    },
+    "closed": {
+        "peer": ("peer_prefix", str),
+        "min_capacity": ("min_capacity", int),
+        "reason": ("closure_reason_prefix", str)
+    }
+}
+
+# Store filters which mm2's list_payments_by_filter applies server side
+MM2_PAYMENT_FILTERS = {
+    "status": lambda v: {"status": v},
+    "payment_type": lambda v: {"payment_type": {"type": v}},
+    "min_amount": lambda v: {"from_amount_msat": v},
+    "max_amount": lambda v: {"to_amount_msat": v},
+    "since": lambda v: {"from_timestamp": v},
+    "until": lambda v: {"to_timestamp": v}
+}
+
+
+class StoreSource():
+    '''Rows from a synced PaymentStore; sorting, filtering and paging are done in SQL.'''
+    def __init__(self, store, kind: str):
+        self.store = store
+        self.kind = kind
+
+    def filters(self) -> list:
+        return list(FILTERS[self.kind])
+
+    def sortable(self) -> list:
+        return [name for name, column in COLUMNS[self.kind].items() if column[2] is not None]
+
+    def count(self, filters: dict) -> int:
+        if self.kind == "payments":
+            return self.store.count_payments(**filters)
+        return self.store.count_channels(self.kind, **filters)
+
+    def fetch(self, offset: int, limit: int, sort: str, descending: bool, filters: dict) -> list:
+        column = COLUMNS[self.kind][sort][2] if sort else None
+        if self.kind == "payments":
+            return self.store.query_payments(order_by=column or "created_at", descending=descending, limit=limit, offset=offset, **filters)
+        return self.store.query_channels(self.kind, order_by=column, descending=descending, limit=limit, offset=offset, **filters)
+
+
+class RPCSource():
+    '''
+    Rows fetched from mm2 one page at a time as the view moves, keeping at
+    most max_pages pages. Only the payment status, type, amount and time
+    filters mm2 applies server side are offered; sorting and the other
+    filters need the synced PaymentStore, as applying them to a single page
+    would give short pages and a wrong row count.
+    '''
+    def __init__(self, node, kind: str, page_size: int=50, max_pages: int=4):
+        self.node = node
+        self.kind = kind
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = OrderedDict()
+        self.totals = {}
+
+    def filters(self) -> list:
+        if self.kind != "payments":
+            return []
+        return [name for name, (store_name, parse) in FILTERS[self.kind].items() if store_name in MM2_PAYMENT_FILTERS]
+
+    def sortable(self) -> list:
+        return []
+
+    def remote_filters(self, filters: dict) -> dict:
+        '''Returns the mm2 filter dict for store filters from filters().'''
+        remote = {}
+        for name, value in filters.items():
+            remote.update(MM2_PAYMENT_FILTERS[name](value))
+        return remote
+
+    def get_page(self, page: int, remote: dict) -> list:
+        key = (str(sorted(remote.items())), page)
+        if key in self.pages:
+            self.pages.move_to_end(key)
+            return self.pages[key]
+        if self.kind == "payments":
+            resp = self.node.list_payments_by_filter(filter=remote, page=page, limit=self.page_size, nolog=True)
+        elif self.kind == "open":
+            resp = self.node.list_open_channels(page=page, limit=self.page_size, nolog=True)
+        else:
+            resp = self.node.list_closed_channels(page=page, limit=self.page_size, nolog=True)
+        if "error" in resp:
+            logger.warning(f"ERROR: {resp}")
+            return []
+        result = resp["result"]
+        self.totals.update({key[0]: result.get("total", len(result[self.result_key()]))})
+        self.pages.update({key: result[self.result_key()]})
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+        return self.pages[key]
+
+    def result_key(self) -> str:
+        return "payments" if self.kind == "payments" else f"{self.kind}_channels"
+
+    def count(self, filters: dict) -> int:
+        remote = self.remote_filters(filters)
+        key = str(sorted(remote.items()))
+        if key not in self.totals:
+            self.get_page(1, remote)
+        return self.totals.get(key, 0)
+
+    def fetch(self, offset: int, limit: int, sort: str, descending: bool, filters: dict) -> list:
+        remote = self.remote_filters(filters)
+        rows = []
+        for page in range(offset // self.page_size + 1, (offset + limit - 1) // self.page_size + 2):
+            rows += self.get_page(page, remote)
+        start = offset % self.page_size
+        return rows[start:start + limit]
+
+
+class TableView():
+    '''
+    Paginated table over a StoreSource or RPCSource. Only the visible window
+    of page_size rows is fetched and rendered, so memory and render time do
+    not grow with the number of channels or payments.
+    '''
+    def __init__(self, source, page_size: int=20):
+        self.source = source
+        self.kind = source.kind
+        self.page_size = page_size
+        self.offset = 0
+        self.sort = None
+        self.descending = True
+        self.filters = {}
+
+    def set_sort(self, name: str):
+        if name not in self.sortable():
+            if isinstance(self.source, RPCSource):
+                raise ValueError("Sorting needs the local payment store, which is still syncing")
+            raise ValueError(f"Can not sort by {name}, try one of {self.sortable()}")
+        self.descending = not self.descending if name == self.sort else True
+        self.sort = name
+        self.offset = 0
+
+    def set_filter(self, name: str, value: str):
+        if name not in self.source.filters():
+            if name in FILTERS[self.kind] and isinstance(self.source, RPCSource):
+                raise ValueError(f"Filtering by {name} needs the local payment store, which is still syncing")
+            raise ValueError(f"Can not filter by {name}, try one of {self.source.filters()}")
+        store_name, parse = FILTERS[self.kind][name]
+        self.filters.update({store_name: parse(value)})
+        self.offset = 0
+
+    def clear_filters(self):
+        self.filters = {}
+        self.offset = 0
+
+    def sortable(self) -> list:
+        return self.source.sortable()
+
+    def move(self, pages: int):
+        total = self.source.count(self.filters)
+        last = max(0, (total - 1) // self.page_size * self.page_size)
+        self.offset = min(last, max(0, self.offset + pages * self.page_size))
+
+    def render(self) -> list:
+        columns = COLUMNS[self.kind]
+        rows = self.source.fetch(self.offset, self.page_size, self.sort, self.descending, self.filters)
+        total = self.source.count(self.filters)
+        lines = [colorize(" ".join([
+            f"{header + (' v' if name == self.sort and self.descending else ' ^' if name == self.sort else ''):<{width}}"[:width]
+            for name, (header, width, column, getter, fmt) in columns.items()
+        ]), "cyan")]
+        for row in rows:
+            lines.append(colorize(" ".join([
+                f"{short(fmt(getter(row)), width):<{width}}"
+                for name, (header, width, column, getter, fmt) in columns.items()
+            ]), "table"))
+        if not rows:
+            lines.append(colorize("No rows.", "darkgrey"))
+        footer = f"Rows {min(total, self.offset + 1)}-{min(total, self.offset + len(rows))} of {total}"
+        if self.sort:
+            footer += f" | sort: {self.sort} {'desc' if self.descending else 'asc'}"
+        if self.filters:
+            footer += f" | filter: {', '.join([f'{k}={v}' for k, v in self.filters.items()])}"
+        lines.append(colorize(footer, "darkgrey"))
+        return lines
+
+    def run(self):
+        '''Shows the table and handles paging, sort and filter commands until quit.'''
+        while True:
+            print("\n".join(self.render()))
+            sort = f" [s]ort <{'|'.join(self.sortable())}>" if self.sortable() else ""
+            filters = f" [f]ilter <{'|'.join(self.source.filters())}> <value>" if self.source.filters() else ""
+            command = color_input(f" [n]ext [p]rev{sort}{filters} [c]lear [q]uit: ").strip().split(" ", 2)
+            try:
+                if command[0] in ["", "q"]:
+                    return
+                elif command[0] == "n":
+                    self.move(1)
+                elif command[0] == "p":
+                    self.move(-1)
+                elif command[0] == "s" and len(command) > 1:
+                    self.set_sort(command[1])
+                elif command[0] == "f" and len(command) > 2:
+                    self.set_filter(command[1], command[2])
+                elif command[0] == "c":
+                    self.clear_filters()
+                else:
+                    logger.warning(f"Unknown command: {' '.join(command)}")
+            except ValueError as e:
+                logger.warning(str(e))
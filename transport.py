@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import json
+import time
+import logging
+import threading
+from metrics import RPCMetrics
+
+# Per-request method, duration and size records, off unless enabled with logger.json_log()
+rpc_logger = logging.getLogger("dex_lightning.rpc")
+rpc_logger.propagate = False
+if rpc_logger.level == logging.NOTSET:
+    rpc_logger.setLevel(logging.WARNING)
+
+
+def rpc_method(params) -> str:
+    '''Names a request for rpc_logger: its method, or batch[n] for a list.'''
+    if isinstance(params, list):
+        return f"batch[{len(params)}]"
+    return params.get("method")
+
+
+class DexTransport():
+    '''
+    Persistent, pooled keep-alive HTTP transport for the AtomicDEX API.
+    A single transport can be shared by every LightningNode pointing at
+    the same dex_url, so all RPCs reuse the same TCP connections.
+    '''
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, dex_url="http://127.0.0.1:7783", pool_size=10, connect_timeout=3.05, read_timeout=60, retries=0,
+                 metrics: RPCMetrics=None):
+        self.dex_url = dex_url
+        self.metrics = metrics or RPCMetrics.shared()
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.encoder = json.JSONEncoder(separators=(",", ":"))
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        '''The pooled requests session, created (and requests imported) on first use.'''
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=self.retries)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    session.headers.update({"Content-Type": "application/json"})
+                    self._session = session
+        return self._session
+
+    @classmethod
+    def shared(cls, dex_url="http://127.0.0.1:7783", **kwargs):
+        '''Returns the transport shared by all users of dex_url, creating it if needed.'''
+        with cls._shared_lock:
+            transport = cls._shared.get(dex_url)
+            if transport is None:
+                transport = cls(dex_url, **kwargs)
+                cls._shared.update({dex_url: transport})
+            return transport
+
+    def post(self, params):
+        '''Sends a single request dict (or a list of them) and returns the decoded response.'''
+        body = self.encoder.encode(params)
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.dex_url, data=body, timeout=self.timeout)
+            resp = response.json()
+        except Exception as e:
+            self.metrics.observe(rpc_method(params), time.perf_counter() - started, len(body), 0, type(e).__name__)
+            raise
+        duration = time.perf_counter() - started
+        self.metrics.record(params, resp, duration, len(body), len(response.content))
+        if rpc_logger.isEnabledFor(logging.DEBUG):
+            rpc_logger.debug("rpc", extra={
+                "method": rpc_method(params),
+                "duration_ms": round(duration * 1000, 3),
+                "request_bytes": len(body),
+                "response_bytes": len(response.content),
+                "status": response.status_code
+            })
+        return resp
+
+    def close(self):
+        with self._shared_lock:
+            if self._shared.get(self.dex_url) is self:
+                self._shared.pop(self.dex_url)
+        if self._session is not None:
+            self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
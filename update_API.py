@@ -3,6 +3,7 @@ import os
 import re
 import sys
 import json
+import hashlib
 import shutil
 import zipfile
 import requests
@@ -10,9 +11,10 @@ import argparse
 import subprocess
 from pathlib import Path
 from datetime import datetime
-from bs4 import BeautifulSoup
 import logging
 from logger import CustomFormatter
+from build_index import BuildIndex, COMMIT_RE, file_name
+from build_cache import BuildCache
 
 # create logger with 'lightning_app'
 logger = logging.getLogger("update_API")
@@ -23,78 +25,146 @@ handler = logging.StreamHandler()
 handler.setFormatter(CustomFormatter())
 logger.addHandler(handler)
 
+
+class IncompleteDownload(IOError):
+    '''The server closed the response before sending Content-Length bytes.'''
+
+
 class UpdateAPI():
     '''Updates the API module version for all or a specified platform.'''
-    def __init__(self, version="", platform="linux", api_branch="dev", coins_branch="test-lightning"):
+    def __init__(self, version="", platform="linux", api_branch="dev", coins_branch="test-lightning",
+                 base_url="http://54.170.62.22:8000/", retries=5):
         self.version = version
-        self.base_url = "http://54.170.62.22:8000/"
+        self.base_url = base_url
         self.api_branch = api_branch
         self.coins_branch = coins_branch
         self.platform = platform
+        if int(retries) < 1:
+            raise ValueError(f"retries must be at least 1, got {retries}")
+        self.retries = int(retries)
         # Get the absolute path of the project root directory
         self.project_root = os.path.dirname(os.path.abspath(__file__))
         self.temp_folder = f"{self.project_root}/temp"
         if not os.path.exists(self.temp_folder):
             os.makedirs(self.temp_folder)
+        self.index = BuildIndex(self.base_url)
+        self.cache = BuildCache()
 
     def get_zip_file_url(self, platform, branch):
-        '''Returns the URL of the zip file for the requested version / branch / platform.'''
-        response = requests.get(f"{self.base_url}/{self.api_branch}")
-        response.raise_for_status()
-
-        # Configure the HTML parser
-        soup = BeautifulSoup(response.text, "html.parser")        
-        keywords = [self.platform]
-        extensions = [".zip"]  # Assuming that the extensions are the same for all platforms
-
-        # Parse the HTML and search for the zip file
-        for link in soup.find_all("a"):
-            file_name = link.get("href")
-            if all(keyword in file_name for keyword in keywords) \
-                    and any(file_name.endswith(ext) for ext in extensions) \
-                    and self.version in file_name:
-                return f"{self.base_url}/{self.api_branch}/{file_name}"
-        return None
+        '''Returns the URL of the zip file for the requested version / platform, looking in `branch` first.'''
+        return self.index.lookup(self.version, platform, branch)
 
     def download_api_file(self):
         '''Downloads the API version zip file for a specific platform.'''
-        # Get the URL of the zip file in the main directory
+        # Get the URL of the zip file from the build index, searching every branch if needed
         logger.info(f"Downloading API {self.platform} module [{self.version}] from {self.api_branch} branch")
         zip_file_url = self.get_zip_file_url(self.platform, self.api_branch)
 
-        # If the zip file is not found in the main directory, search in all directories
-        if not zip_file_url:
-            response = requests.get(self.base_url)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, "html.parser")
-
-            for link in soup.find_all("a"):
-                branch = link.get("href")
-                zip_file_url = self.get_zip_file_url(self.platform, branch)
-
-                if zip_file_url:
-                    logger.info(f"'{self.platform}': Found zip file in '{branch}' folder.")
-                    break
-
         if not zip_file_url:
             raise ValueError(f"Could not find zip file for version '{self.version}' on '{self.platform}' platform in branch {self.api_branch}!")
+        if not zip_file_url.startswith(self.index.branch_url(self.api_branch)):
+            logger.info(f"'{self.platform}': Found zip file in '{zip_file_url.rsplit('/', 2)[-2]}' folder.")
 
-        # Download the zip file
+        # Download the zip file, resuming from the .part file left by an interrupted run
         logger.info(f"Downloading '{self.version}' API module for [{self.platform}]...")
-        response = requests.get(zip_file_url, stream=True)
+        zip_file_path = os.path.join(self.temp_folder, os.path.basename(zip_file_url))
+        part_file_path = f"{zip_file_path}.part"
+        for attempt in range(self.retries):
+            try:
+                sha256 = self.download(zip_file_url, part_file_path)
+                break
+            except requests.HTTPError:
+                # 404, 403 etc. will not go away by asking again
+                raise
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    IncompleteDownload) as e:
+                if attempt == self.retries - 1:
+                    raise
+                logger.warning(f"Download interrupted ({e}), resuming...")
+
+        expected = self.get_checksum(zip_file_url)
+        if expected is not None and expected != sha256:
+            os.remove(part_file_path)
+            raise ValueError(f"Checksum mismatch for {zip_file_url}: expected {expected}, got {sha256}")
+        os.replace(part_file_path, zip_file_path)
+        logger.info(f"Saved to '{zip_file_path}' (sha256 {sha256}{', verified' if expected else ''})")
+        return zip_file_path, zip_file_url, sha256
+
+    def download(self, url, path):
+        '''
+        Streams url to path, hashing as it goes. If path already holds the
+        start of the file, only the rest is requested with a Range header
+        (If-Range makes the server send the whole file if it has changed).
+        Without a recorded ETag the part file can not be matched to the
+        file on the server, so the download starts over.
+        Returns the sha256 of the complete file.
+        '''
+        digest = hashlib.sha256()
+        headers = {"Accept-Encoding": "identity"}
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        etag_file = f"{path}.etag"
+        if offset and not os.path.exists(etag_file):
+            logger.info(f"No ETag recorded for '{path}', downloading it again")
+            offset = 0
+        if offset:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            with open(etag_file, "r") as f:
+                headers.update({"Range": f"bytes={offset}-", "If-Range": f.read()})
+        response = self.index.session.get(url, headers=headers, stream=True, timeout=self.index.timeout)
+        if response.status_code == 416:
+            # The part file is not a prefix of the file on the server: start over
+            os.remove(path)
+            return self.download(url, path)
+        response.raise_for_status()
+        if response.status_code != 206:
+            digest = hashlib.sha256()
+            offset = 0
+        if response.headers.get("ETag"):
+            with open(etag_file, "w") as f:
+                f.write(response.headers["ETag"])
+        elif os.path.exists(etag_file):
+            os.remove(etag_file)
+        size = offset + int(response.headers["Content-Length"]) if "Content-Length" in response.headers else None
+        with open(path, "ab" if offset else "wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+                digest.update(chunk)
+        if size is not None and os.path.getsize(path) != size:
+            raise IncompleteDownload(f"Got {os.path.getsize(path)} of {size} bytes")
+        if os.path.exists(etag_file):
+            os.remove(etag_file)
+        return digest.hexdigest()
+
+    def get_checksum(self, url):
+        '''Returns the sha256 published next to a zip file on the build server, if any.'''
+        listing = self.index.listings.get(url.rsplit("/", 1)[0] + "/", {})
+        if f"{url}.sha256" not in listing.get("links", []):
+            return None
+        response = self.index.session.get(f"{url}.sha256", timeout=self.index.timeout)
         response.raise_for_status()
+        return response.text.split()[0].lower()
 
-        zip_file_name = os.path.basename(zip_file_url)
-        zip_file_path = os.path.join(self.temp_folder, zip_file_name)
+    def get_binary_name(self):
+        return "mm2" if self.platform in ["linux", "mac"] else "mm2.exe"
 
-        # Save the zip file to the specified folder
-        with open(zip_file_path, "wb") as file:
-            response.raw.decode_content = True
-            shutil.copyfileobj(response.raw, file)
+    def extract_binary(self, zip_file_path):
+        '''Streams only the mm2 / mm2.exe member into the build cache folder, returning its path and sha256.'''
+        binary_name = self.get_binary_name()
+        digest = hashlib.sha256()
+        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+            members = [i for i in zip_ref.infolist() if os.path.basename(i.filename) == binary_name]
+            if not members:
+                raise ValueError(f"No {binary_name} in {zip_file_path}")
+            binary_path = f"{self.cache.objects}/.{os.path.basename(zip_file_path)}.tmp"
+            # Reading the member to the end also checks its CRC
+            with zip_ref.open(members[0]) as source, open(binary_path, "wb") as target:
+                for chunk in iter(lambda: source.read(1 << 20), b""):
+                    target.write(chunk)
+                    digest.update(chunk)
+        return binary_path, digest.hexdigest()
 
-        logger.info(f"Saved to '{zip_file_path}'")
-        return zip_file_path
-    
     def copy_file(self, source, target):
         try:
             shutil.copy(source, target)
@@ -120,28 +190,39 @@ class UpdateAPI():
             json.dump(coins, f, indent=4)
 
     def update_api(self):
-        '''Updates the API module.'''
-        # Download the API file for the platform
-        zip_file_path = self.download_api_file()
-
-        # Unzip the downloaded file
-        logger.info(f"Extracting...")
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            zip_ref.extractall(self.temp_folder)
-
-        # Delete the zip file after extraction
-        os.remove(zip_file_path)
-
-        # Copy the API module file to the folders they need to be in
-        if self.platform in ["linux", "mac"]:
-            self.copy_file(f"{self.temp_folder}/mm2", f"{self.project_root}/mm2")
-            logger.info(f"Making mm2 executable...")
-            os.chmod(f"{self.project_root}/mm2", 0o755);
+        '''Updates the API module, from the build cache if this version was installed before.'''
+        entry = self.cache.get(self.version, self.platform)
+        if entry is not None:
+            logger.info(f"Using cached {self.platform} build of {entry['commit']}")
         else:
-            self.copy_file(f"{self.temp_folder}/mm2.exe", f"{self.project_root}/mm2.exe")
-
-        # Delete the temp folder
-        shutil.rmtree(self.temp_folder)
+            # Download the API file for the platform
+            zip_file_path, zip_file_url, zip_sha256 = self.download_api_file()
+
+            logger.info(f"Extracting {self.get_binary_name()}...")
+            try:
+                binary_path, sha256 = self.extract_binary(zip_file_path)
+            except zipfile.BadZipFile:
+                # Corrupt archive: drop it so the next run downloads it again
+                os.remove(zip_file_path)
+                raise
+            version = self.version.lower()
+            commit = next((
+                i for i in COMMIT_RE.findall(file_name(zip_file_url).lower())
+                if i.startswith(version) or version.startswith(i)
+            ), version)
+            entry = self.cache.add(commit, self.platform, binary_path, sha256, zip_url=zip_file_url, zip_sha256=zip_sha256)
+
+            # Delete the zip file after extraction
+            os.remove(zip_file_path)
+
+        # Swap the API module file in place
+        target = f"{self.project_root}/{self.get_binary_name()}"
+        self.cache.install(entry, target)
+        logger.info(f"Installed {entry['commit']} [{self.platform}] to {target} (sha256 {entry['sha256']})")
+
+        # Delete the temp folder unless an interrupted download is waiting to resume
+        if not os.listdir(self.temp_folder):
+            os.rmdir(self.temp_folder)
 
 
 if __name__ == "__main__":
@@ -151,6 +232,9 @@ if __name__ == "__main__":
     parser.add_argument("-b", "--branch", help="branch of the API module to download.", default="dev")
     parser.add_argument("-c", "--coins", help="branch of the coins file to download.", default="test-lightning")
     parser.add_argument("-p", "--platform", help="branch of the API module to download.", default="linux")
+    parser.add_argument("--base-url", help="build server url.", default="http://54.170.62.22:8000/")
+    parser.add_argument("-k", "--keep", help="number of builds to keep in the local build cache.", type=int, default=10)
+    parser.add_argument("-r", "--retries", help="download attempts, resuming after each interruption.", type=int, default=5)
     args = parser.parse_args()
 
     try:
@@ -158,9 +242,12 @@ if __name__ == "__main__":
             version=args.api,
             platform=args.platform,
             api_branch=args.branch,
-            coins_branch=args.coins
+            coins_branch=args.coins,
+            base_url=args.base_url,
+            retries=args.retries
         )
         updateAPI.update_api()
+        updateAPI.cache.prune(args.keep)
         updateAPI.update_coins()
 
     except Exception as e: